@@ -0,0 +1,292 @@
+"""Crash-safe autosave: an append-only journal of edits plus periodic snapshots.
+
+The editor hands each edit to Autosave as a small operation dict built
+from copies of the changed fields, which is all the UI thread does (a
+whole new document is copied as one tuple of field values per object); a
+background writer thread serializes and appends the operations to
+journal.jsonl and fsyncs them in groups. The writer also keeps its own plain-dict copy of
+the document, so compacting the journal into snapshot.json (written to a
+temporary file, fsynced, then renamed over the old one) never has to
+look at the live document.
+
+Every operation carries a sequence number and the snapshot records the
+last one it includes, so a crash at any point leaves a snapshot plus a
+journal whose later entries replay on top of it. Both also carry the id
+of the session that wrote them: sequence numbers start again each time
+the editor does, and a crash after a new session's first snapshot but
+before it empties the journal must not replay the old session's entries
+onto it. A torn last line from a crash mid-write is ignored.
+"""
+import json
+import operator
+import os
+import queue
+import threading
+import time
+from typing import Dict, Optional
+
+from flowchart.model import FlowchartDocument
+
+AUTOSAVE_SYNC_SECONDS = 1.0       # Longest an edit waits before it is written and fsynced
+AUTOSAVE_COMPACT_OPS = 10000      # Journal entries that trigger a compaction
+AUTOSAVE_COMPACT_SECONDS = 120    # Compact at least this often while edits keep coming
+SNAPSHOT_NAME = 'snapshot.json'
+JOURNAL_NAME = 'journal.jsonl'
+
+def default_autosave_dir() -> str:
+    return os.path.join(os.path.expanduser('~'), '.flowchart-maker', 'autosave')
+
+# What a reset copies off each live object, and the record keys the values go under
+_SHAPE_FIELDS = ('id', 'shape_type', 'x', 'y', 'width', 'height', 'text', 'z')
+_SHAPE_KEYS = _SHAPE_FIELDS
+_ARROW_FIELDS = ('id', 'arrow_type', 'start_x', 'start_y', 'end_x', 'end_y',
+                 'source_id', 'source_port', 'target_id', 'target_port', 'z')
+_ARROW_KEYS = ('id', 'arrow_type', 'start_x', 'start_y', 'end_x', 'end_y',
+               'source', 'source_port', 'target', 'target_port', 'z')
+_shape_values = operator.attrgetter(*_SHAPE_FIELDS)
+_arrow_values = operator.attrgetter(*_ARROW_FIELDS)
+
+def _record(item) -> Dict:
+    data = item.to_dict()
+    data['z'] = item.z
+    return data
+
+class _Shadow:
+    """Plain-dict copy of the document, rebuilt from the operations alone."""
+    def __init__(self):
+        self.shapes: Dict[int, Dict] = {}
+        self.arrows: Dict[int, Dict] = {}
+        
+    def apply(self, op: Dict):
+        kind = op['op']
+        if kind == 'reset':
+            self.shapes = {data['id']: data for data in op['shapes']}
+            self.arrows = {data['id']: data for data in op['arrows']}
+        elif kind == 'add_shape':
+            self.shapes[op['shape']['id']] = op['shape']
+        elif kind == 'remove_shape':
+            self.shapes.pop(op['id'], None)
+        elif kind == 'move_shapes':
+            for shape_id, x, y in op['moves']:
+                shape = self.shapes.get(shape_id)
+                if shape is not None:
+                    shape['x'], shape['y'] = x, y
+        elif kind == 'text':
+            shape = self.shapes.get(op['id'])
+            if shape is not None:
+                shape['text'] = op['text']
+        elif kind == 'add_arrow':
+            self.arrows[op['arrow']['id']] = op['arrow']
+        elif kind == 'remove_arrow':
+            self.arrows.pop(op['id'], None)
+        else:
+            raise ValueError(f"Unknown journal operation {kind!r}")
+            
+    def to_dict(self) -> Dict:
+        # Listing in z order is enough for the stacking to survive a reload
+        return {
+            'shapes': sorted(self.shapes.values(), key=lambda data: data['z']),
+            'arrows': sorted(self.arrows.values(), key=lambda data: data['z']),
+        }
+
+def read_autosave(directory: str) -> Optional[Dict]:
+    """Snapshot plus replayed journal as document data, or None if nothing was autosaved."""
+    snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+    journal_path = os.path.join(directory, JOURNAL_NAME)
+    if not os.path.exists(snapshot_path) and not os.path.exists(journal_path):
+        return None
+    shadow = _Shadow()
+    seq = 0
+    session = None
+    if os.path.exists(snapshot_path):
+        with open(snapshot_path, encoding='utf-8') as f:
+            snapshot = json.load(f)
+        shadow.apply({'op': 'reset', 'shapes': snapshot['shapes'], 'arrows': snapshot['arrows']})
+        seq = snapshot['seq']
+        session = snapshot.get('session')
+    if os.path.exists(journal_path):
+        with open(journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except ValueError:
+                    break  # Torn write at the moment of the crash; nothing after it made it either
+                if op.get('session') == session and op['seq'] > seq:
+                    shadow.apply(op)
+                    seq = op['seq']
+    return shadow.to_dict()
+
+def recover_document(directory: str) -> Optional[FlowchartDocument]:
+    """The autosaved document with attached connector ends put back on their shapes."""
+    data = read_autosave(directory)
+    if data is None:
+        return None
+    document = FlowchartDocument.from_dict(data)
+    # The journal only records shape moves; attached ends follow as they did live
+    for arrow in document.arrows():
+        document.route_arrow(arrow)
+    return document
+
+class Autosave:
+    """Journals a live document's edits to a directory from a writer thread.
+    
+    The edit hooks only build an operation dict and put it on an unbounded
+    queue, so they never wait for the disk.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_NAME)
+        self.journal_path = os.path.join(directory, JOURNAL_NAME)
+        self.queue: queue.SimpleQueue = queue.SimpleQueue()
+        self.thread: Optional[threading.Thread] = None
+        self.error: Optional[str] = None  # Last write failure, for the UI to report
+        self.compactions = 0
+        self.session: Optional[str] = None  # Tags this run's snapshot and journal entries
+        
+    def __bool__(self):
+        return self.thread is not None
+        
+    def recover(self) -> Optional[FlowchartDocument]:
+        return recover_document(self.directory)
+        
+    def start(self, document: FlowchartDocument):
+        """Begin journaling, replacing anything autosaved before with this document."""
+        if self.thread is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.session = os.urandom(8).hex()
+        self.reset(document)
+        self.thread = threading.Thread(target=self._run, name="flowchart-autosave", daemon=True)
+        self.thread.start()
+        
+    def close(self, discard: bool = False):
+        """Write out what is queued and stop; discard removes the files, as after a clean exit."""
+        if self.thread is None:
+            return
+        self.queue.put(None)
+        self.thread.join()
+        self.thread = None
+        if discard:
+            for path in (self.journal_path, self.snapshot_path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                    
+    # Edit hooks, called on the UI thread
+    
+    def reset(self, document: FlowchartDocument):
+        """Journal a whole new document, as after loading a file or undoing one.
+        
+        Only a tuple of each object's field values is taken here, which is
+        far cheaper than building its record; the writer turns the tuples
+        into records and never touches the live objects.
+        """
+        self.queue.put({'op': 'reset',
+                        'shapes': list(map(_shape_values, document.shapes())),
+                        'arrows': list(map(_arrow_values, document.arrows()))})
+                        
+    def add_shape(self, shape):
+        self.queue.put({'op': 'add_shape', 'shape': _record(shape)})
+        
+    def remove_shape(self, shape):
+        self.queue.put({'op': 'remove_shape', 'id': shape.id})
+        
+    def move_shapes(self, shapes):
+        self.queue.put({'op': 'move_shapes', 'moves': [[shape.id, shape.x, shape.y] for shape in shapes]})
+        
+    def set_text(self, shape):
+        self.queue.put({'op': 'text', 'id': shape.id, 'text': shape.text})
+        
+    def add_arrow(self, arrow):
+        self.queue.put({'op': 'add_arrow', 'arrow': _record(arrow)})
+        
+    def remove_arrow(self, arrow):
+        self.queue.put({'op': 'remove_arrow', 'id': arrow.id})
+        
+    # Writer thread
+    
+    def _run(self):
+        shadow = _Shadow()
+        seq = 0
+        snapshot_seq = 0
+        last_compaction = time.monotonic()
+        # Set by a reset until a snapshot holding it is on disk; the journal
+        # is not appended to meanwhile, as it would replay onto the old snapshot
+        needs_snapshot = False
+        journal = open(self.journal_path, 'a', encoding='utf-8')
+        try:
+            running = True
+            while running:
+                try:
+                    batch = [self.queue.get(timeout=AUTOSAVE_SYNC_SECONDS)]
+                except queue.Empty:
+                    batch = []
+                # Group everything already waiting into one write and one fsync
+                while True:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                        
+                lines = []
+                for op in batch:
+                    if op is None:
+                        running = False
+                        continue
+                    seq += 1
+                    op['seq'] = seq
+                    op['session'] = self.session
+                    # A reset carries the whole document, recorded here rather than on
+                    # the UI thread; it goes straight into a snapshot
+                    if op['op'] == 'reset':
+                        op['shapes'] = [dict(zip(_SHAPE_KEYS, values)) for values in op['shapes']]
+                        op['arrows'] = [dict(zip(_ARROW_KEYS, values)) for values in op['arrows']]
+                        needs_snapshot = True
+                    else:
+                        lines.append(json.dumps(op, separators=(',', ':')))
+                    shadow.apply(op)
+                        
+                try:
+                    if lines and not needs_snapshot:
+                        journal.write('\n'.join(lines) + '\n')
+                        journal.flush()
+                        os.fsync(journal.fileno())
+                    pending = seq - snapshot_seq
+                    if needs_snapshot or pending >= AUTOSAVE_COMPACT_OPS or (
+                            pending and time.monotonic() - last_compaction >= AUTOSAVE_COMPACT_SECONDS):
+                        journal.close()
+                        self._write_snapshot(shadow, seq)
+                        # Entries up to seq are in the snapshot now; a crash before this
+                        # truncation leaves them, or a previous session's, to be skipped on replay
+                        journal = open(self.journal_path, 'w', encoding='utf-8')
+                        snapshot_seq = seq
+                        needs_snapshot = False
+                        last_compaction = time.monotonic()
+                        self.compactions += 1
+                    self.error = None
+                except OSError as e:
+                    self.error = str(e)
+                    if journal.closed:
+                        journal = open(self.journal_path, 'a', encoding='utf-8')
+        finally:
+            journal.close()
+            
+    def _write_snapshot(self, shadow: _Shadow, seq: int):
+        data = shadow.to_dict()
+        data['seq'] = seq
+        data['session'] = self.session
+        temporary = self.snapshot_path + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.snapshot_path)
+        # Make the rename itself durable where directories can be fsynced
+        if hasattr(os, 'O_DIRECTORY'):
+            directory = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+                
\ No newline at end of file
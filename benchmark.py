@@ -0,0 +1,637 @@
+"""Benchmarks for the editor's hot paths on synthetic diagrams.
+
+Runs headless against a recording stub canvas by default, or against a
+real Tk canvas with --tk (e.g. under xvfb-run), and writes JSON that can
+be compared with an earlier run to catch regressions:
+
+    python benchmark.py --shapes 5000 --arrows 5000 -o before.json
+    python benchmark.py --shapes 5000 --arrows 5000 --compare before.json
+"""
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List
+
+from flowchart.analysis import GraphChecker, shortest_path
+from export import document_bounds
+from fl import FlowchartMaker, MoveShapeCommand
+from flowchart.geometry import ARROW_TYPES, PORTS, SHAPE_TYPES, nearest_port, numpy_module, port_position
+from flowchart.importers import import_file
+from flowchart.model import FlowchartArrow, FlowchartDocument, FlowchartShape
+from flowchart.raster import render_png
+from flowchart.routing import connector_end, document_router
+
+GRID_SPACING = (160, 110)  # Distance between neighbouring shapes in the synthetic grid
+REGRESSION_THRESHOLD = 1.25  # Median slowdown that counts as a regression
+DOT_NAMES = {'rectangle': 'box', 'oval': 'ellipse', 'diamond': 'diamond', 'hexagon': 'hexagon',
+             'parallelogram': 'parallelogram', 'triangle': 'triangle', 'star': 'star'}
+MERMAID_BRACKETS = {'oval': ('([', '])'), 'diamond': ('{', '}'), 'hexagon': ('{{', '}}'), 'parallelogram': ('[/', '/]')}
+STARTUP_MODULES = {'import_core': 'flowchart', 'import_fileformat': 'flowchart.fileformat', 'import_export': 'export',
+                   'import_editor': 'fl'}
+
+def synthetic_document(shapes: int, arrows: int, seed: int = 0) -> FlowchartDocument:
+    """A reproducible diagram laid out on a grid, cycling through every shape and connector type.
+    
+    Connectors join nearby shapes, as in hand-drawn flowcharts, and are
+    attached at the ports facing each other.
+    """
+    rng = random.Random(seed)
+    document = FlowchartDocument()
+    columns = max(1, math.ceil(math.sqrt(shapes)))
+    placed = []
+    for i in range(shapes):
+        shape_type = SHAPE_TYPES[i % len(SHAPE_TYPES)]
+        width, height = (80, 80) if shape_type in ('oval', 'star') else (100, 50)
+        x = (i % columns) * GRID_SPACING[0] + rng.randint(-10, 10)
+        y = (i // columns) * GRID_SPACING[1] + rng.randint(-10, 10)
+        shape = FlowchartShape(shape_type, x, y, width, height, f"Step {i}" if i % 3 else "")
+        document.add_shape(shape)
+        placed.append(shape)
+        
+    neighbours = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1))
+    for i in range(arrows if placed else 0):
+        index = rng.randrange(len(placed))
+        column, row = index % columns, index // columns
+        nearby = [(row + dy) * columns + column + dx for dx, dy in neighbours
+                  if 0 <= column + dx < columns and 0 <= (row + dy) * columns + column + dx < len(placed)]
+        source, target = placed[index], placed[rng.choice(nearby) if nearby else index]
+        arrow = FlowchartArrow(ARROW_TYPES[i % len(ARROW_TYPES)], 0, 0, 0, 0)
+        for end, shape, other in (('source', source, target), ('target', target, source)):
+            port = nearest_port(shape.shape_type, shape.x, shape.y, shape.width, shape.height,
+                                other.x + other.width / 2, other.y + other.height / 2)
+            document.attach(arrow, end, shape, port)
+        document.add_arrow(arrow)
+        document.route_arrow(arrow)
+    return document
+
+class StubVar:
+    def __init__(self):
+        self.value = ""
+        
+    def set(self, value):
+        self.value = value
+        
+    def get(self):
+        return self.value
+
+class StubRoot:
+    """Stands in for tk.Tk: remembers scheduled callbacks and runs them on demand."""
+    def __init__(self):
+        self.pending: Dict[int, tuple] = {}
+        self.next_job = 1
+        
+    def title(self, *args):
+        pass
+        
+    def geometry(self, *args):
+        pass
+        
+    def bind(self, *args, **kwargs):
+        pass
+        
+    def after(self, ms, func=None, *args):
+        # Delays are ignored: callbacks run at the next update()
+        job = self.next_job
+        self.next_job += 1
+        self.pending[job] = (func, args)
+        return job
+        
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+        
+    def after_cancel(self, job):
+        self.pending.pop(job, None)
+        
+    def update(self):
+        """Run the callbacks that were due when called, like one pass of the event loop."""
+        jobs, self.pending = self.pending, {}
+        for func, args in jobs.values():
+            if func is not None:
+                func(*args)
+
+class RecordingCanvas:
+    """Just enough of tk.Canvas for the editor, counting every call made to it.
+    
+    Items only keep their coordinates and options; stacking operations are
+    recorded but not modelled.
+    """
+    def __init__(self, root: StubRoot, width: int = 1200, height: int = 800):
+        self.root = root
+        self.width, self.height = width, height
+        self.items: Dict[int, list] = {}
+        self.next_item = 1
+        self.calls: Counter = Counter()
+        self.options: Dict = {}
+        
+    def _create(self, kind, coords, options):
+        self.calls['create_' + kind] += 1
+        item = self.next_item
+        self.next_item += 1
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        self.items[item] = [list(coords), options]
+        return item
+        
+    def create_line(self, *coords, **options):
+        return self._create('line', coords, options)
+        
+    def create_oval(self, *coords, **options):
+        return self._create('oval', coords, options)
+        
+    def create_polygon(self, *coords, **options):
+        return self._create('polygon', coords, options)
+        
+    def create_rectangle(self, *coords, **options):
+        return self._create('rectangle', coords, options)
+        
+    def create_text(self, *coords, **options):
+        return self._create('text', coords, options)
+        
+    def coords(self, item, *coords):
+        self.calls['coords'] += 1
+        if not coords:
+            return list(self.items[item][0]) if item in self.items else []
+        if len(coords) == 1 and isinstance(coords[0], (list, tuple)):
+            coords = coords[0]
+        if item in self.items:
+            self.items[item][0] = list(coords)
+            
+    def _tagged(self, tag_or_id) -> List[int]:
+        if tag_or_id in self.items:
+            return [tag_or_id]
+        return [item for item, (coords, options) in self.items.items() if tag_or_id in options.get('tags', ())]
+        
+    def move(self, tag_or_id, dx, dy):
+        self.calls['move'] += 1
+        for item in self._tagged(tag_or_id):
+            points = self.items[item][0]
+            for i in range(0, len(points), 2):
+                points[i] += dx
+                points[i + 1] += dy
+                
+    def addtag_withtag(self, tag, item):
+        self.calls['addtag_withtag'] += 1
+        if item in self.items:
+            options = self.items[item][1]
+            options['tags'] = tuple(options.get('tags', ())) + (tag,)
+            
+    def dtag(self, item, tag):
+        self.calls['dtag'] += 1
+        if item in self.items:
+            options = self.items[item][1]
+            options['tags'] = tuple(t for t in options.get('tags', ()) if t != tag)
+                
+    def delete(self, *items):
+        self.calls['delete'] += 1
+        for item in items:
+            if item == "all":
+                self.items.clear()
+            else:
+                self.items.pop(item, None)
+                
+    def itemconfig(self, tag_or_id, **options):
+        self.calls['itemconfig'] += 1
+        for item in self._tagged(tag_or_id):
+            self.items[item][1].update(options)
+            
+    def scale(self, tag_or_id, x, y, x_factor, y_factor):
+        self.calls['scale'] += 1
+        items = self.items if tag_or_id == 'all' else self._tagged(tag_or_id)
+        for item in items:
+            points = self.items[item][0]
+            for i in range(0, len(points), 2):
+                points[i] = x + (points[i] - x) * x_factor
+                points[i + 1] = y + (points[i + 1] - y) * y_factor
+            
+    def tag_lower(self, item, below=None):
+        self.calls['tag_lower'] += 1
+        
+    def tag_raise(self, item, above=None):
+        self.calls['tag_raise'] += 1
+        
+    def configure(self, **options):
+        self.calls['configure'] += 1
+        self.options.update(options)
+        
+    def canvasx(self, x):
+        return x
+        
+    def canvasy(self, y):
+        return y
+        
+    def winfo_width(self):
+        return self.width
+        
+    def winfo_height(self):
+        return self.height
+        
+    def xview(self, *args):
+        return (0.0, 1.0)
+        
+    def yview(self, *args):
+        return (0.0, 1.0)
+        
+    def xview_moveto(self, fraction):
+        pass
+        
+    def yview_moveto(self, fraction):
+        pass
+        
+    def bind(self, *args, **kwargs):
+        pass
+        
+    def pack(self, *args, **kwargs):
+        pass
+        
+    def after(self, ms, func=None, *args):
+        return self.root.after(ms, func, *args)
+        
+    def after_idle(self, func, *args):
+        return self.root.after_idle(func, *args)
+        
+    def after_cancel(self, job):
+        self.root.after_cancel(job)
+
+class HeadlessFlowchartMaker(FlowchartMaker):
+    """The editor minus its widgets, drawing onto a RecordingCanvas."""
+    def setup_ui(self):
+        self.canvas = RecordingCanvas(self.root)
+        self.status_var = StubVar()
+        self.perf_var = StubVar()
+        self.canvas.configure(scrollregion=self.scrollregion)
+        self.arrow_layer = self.canvas.create_line(0, 0, 0, 0, state='hidden')
+
+class PointerEvent:
+    def __init__(self, x, y, state=0):
+        self.x, self.y = x, y
+        self.state = state
+
+class Bench:
+    """Collects timings (and, on the stub canvas, canvas calls) per benchmark name."""
+    def __init__(self, app: FlowchartMaker, pump: Callable[[], None]):
+        self.app = app
+        self.pump = pump
+        self.runs: Dict[str, List[float]] = {}
+        self.canvas_calls: Dict[str, int] = {}
+        
+    @contextmanager
+    def timed(self, name: str):
+        calls = getattr(self.app.canvas, 'calls', None)
+        before = sum(calls.values()) if calls is not None else 0
+        start = time.perf_counter()
+        yield
+        self.runs.setdefault(name, []).append(time.perf_counter() - start)
+        if calls is not None:
+            self.canvas_calls[name] = sum(calls.values()) - before
+            
+    def record(self, name: str, seconds: float):
+        """Add a timing measured elsewhere, e.g. in another process."""
+        self.runs.setdefault(name, []).append(seconds)
+        
+    def pump_until(self, done: Callable[[], bool]):
+        while not done():
+            self.pump()
+            time.sleep(0.001)
+            
+    def results(self) -> Dict[str, dict]:
+        results = {}
+        for name, runs in self.runs.items():
+            results[name] = {'best': min(runs), 'median': statistics.median(runs), 'runs': runs}
+            if name in self.canvas_calls:
+                results[name]['canvas_calls'] = self.canvas_calls[name]
+        return results
+
+def bench_redraw(bench: Bench, rng: random.Random, args):
+    with bench.timed('redraw_canvas'):
+        bench.app.redraw_canvas()
+
+def bench_hit_test(bench: Bench, rng: random.Random, args):
+    shapes = bench.app.document.shapes()
+    right = max(shape.x + shape.width for shape in shapes)
+    bottom = max(shape.y + shape.height for shape in shapes)
+    points = [(rng.uniform(0, right), rng.uniform(0, bottom)) for _ in range(args.points)]
+    with bench.timed('get_shape_at_position'):
+        for x, y in points:
+            bench.app.get_shape_at_position(x, y)
+    with bench.timed('arrow_at_position'):
+        for x, y in points:
+            bench.app.arrow_at_position(x, y)
+
+def bench_history(bench: Bench, rng: random.Random, args):
+    app = bench.app
+    shapes = app.document.shapes()
+    moved = [shapes[rng.randrange(len(shapes))] for _ in range(args.edits)]
+    with bench.timed('save_state'):
+        for shape in moved:
+            command = MoveShapeCommand(shape, shape.x, shape.y, shape.x + 7, shape.y + 5)
+            command.apply(app)
+            app.save_state(command)
+    with bench.timed('undo'):
+        for _ in moved:
+            app.undo()
+    with bench.timed('redo'):
+        for _ in moved:
+            app.redo()
+    for _ in moved:
+        app.undo()
+
+def bench_drag(bench: Bench, rng: random.Random, args):
+    app = bench.app
+    app.set_mode('select')
+    shape = next(shape for shape in app.document.shapes() if shape.canvas_id is not None)
+    x, y = shape.x + shape.width / 2, shape.y + shape.height / 2
+    with bench.timed('drag'):
+        app.on_canvas_press(PointerEvent(x, y))
+        for step in range(1, args.motions + 1):
+            app.on_canvas_drag(PointerEvent(x + step % 200, y + step % 120))
+            bench.pump()
+        app.on_canvas_release(PointerEvent(x + args.motions % 200, y + args.motions % 120))
+    app.undo()
+
+def bench_group_drag(bench: Bench, rng: random.Random, args):
+    app = bench.app
+    app.set_mode('select')
+    x1, y1, x2, y2 = app.visible_area()
+    # Rubber-band everything in the top-left quarter of the view, then drag it
+    with bench.timed('select_area'):
+        app.on_canvas_press(PointerEvent(x1, y1))
+        app.on_canvas_drag(PointerEvent((x1 + x2) / 2, (y1 + y2) / 2))
+        bench.pump()
+        app.on_canvas_release(PointerEvent((x1 + x2) / 2, (y1 + y2) / 2))
+    shape = app.selected_shape
+    if shape is None:
+        return
+    x, y = shape.x + shape.width / 2, shape.y + shape.height / 2
+    with bench.timed('group_drag'):
+        app.on_canvas_press(PointerEvent(x, y))
+        for step in range(1, args.motions + 1):
+            app.on_canvas_drag(PointerEvent(x + step % 200, y + step % 120))
+            bench.pump()
+        app.on_canvas_release(PointerEvent(x + args.motions % 200, y + args.motions % 120))
+    app.undo()
+    app.deselect_all()
+
+def bench_zoom(bench: Bench, rng: random.Random, args):
+    app = bench.app
+    # Out to the whole diagram, where the level-of-detail rules matter most, and back
+    with bench.timed('zoom_fit'):
+        app.zoom_to_fit()
+        bench.pump()
+    with bench.timed('zoom_reset'):
+        app.set_zoom(1.0)
+        bench.pump()
+
+def bench_analysis(bench: Bench, rng: random.Random, args):
+    app = bench.app
+    document = app.document
+    shapes = document.shapes()
+    checker = GraphChecker()
+    with bench.timed('check_flow'):
+        checker.check(document)
+    # One new connector, as drawing one does, then the re-check it triggers
+    source, target = rng.choice(shapes), rng.choice(shapes)
+    arrow = FlowchartArrow('straight', source.x, source.y, target.x, target.y)
+    arrow.source_id, arrow.target_id = source.id, target.id
+    with bench.timed('check_after_edit'):
+        app.add_arrow(arrow)
+        checker.check(document)
+    app.remove_arrow(arrow)
+    pairs = [(rng.choice(shapes).id, rng.choice(shapes).id) for _ in range(100)]
+    with bench.timed('shortest_path'):
+        for source_id, target_id in pairs:
+            shortest_path(document, source_id, target_id)
+
+def bench_find(bench: Bench, rng: random.Random, args):
+    app = bench.app
+    with bench.timed('index_labels'):
+        app.text_index.rebuild((shape, shape.text) for shape in app.document.shapes())
+    # A short, broad prefix and progressively narrower queries, as typed
+    queries = ['s', 'st', 'step', 'step 1', 'step 12', 'step 123']
+    with bench.timed('find'):
+        for query in queries:
+            app.find(query)
+
+def import_time(module: str) -> float:
+    """Seconds a fresh interpreter spends importing a module from this directory."""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    # Measure with compiled bytecode cached, as an installed copy would have it
+    env = {key: value for key, value in os.environ.items() if key != 'PYTHONDONTWRITEBYTECODE'}
+    output = subprocess.run([sys.executable, '-c', code], cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+                            check=True, capture_output=True, text=True).stdout
+    return float(output)
+
+def bench_startup(bench: Bench, rng: random.Random, args):
+    # Each import runs in a new process, so nothing is already loaded
+    for name, module in STARTUP_MODULES.items():
+        import_time(module)  # Writes the bytecode cache on the first run
+        bench.record(name, import_time(module))
+
+def bench_files(bench: Bench, rng: random.Random, args):
+    app = bench.app
+    with tempfile.TemporaryDirectory() as folder:
+        for extension, label in (('json', 'json'), ('fcb', 'binary')):
+            filename = os.path.join(folder, 'bench.' + extension)
+            with bench.timed('save_' + label):
+                app.save_to(filename)
+            with bench.timed('load_' + label):
+                app.start_load(filename)
+                bench.pump_until(lambda: app.loader is None)
+            # Keep the history from holding on to every loaded copy
+            app.history.clear()
+
+def write_dot(document: FlowchartDocument, filename: str):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('digraph bench {\n')
+        for shape in document.shapes():
+            f.write(f'  s{shape.id} [shape={DOT_NAMES.get(shape.shape_type, "box")}, label="{shape.text}"];\n')
+        for arrow in document.arrows():
+            if arrow.source_id is not None and arrow.target_id is not None:
+                f.write(f'  s{arrow.source_id} -> s{arrow.target_id};\n')
+        f.write('}\n')
+
+def write_mermaid(document: FlowchartDocument, filename: str):
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('flowchart TD\n')
+        for shape in document.shapes():
+            opener, closer = MERMAID_BRACKETS.get(shape.shape_type, ('[', ']'))
+            f.write(f'    s{shape.id}{opener}"{shape.text}"{closer}\n')
+        for arrow in document.arrows():
+            if arrow.source_id is not None and arrow.target_id is not None:
+                f.write(f'    s{arrow.source_id} --> s{arrow.target_id}\n')
+
+def bench_import(bench: Bench, rng: random.Random, args):
+    document = bench.app.document
+    with tempfile.TemporaryDirectory() as folder:
+        for extension, write in (('dot', write_dot), ('mmd', write_mermaid)):
+            filename = os.path.join(folder, 'bench.' + extension)
+            write(document, filename)
+            with bench.timed('import_' + extension):
+                import_file(filename)
+
+def bench_route(bench: Bench, rng: random.Random, args):
+    document = bench.app.document
+    ends = []
+    for arrow in document.arrows():
+        source, target = document.shape(arrow.source_id), document.shape(arrow.target_id)
+        if source is not None and target is not None and source is not target:
+            ends.append((source, target))
+    # Every connector from a cold cache, first by the ports facing each
+    # other, then by random ones, which mostly need a detour or a search
+    for name, any_port in (('route_facing', False), ('route_any_port', True)):
+        requests = []
+        for source, target in ends:
+            request = []
+            for shape, other in ((source, target), (target, source)):
+                if any_port:
+                    port = rng.choice(PORTS)
+                else:
+                    port = nearest_port(shape.shape_type, shape.x, shape.y, shape.width, shape.height,
+                                        other.x + other.width / 2, other.y + other.height / 2)
+                x, y = port_position(shape.shape_type, shape.x, shape.y, shape.width, shape.height, port)
+                request.append(connector_end(document, shape.id, port, x, y))
+            requests.append(request)
+        with bench.timed(name):
+            router = document_router(document)
+            for key, (start, end) in enumerate(requests):
+                router.route(key, start, end)
+
+def bench_raster(bench: Bench, rng: random.Random, args):
+    document = bench.app.document
+    with tempfile.TemporaryDirectory() as folder:
+        with bench.timed('raster_png'):
+            render_png(document, os.path.join(folder, 'bench.png'), document_bounds(document))
+
+BENCHMARKS = {
+    'redraw': bench_redraw,
+    'hit_test': bench_hit_test,
+    'history': bench_history,
+    'drag': bench_drag,
+    'group_drag': bench_group_drag,
+    'zoom': bench_zoom,
+    'analysis': bench_analysis,
+    'find': bench_find,
+    'startup': bench_startup,
+    'files': bench_files,
+    'import': bench_import,
+    'raster': bench_raster,
+    'route': bench_route,
+}
+
+def make_app(use_tk: bool):
+    """The editor plus a function running its pending event-loop work."""
+    if use_tk:
+        import tkinter as tk
+        root = tk.Tk()
+        app = FlowchartMaker(root, frame_budget_ms=0)
+        root.update()
+        return app, root.update
+    root = StubRoot()
+    # No frame budget: every motion event gets handled, so runs are comparable
+    app = HeadlessFlowchartMaker(root, frame_budget_ms=0)
+    return app, root.update
+
+def run(args) -> dict:
+    app, pump = make_app(args.tk)
+    app.replace_document(synthetic_document(args.shapes, args.arrows, args.seed))
+    pump()
+    if args.instrument:
+        # Timers only: the stub root ignores delays, so the overlay would refresh on every pump
+        app.instrumentation.enable()
+        app.bind_canvas_events()
+    bench = Bench(app, pump)
+    selected = args.only.split(',') if args.only else list(BENCHMARKS)
+    for name in selected:
+        if name not in BENCHMARKS:
+            raise SystemExit(f"unknown benchmark {name!r}; choose from {', '.join(BENCHMARKS)}")
+    for _ in range(args.repeat):
+        rng = random.Random(args.seed)
+        for name in selected:
+            BENCHMARKS[name](bench, rng, args)
+    results = {
+        'meta': {
+            'shapes': args.shapes,
+            'arrows': args.arrows,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'points': args.points,
+            'edits': args.edits,
+            'motions': args.motions,
+            'canvas': 'tk' if args.tk else 'stub',
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': numpy_module() is not None,
+            'instrumented': args.instrument,
+        },
+        'results': bench.results(),
+    }
+    if args.instrument:
+        results['instrumentation'] = app.instrumentation.snapshot()
+    return results
+
+def compare(baseline: dict, current: dict, threshold: float = REGRESSION_THRESHOLD) -> List[str]:
+    """Print a side-by-side table; return the benchmarks whose median got slower than threshold."""
+    keys = ('shapes', 'arrows', 'seed', 'points', 'edits', 'motions', 'canvas', 'instrumented')
+    if any(baseline['meta'].get(key) != current['meta'].get(key) for key in keys):
+        print("warning: runs used different settings; timings may not be comparable", file=sys.stderr)
+    regressions = []
+    print(f"{'benchmark':<24}{'before':>12}{'after':>12}{'ratio':>8}")
+    for name, result in current['results'].items():
+        old = baseline['results'].get(name)
+        if old is None:
+            print(f"{name:<24}{'-':>12}{result['median'] * 1000:>10.2f}ms{'new':>8}")
+            continue
+        ratio = result['median'] / old['median'] if old['median'] else float('inf')
+        flag = ''
+        if ratio > threshold:
+            regressions.append(name)
+            flag = '  slower'
+        print(f"{name:<24}{old['median'] * 1000:>10.2f}ms{result['median'] * 1000:>10.2f}ms{ratio:>8.2f}{flag}")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Time the editor's hot paths on a synthetic diagram.")
+    parser.add_argument('--shapes', type=int, default=2000, help="shapes in the synthetic diagram (default: 2000)")
+    parser.add_argument('--arrows', type=int, default=2000, help="connectors in the synthetic diagram (default: 2000)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the diagram and the workload (default: 0)")
+    parser.add_argument('--repeat', type=int, default=5, help="times each benchmark runs (default: 5)")
+    parser.add_argument('--points', type=int, default=10000, help="hit tests per run (default: 10000)")
+    parser.add_argument('--edits', type=int, default=1000, help="edits recorded, undone and redone per run (default: 1000)")
+    parser.add_argument('--motions', type=int, default=500, help="motion events in the simulated drag (default: 500)")
+    parser.add_argument('--only', help=f"comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--tk', action='store_true', help="use a real Tk canvas (needs a display, e.g. xvfb-run)")
+    parser.add_argument('--instrument', action='store_true',
+                        help="run with the editor's instrumentation on and include its stats")
+    parser.add_argument('-o', '--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', metavar='BASELINE', help="compare against an earlier JSON result")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help=f"median slowdown ratio counted as a regression (default: {REGRESSION_THRESHOLD})")
+    args = parser.parse_args(argv)
+    
+    results = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        if regressions:
+            print(f"regressed: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    elif not args.output:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+    
\ No newline at end of file
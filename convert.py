@@ -0,0 +1,97 @@
+"""Batch conversion of Graphviz DOT and Mermaid flowcharts to this tool's formats.
+
+Each file is parsed as a stream, laid out automatically and saved as JSON
+or binary .fcb:
+
+    python convert.py pipeline.dot -o pipeline.json
+    python convert.py -f fcb -j 8 --max-memory 512 -o converted/ diagrams/
+"""
+import argparse
+import os
+import sys
+from typing import List, Optional, Tuple
+
+from export import collect_jobs
+from flowchart.fileformat import save_document
+from flowchart.importers import IMPORT_EXTENSIONS, import_file
+
+FORMATS = ('json', 'fcb')
+FILES_PER_WORKER = 100  # Workers are replaced after this many files, handing their memory back
+
+def convert_file(source: str, target: str, fmt: str) -> Tuple[str, Optional[str]]:
+    """Convert one file; returns (source, error message or None)."""
+    try:
+        document, skipped = import_file(source)
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        save_document(document, target)
+        return source, (f"skipped {skipped} unreadable statements" if skipped else None)
+    except MemoryError:
+        return source, "failed: over the memory limit"
+    except Exception as e:
+        return source, f"failed: {e}"
+
+def _convert_job(job: Tuple[str, str, str]) -> Tuple[str, Optional[str]]:
+    return convert_file(*job)
+
+def _limit_memory(megabytes: Optional[int]):
+    """Worker initializer: cap the address space at megabytes beyond what the worker already uses."""
+    if not megabytes:
+        return
+    try:
+        import resource
+    except ImportError:  # Windows has no resource limits
+        return
+    baseline = 0
+    try:
+        with open('/proc/self/statm') as f:
+            baseline = int(f.read().split()[0]) * resource.getpagesize()
+    except (OSError, ValueError):
+        pass
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = baseline + (megabytes << 20)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+def convert_many(jobs: List[Tuple[str, str, str]], workers: int = 1, max_memory: Optional[int] = None):
+    """Yield (source, problem) for every job, in order, spreading them over worker processes.
+    
+    With max_memory (in MB), each file is converted in a worker process whose
+    memory is capped, so a huge or hostile file fails on its own instead of
+    exhausting the machine.
+    """
+    if (workers == 1 and not max_memory) or not jobs:
+        for job in jobs:
+            yield _convert_job(job)
+        return
+    from concurrent.futures import ProcessPoolExecutor  # Slow to import, and only needed here
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(jobs)),
+                             initializer=_limit_memory, initargs=(max_memory,),
+                             max_tasks_per_child=FILES_PER_WORKER) as pool:
+        yield from pool.map(_convert_job, jobs)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Convert Graphviz DOT and Mermaid flowcharts to .json or .fcb files.")
+    parser.add_argument('inputs', nargs='+', help="DOT (.dot, .gv) or Mermaid (.mmd, .mermaid) files, or directories of them")
+    parser.add_argument('-o', '--output', help="output file for a single input, otherwise an output directory")
+    parser.add_argument('-f', '--format', choices=FORMATS, help="output format (default: from the output file name, else json)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes; 0 uses every CPU (default: 1)")
+    parser.add_argument('--max-memory', type=int, metavar='MB', help="memory cap for converting any one file")
+    args = parser.parse_args(argv)
+    
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.output or '')[1].lower().lstrip('.')
+        fmt = extension if extension in FORMATS else 'json'
+        
+    failures = 0
+    jobs = collect_jobs(args.inputs, args.output, fmt, IMPORT_EXTENSIONS)
+    for source, problem in convert_many(jobs, args.jobs, args.max_memory):
+        if problem:
+            print(f"{source}: {problem}", file=sys.stderr)
+            failures += problem.startswith('failed')
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
+    
\ No newline at end of file
@@ -0,0 +1,283 @@
+"""Headless export of flowcharts to SVG, PostScript and PNG.
+
+Renders the same outlines, connectors and arrowheads the editor draws,
+without Tk or a display:
+
+    python export.py diagram.json -o diagram.svg
+    python export.py -f ps -j 8 -o out/ flowcharts/
+    python export.py --scale 4 -j 8 huge.fcb -o huge.png
+"""
+import argparse
+import functools
+import math
+import os
+import sys
+from typing import Iterable, List, Optional, Tuple
+
+from flowchart.fileformat import read_document
+from flowchart.geometry import arrow_style, connector_geometry, shape_kind, shape_points_batch, spline_segments
+from flowchart.model import FlowchartDocument
+from flowchart.raster import render_png
+from flowchart.routing import document_router, route_orthogonal
+
+SHAPE_FILL = 'white'
+SHAPE_OUTLINE = 'black'
+SHAPE_OUTLINE_WIDTH = 2
+ARROW_COLOR = 'black'
+ARROW_WIDTH = 2
+LABEL_FONT_SIZE = 10
+EXPORT_MARGIN = 20
+FORMATS = ('svg', 'ps', 'png')
+INPUT_EXTENSIONS = ('.json', '.fcb')
+
+def _num(value: float) -> str:
+    text = f"{value:.2f}".rstrip('0').rstrip('.')
+    return '0' if text == '-0' else text
+
+def _escape(text: str) -> str:
+    # What xml.sax.saxutils.escape does, without the tens of milliseconds its import takes
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def document_bounds(document: FlowchartDocument, margin: float = EXPORT_MARGIN) -> Tuple[float, float, float, float]:
+    bounds = [shape.bounds() for shape in document.shapes()] + [arrow.bounds() for arrow in document.arrows()]
+    if not bounds:
+        return (0, 0, 2 * margin, 2 * margin)
+    return (min(b[0] for b in bounds) - margin, min(b[1] for b in bounds) - margin,
+            max(b[2] for b in bounds) + margin, max(b[3] for b in bounds) + margin)
+
+class SvgRenderer:
+    def __init__(self, bounds: Tuple[float, float, float, float]):
+        x1, y1, x2, y2 = bounds
+        width, height = x2 - x1, y2 - y1
+        self.parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>',
+            f'<svg xmlns="http://www.w3.org/2000/svg" width="{_num(width)}" height="{_num(height)}" '
+            f'viewBox="{_num(x1)} {_num(y1)} {_num(width)} {_num(height)}">',
+            f'<rect x="{_num(x1)}" y="{_num(y1)}" width="{_num(width)}" height="{_num(height)}" fill="white"/>',
+        ]
+
+    def shape(self, kind: str, points: List[float]):
+        style = f'fill="{SHAPE_FILL}" stroke="{SHAPE_OUTLINE}" stroke-width="{SHAPE_OUTLINE_WIDTH}"'
+        if kind == 'oval':
+            x1, y1, x2, y2 = points
+            self.parts.append(f'<ellipse cx="{_num((x1 + x2) / 2)}" cy="{_num((y1 + y2) / 2)}" '
+                              f'rx="{_num((x2 - x1) / 2)}" ry="{_num((y2 - y1) / 2)}" {style}/>')
+        elif kind == 'polygon':
+            self.parts.append(f'<polygon points="{" ".join(_num(v) for v in points)}" {style} stroke-linejoin="round"/>')
+        else:
+            x1, y1, x2, y2 = points
+            self.parts.append(f'<rect x="{_num(x1)}" y="{_num(y1)}" width="{_num(x2 - x1)}" '
+                              f'height="{_num(y2 - y1)}" {style}/>')
+
+    def label(self, x: float, y: float, text: str):
+        self.parts.append(f'<text x="{_num(x)}" y="{_num(y)}" font-family="Arial, Helvetica, sans-serif" '
+                          f'font-size="{LABEL_FONT_SIZE}pt" text-anchor="middle" dominant-baseline="central" '
+                          f'xml:space="preserve">{_escape(text)}</text>')
+
+    def connector(self, points: List[float], heads: List[List[float]], style: dict, width: float):
+        segments = spline_segments(points) if style['smooth'] else []
+        if segments:
+            path = [f'M {_num(segments[0][0])} {_num(segments[0][1])}']
+            path.extend(f'Q {_num(cx)} {_num(cy)} {_num(ex)} {_num(ey)}' for _, _, cx, cy, ex, ey in segments)
+        else:
+            path = [f'M {_num(points[0])} {_num(points[1])}']
+            path.extend(f'L {_num(points[i])} {_num(points[i + 1])}' for i in range(2, len(points), 2))
+        dash = f' stroke-dasharray="{",".join(str(d) for d in style["dash"])}"' if style['dash'] else ''
+        self.parts.append(f'<path d="{" ".join(path)}" fill="none" stroke="{ARROW_COLOR}" '
+                          f'stroke-width="{_num(width)}" stroke-linejoin="round"{dash}/>')
+        for head in heads:
+            self.parts.append(f'<polygon points="{" ".join(_num(v) for v in head)}" fill="{ARROW_COLOR}"/>')
+
+    def result(self) -> str:
+        return '\n'.join(self.parts + ['</svg>', ''])
+
+def _ps_string(text: str) -> str:
+    out = []
+    for char in text.encode('latin-1', 'replace').decode('latin-1'):
+        code = ord(char)
+        if char in '\\()':
+            out.append('\\' + char)
+        elif 32 <= code < 127:
+            out.append(char)
+        else:
+            out.append(f'\\{code:03o}')
+    return '(' + ''.join(out) + ')'
+
+class PostScriptRenderer:
+    def __init__(self, bounds: Tuple[float, float, float, float]):
+        x1, y1, x2, y2 = bounds
+        width, height = x2 - x1, y2 - y1
+        self.parts = [
+            '%!PS-Adobe-3.0 EPSF-3.0',
+            f'%%BoundingBox: 0 0 {math.ceil(width)} {math.ceil(height)}',
+            '%%Creator: Flowchart Maker',
+            '%%EndComments',
+            '/shapepaint { gsave 1 setgray fill grestore 0 setgray '
+            f'{SHAPE_OUTLINE_WIDTH} setlinewidth stroke }} bind def',
+            '/ellipse { matrix currentmatrix 5 1 roll 4 2 roll translate scale '
+            '0 0 1 0 360 arc closepath setmatrix } bind def',
+            '/label { gsave 3 1 roll translate 1 -1 scale dup stringwidth pop 2 div neg '
+            f'{_num(-LABEL_FONT_SIZE * 0.35)} moveto show grestore }} bind def',
+            f'/Helvetica findfont {LABEL_FONT_SIZE} scalefont setfont',
+            '1 setlinejoin 0 setlinecap',
+            # Flip to the canvas' y-down coordinates
+            f'0 {_num(height)} translate 1 -1 scale {_num(-x1)} {_num(-y1)} translate',
+        ]
+
+    def _path(self, points: List[float], close: bool) -> str:
+        ops = [f'newpath {_num(points[0])} {_num(points[1])} moveto']
+        ops.extend(f'{_num(points[i])} {_num(points[i + 1])} lineto' for i in range(2, len(points), 2))
+        if close:
+            ops.append('closepath')
+        return ' '.join(ops)
+
+    def shape(self, kind: str, points: List[float]):
+        if kind == 'oval':
+            x1, y1, x2, y2 = points
+            rx, ry = (x2 - x1) / 2, (y2 - y1) / 2
+            if rx > 0 and ry > 0:
+                self.parts.append(f'newpath {_num(x1 + rx)} {_num(y1 + ry)} {_num(rx)} {_num(ry)} ellipse shapepaint')
+                return
+            kind = 'rectangle'
+        if kind == 'rectangle':
+            x1, y1, x2, y2 = points
+            points = [x1, y1, x2, y1, x2, y2, x1, y2]
+        self.parts.append(self._path(points, close=True) + ' shapepaint')
+
+    def label(self, x: float, y: float, text: str):
+        self.parts.append(f'{_num(x)} {_num(y)} {_ps_string(text)} label')
+
+    def connector(self, points: List[float], heads: List[List[float]], style: dict, width: float):
+        segments = spline_segments(points) if style['smooth'] else []
+        if segments:
+            ops = [f'newpath {_num(segments[0][0])} {_num(segments[0][1])} moveto']
+            for sx, sy, cx, cy, ex, ey in segments:
+                # Raise each quadratic segment to the cubic PostScript expects
+                ops.append(' '.join(_num(v) for v in (sx + 2 / 3 * (cx - sx), sy + 2 / 3 * (cy - sy),
+                                                       ex + 2 / 3 * (cx - ex), ey + 2 / 3 * (cy - ey), ex, ey))
+                           + ' curveto')
+            path = ' '.join(ops)
+        else:
+            path = self._path(points, close=False)
+        dash = f'[{" ".join(str(d) for d in style["dash"])}] 0 setdash' if style['dash'] else '[] 0 setdash'
+        self.parts.append(f'0 setgray {_num(width)} setlinewidth {dash} {path} stroke')
+        for head in heads:
+            self.parts.append(self._path(head, close=True) + ' fill')
+
+    def result(self) -> str:
+        return '\n'.join(self.parts + ['showpage', '%%EOF', ''])
+
+RENDERERS = {'svg': SvgRenderer, 'ps': PostScriptRenderer}
+
+def route_connectors(document: FlowchartDocument):
+    """Route the orthogonal connectors around the shapes, as the editor does before drawing them."""
+    orthogonal = [arrow for arrow in document.arrows() if arrow.arrow_type == 'orthogonal']
+    if orthogonal:
+        router = document_router(document)
+        for arrow in orthogonal:
+            route_orthogonal(router, document, arrow)
+
+def render(document: FlowchartDocument, fmt: str = 'svg') -> str:
+    """Render a document to SVG or PostScript text, bottom to top like the canvas."""
+    route_connectors(document)
+    renderer = RENDERERS[fmt](document_bounds(document))
+    shapes = document.shapes()
+    outlines = shape_points_batch([s.shape_type for s in shapes], [s.x for s in shapes], [s.y for s in shapes],
+                                  [s.width for s in shapes], [s.height for s in shapes])
+    for shape, points in zip(shapes, outlines):
+        renderer.shape(shape_kind(shape.shape_type), points)
+        if shape.text:
+            renderer.label(shape.x + shape.width / 2, shape.y + shape.height / 2, shape.text)
+    for arrow in document.arrows():
+        style = arrow_style(arrow.arrow_type)
+        for points, heads in connector_geometry(arrow.arrow_type, arrow.start_x, arrow.start_y,
+                                                arrow.end_x, arrow.end_y, ARROW_WIDTH, arrow.waypoints):
+            renderer.connector(points, heads, style, ARROW_WIDTH * style['width_scale'])
+    return renderer.result()
+
+def export_file(source: str, target: str, fmt: str, scale: float = 1.0, workers: int = 1) -> Tuple[str, Optional[str]]:
+    """Render one file; returns (source, error message or None).
+    
+    scale (pixels per canvas unit) and workers (processes rendering the
+    image's tiles) only apply to PNG.
+    """
+    try:
+        document, skipped = read_document(source)
+        os.makedirs(os.path.dirname(os.path.abspath(target)), exist_ok=True)
+        if fmt == 'png':
+            route_connectors(document)
+            render_png(document, target, document_bounds(document), scale, workers)
+        else:
+            output = render(document, fmt)
+            with open(target, 'w', encoding='utf-8') as f:
+                f.write(output)
+        return source, (f"skipped {skipped} invalid entries" if skipped else None)
+    except Exception as e:
+        return source, f"failed: {e}"
+
+def _export_job(job: Tuple[str, str, str], scale: float = 1.0) -> Tuple[str, Optional[str]]:
+    return export_file(*job, scale=scale)
+
+def collect_jobs(inputs: Iterable[str], output: Optional[str], fmt: str,
+                 extensions: Tuple[str, ...] = INPUT_EXTENSIONS) -> List[Tuple[str, str, str]]:
+    """Pair every input flowchart with its output path.
+
+    Directories are searched recursively for files with the given extensions
+    and mirrored under output. A single input file may name its output file
+    directly.
+    """
+    inputs = list(inputs)
+    jobs = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for folder, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.lower().endswith(extensions):
+                        source = os.path.join(folder, name)
+                        relative = os.path.splitext(os.path.relpath(source, path))[0] + '.' + fmt
+                        jobs.append((source, os.path.join(output or path, relative), fmt))
+        elif output and len(inputs) == 1 and not os.path.isdir(output) and not output.endswith(os.sep):
+            jobs.append((path, output, fmt))
+        else:
+            name = os.path.splitext(os.path.basename(path))[0] + '.' + fmt
+            jobs.append((path, os.path.join(output or os.path.dirname(path), name), fmt))
+    return jobs
+
+def export_many(jobs: List[Tuple[str, str, str]], workers: int = 1, scale: float = 1.0):
+    """Yield (source, problem) for every job, spreading them over worker processes.
+    
+    A single PNG job spreads its tiles over the workers instead.
+    """
+    if workers == 1 or len(jobs) < 2:
+        for job in jobs:
+            yield export_file(*job, scale=scale, workers=workers)
+        return
+    from concurrent.futures import ProcessPoolExecutor  # Slow to import, and only needed here
+    with ProcessPoolExecutor(max_workers=workers or None) as pool:
+        yield from pool.map(functools.partial(_export_job, scale=scale), jobs, chunksize=max(1, len(jobs) // (4 * (workers or os.cpu_count() or 1))))
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Render flowchart files to SVG, PostScript or PNG without a display.")
+    parser.add_argument('inputs', nargs='+', help="flowchart files (.json or .fcb) or directories of them")
+    parser.add_argument('-o', '--output', help="output file for a single input, otherwise an output directory")
+    parser.add_argument('-f', '--format', choices=FORMATS, help="output format (default: from the output file name, else svg)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="worker processes; 0 uses every CPU (default: 1)")
+    parser.add_argument('--scale', type=float, default=1.0, help="PNG pixels per canvas unit (default: 1)")
+    args = parser.parse_args(argv)
+    if args.scale <= 0:
+        parser.error("--scale must be positive")
+
+    fmt = args.format
+    if fmt is None:
+        extension = os.path.splitext(args.output or '')[1].lower().lstrip('.')
+        fmt = {'eps': 'ps'}.get(extension, extension) if extension in FORMATS + ('eps',) else 'svg'
+
+    failures = 0
+    for source, problem in export_many(collect_jobs(args.inputs, args.output, fmt), args.jobs, args.scale):
+        if problem:
+            print(f"{source}: {problem}", file=sys.stderr)
+            failures += problem.startswith('failed')
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,74 +1,517 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
-import json
-import math
+import contextlib
+import heapq
+import os
+import queue
+import threading
+import time
+from collections import deque
 from typing import List, Dict, Tuple, Optional
 
-class FlowchartShape:
-    def __init__(self, shape_type: str, x: int, y: int, width: int = 100, height: int = 50, text: str = ""):
-        self.shape_type = shape_type
-        self.x = x
-        self.y = y
-        self.width = width
-        self.height = height
-        self.text = text
-        self.canvas_id = None
-        self.text_id = None
-        
-    def to_dict(self):
-        return {
-            'shape_type': self.shape_type,
-            'x': self.x,
-            'y': self.y,
-            'width': self.width,
-            'height': self.height,
-            'text': self.text
-        }
+from autosave import Autosave, default_autosave_dir
+from flowchart.analysis import GraphChecker, reachable, shortest_path
+from flowchart.fileformat import (BinaryFlowchart, check_arrow_data, check_shape_data, is_binary_file,
+                                  is_legacy_arrow, iter_flowchart_json, save_document)
+from flowchart.geometry import (SegmentIndex, SpatialGrid, arrow_lines, arrow_style, attach_ends,
+                                connector_polylines, shape_outline)
+from flowchart.importers import IMPORT_EXTENSIONS, import_file
+from flowchart.model import FlowchartArrow, FlowchartDocument, FlowchartShape
+from flowchart.routing import OrthogonalRouter, elbow_orthogonal, route_orthogonal
+from flowchart.search import TextIndex
+from instrument import Instrumentation
+
+MIN_SCROLLREGION = (0, 0, 2000, 2000)
+SCROLLREGION_PAD = 500  # Room to keep drawing past the document's edge
+VIEWPORT_MARGIN = 300   # Items this close to the visible area are kept realized
+FRAME_BUDGET_MS = 16    # Drag handling runs at most once per frame (~60 fps)
+OVERLAY_INTERVAL_MS = 500  # How often the performance overlay refreshes
+SELECTION_TAG = 'selected'  # Canvas tag on the items of every selected shape
+PASTE_OFFSET = 20       # How far each paste lands from the copied shapes
+SHIFT_MASK = 0x0001     # event.state bit set while Shift is held
+LABEL_TAG = 'label'     # Canvas tag on every shape label, so a zoom resizes them in one call
+LABEL_FONT_SIZE = 10
+
+# Zoom and the level-of-detail rules that keep a zoomed-out view cheap
+ZOOM_STEP = 1.25          # Factor per wheel notch or zoom button press
+MIN_ZOOM = 0.05
+MAX_ZOOM = 4.0
+FIT_MARGIN = 20           # Screen pixels left around the diagram by Fit
+LABEL_MIN_ZOOM = 0.5      # Labels are not drawn below this zoom
+ARROWHEAD_MIN_ZOOM = 0.35 # Nor are arrowheads below this one
+DETAIL_MIN_SIZE = 16      # Stars and hexagons smaller than this on screen are drawn as boxes
+SIMPLIFIED_SHAPES = ('star', 'hexagon')
+
+PICK_TOLERANCE = 5      # Screen pixels a click may miss a connector by
+PICK_SPLINE_STEPS = 4   # Samples per spline piece when indexing curved connectors for picking
+
+# Flow checks, re-run this long after the last edit while they are switched on
+CHECK_DELAY_MS = 200
+ISSUE_COLORS = {'unreachable': 'gray60', 'dead_end': 'red', 'decision': 'orange', 'cycle': 'purple'}
+FIND_LIMIT = 200        # Search results listed; matches are ordered top to bottom, left to right
+
+ISSUE_LABELS = {'unreachable': 'unreachable', 'dead_end': 'dead ends', 'decision': 'one-way decisions',
+                'cycle': 'loops'}
+
+HISTORY_BYTE_BUDGET = 16 * 1024 * 1024
+
+def approx_record_size(text: str = "") -> int:
+    # Rough footprint of one shape/arrow record: object header plus a
+    # handful of boxed numbers, and the label's characters
+    return 160 + len(text)
+
+def group_bounds(items) -> Tuple[float, float, float, float]:
+    """Bounding box around a non-empty group of shapes and/or arrows."""
+    all_bounds = [item.bounds() for item in items]
+    return (min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+            max(b[2] for b in all_bounds), max(b[3] for b in all_bounds))
+
+def diagram_shortcut(handler):
+    """Wrap a key handler bound on the root window so it ignores keys typed into text fields."""
+    def on_key(event):
+        if isinstance(event.widget, (tk.Entry, tk.Listbox)):
+            return None  # The field's own bindings have already handled the key
+        return handler(event)
+    return on_key
+
+def arrow_ends(arrow) -> Tuple:
+    """An arrow's end coordinates and bindings, as EditArrowCommand records them."""
+    return (arrow.start_x, arrow.start_y, arrow.end_x, arrow.end_y,
+            arrow.source_id, arrow.source_port, arrow.target_id, arrow.target_port)
+
+class HistoryCommand:
+    """One undoable edit that knows how to apply and invert itself.
+    
+    Commands only hold what the edit changed, so recording one costs the
+    same no matter how large the diagram is.
+    """
+    resizes = False  # Whether size() can change while the command sits in the history
     
-    @classmethod
-    def from_dict(cls, data):
-        return cls(data['shape_type'], data['x'], data['y'], 
-                  data['width'], data['height'], data['text'])
+    def apply(self, app):
+        raise NotImplementedError
+        
+    def revert(self, app):
+        raise NotImplementedError
+        
+    def size(self) -> int:
+        return 64
+        
+    def merge(self, other) -> bool:
+        return False
 
-class FlowchartArrow:
-    def __init__(self, arrow_type: str, start_x: float, start_y: float, end_x: float, end_y: float):
-        self.arrow_type = arrow_type  # 'straight', 'curved', 'dashed', 'double', 'bidirectional'
-        self.start_x = start_x
-        self.start_y = start_y
-        self.end_x = end_x
-        self.end_y = end_y
-        self.canvas_ids = []  # Multiple canvas items for complex arrows
-        
-    def to_dict(self):
-        return {
-            'arrow_type': self.arrow_type,
-            'start_x': self.start_x,
-            'start_y': self.start_y,
-            'end_x': self.end_x,
-            'end_y': self.end_y
-        }
+class AddShapeCommand(HistoryCommand):
+    # The shape keeps its document id and z while removed, so bringing it
+    # back restores its place in the stacking order as well
+    def __init__(self, shape):
+        self.shape = shape
+        
+    def apply(self, app):
+        app.add_shape(self.shape)
+        
+    def revert(self, app):
+        app.remove_shape(self.shape)
+        
+    def size(self):
+        return 64 + approx_record_size(self.shape.text)
+
+class DeleteShapeCommand(HistoryCommand):
+    """Deletes a shape together with the arrows attached to it."""
+    def __init__(self, shape, arrows=()):
+        self.shape = shape
+        self.arrows = list(arrows)
+        
+    def apply(self, app):
+        for arrow in self.arrows:
+            app.remove_arrow(arrow)
+        app.remove_shape(self.shape)
+        
+    def revert(self, app):
+        app.add_shape(self.shape)
+        for arrow in self.arrows:
+            app.add_arrow(arrow)
+            
+    def size(self):
+        return 64 + approx_record_size(self.shape.text) + approx_record_size() * len(self.arrows)
+
+class AddArrowCommand(HistoryCommand):
+    def __init__(self, arrow):
+        self.arrow = arrow
+        
+    def apply(self, app):
+        app.add_arrow(self.arrow)
+        
+    def revert(self, app):
+        app.remove_arrow(self.arrow)
+        
+    def size(self):
+        return 64 + approx_record_size()
+
+class DeleteArrowCommand(HistoryCommand):
+    def __init__(self, arrow):
+        self.arrow = arrow
+        
+    def apply(self, app):
+        app.remove_arrow(self.arrow)
+        
+    def revert(self, app):
+        app.add_arrow(self.arrow)
+        
+    def size(self):
+        return 64 + approx_record_size()
+
+class EditArrowCommand(HistoryCommand):
+    """Moves and reconnects an arrow's ends, as dragging one of them does."""
+    def __init__(self, arrow, old_ends, new_ends):
+        self.arrow = arrow
+        self.old_ends = old_ends
+        self.new_ends = new_ends
+        
+    def apply(self, app):
+        app.set_arrow_ends(self.arrow, self.new_ends)
+        
+    def revert(self, app):
+        app.set_arrow_ends(self.arrow, self.old_ends)
+        
+    def size(self):
+        return 192
+
+class MoveShapeCommand(HistoryCommand):
+    def __init__(self, shape, old_x, old_y, new_x, new_y):
+        self.shape = shape
+        self.old_x, self.old_y = old_x, old_y
+        self.new_x, self.new_y = new_x, new_y
         
-    @classmethod
-    def from_dict(cls, data):
-        return cls(data['arrow_type'], data['start_x'], data['start_y'], data['end_x'], data['end_y'])
+    def apply(self, app):
+        app.move_shape(self.shape, self.new_x, self.new_y)
+        
+    def revert(self, app):
+        app.move_shape(self.shape, self.old_x, self.old_y)
+        
+    def size(self):
+        return 128
+        
+    def merge(self, other):
+        # Successive moves of one shape collapse into a single entry
+        if not isinstance(other, MoveShapeCommand) or other.shape is not self.shape:
+            return False
+        self.new_x, self.new_y = other.new_x, other.new_y
+        return True
+
+class MoveShapesCommand(HistoryCommand):
+    """Moves many shapes as one entry, as an auto layout does."""
+    def __init__(self, old_positions, new_positions):
+        self.old_positions = old_positions  # {shape: (x, y)}
+        self.new_positions = new_positions
+        
+    def apply(self, app):
+        app.move_shapes(self.new_positions)
+        
+    def revert(self, app):
+        app.move_shapes(self.old_positions)
+        
+    def size(self):
+        return 64 + 128 * len(self.new_positions)
+
+class MoveGroupCommand(HistoryCommand):
+    """Moves a group of shapes by one offset, as dragging a selection does."""
+    def __init__(self, shapes, dx, dy):
+        self.shapes = tuple(shapes)
+        self.dx, self.dy = dx, dy
+        
+    def apply(self, app):
+        app.translate_shapes(self.shapes, self.dx, self.dy)
+        
+    def revert(self, app):
+        app.translate_shapes(self.shapes, -self.dx, -self.dy)
+        
+    def size(self):
+        # One offset for the whole group plus a reference per shape
+        return 96 + 8 * len(self.shapes)
+
+class GroupCommand(HistoryCommand):
+    """Several commands undone and redone as a single entry."""
+    def __init__(self, commands):
+        self.commands = list(commands)
+        
+    def apply(self, app):
+        for command in self.commands:
+            command.apply(app)
+            
+    def revert(self, app):
+        for command in reversed(self.commands):
+            command.revert(app)
+            
+    def size(self):
+        return 64 + sum(command.size() for command in self.commands)
+
+class EditTextCommand(HistoryCommand):
+    def __init__(self, shape, old_text: str, new_text: str):
+        self.shape = shape
+        self.old_text = old_text
+        self.new_text = new_text
+        
+    def apply(self, app):
+        app.set_shape_text(self.shape, self.new_text)
+        
+    def revert(self, app):
+        app.set_shape_text(self.shape, self.old_text)
+        
+    def size(self):
+        return 96 + len(self.old_text) + len(self.new_text)
+
+class ReplaceDocumentCommand(HistoryCommand):
+    """Swaps the whole document, as loading a file or clearing the canvas does.
+    
+    Both sides are kept as the original documents rather than copies; a
+    document that is not the live one is never mutated. The live one is,
+    so the size is that of what both hold now: each side's footprint is
+    counted again once shapes or arrows have come or gone since.
+    """
+    resizes = True
+    
+    def __init__(self, old_document, new_document):
+        self.old_document = old_document
+        self.new_document = new_document
+        self._footprints = {}  # id(document) -> (what it was counted at, footprint)
+        
+    def apply(self, app):
+        app.replace_document(self.new_document)
+        
+    def revert(self, app):
+        app.replace_document(self.old_document)
+        
+    def _footprint(self, document) -> int:
+        counted = (document.revision, document.shape_count(), document.arrow_count())
+        cached = self._footprints.get(id(document))
+        if cached is None or cached[0] != counted:
+            footprint = sum(approx_record_size(shape.text) for shape in document.shapes())
+            footprint += approx_record_size() * document.arrow_count()
+            cached = self._footprints[id(document)] = (counted, footprint)
+        return cached[1]
+        
+    def size(self):
+        return 64 + self._footprint(self.old_document) + self._footprint(self.new_document)
+
+class History:
+    """Undo/redo stacks of commands, bounded by an approximate byte budget.
+    
+    bytes_used sums what each command was last charged, so a command
+    leaving gives back exactly that. Commands that resize are charged
+    again on every record, before the eviction check.
+    """
+    def __init__(self, byte_budget: int = HISTORY_BYTE_BUDGET):
+        self.byte_budget = byte_budget
+        self.undo_stack: deque = deque()
+        self.redo_stack: List[HistoryCommand] = []
+        self.bytes_used = 0
+        self.charged: Dict[HistoryCommand, int] = {}
+        self.resizing: List[HistoryCommand] = []  # Recorded commands whose size() can change
+        
+    def __len__(self):
+        return len(self.undo_stack) + len(self.redo_stack)
+        
+    def can_undo(self) -> bool:
+        return bool(self.undo_stack)
+        
+    def can_redo(self) -> bool:
+        return bool(self.redo_stack)
+        
+    def _charge(self, command: HistoryCommand):
+        size = command.size()
+        self.bytes_used += size - self.charged.get(command, 0)
+        self.charged[command] = size
+        
+    def _discharge(self, command: HistoryCommand):
+        self.bytes_used -= self.charged.pop(command)
+        if command.resizes:
+            self.resizing.remove(command)
+            
+    def record(self, command: HistoryCommand, coalesce: bool = False):
+        # Recording a new edit discards everything that could be redone
+        for dropped in self.redo_stack:
+            self._discharge(dropped)
+        self.redo_stack.clear()
+        
+        if coalesce and self.undo_stack and self.undo_stack[-1].merge(command):
+            self._charge(self.undo_stack[-1])
+        else:
+            self.undo_stack.append(command)
+            self._charge(command)
+            if command.resizes:
+                self.resizing.append(command)
+        for resized in self.resizing:
+            self._charge(resized)
+        
+        # Evict the oldest entries until we are back under budget, but
+        # always keep the most recent edit undoable
+        while self.bytes_used > self.byte_budget and len(self.undo_stack) > 1:
+            self._discharge(self.undo_stack.popleft())
+            
+    def undo(self, app) -> bool:
+        if not self.undo_stack:
+            return False
+        command = self.undo_stack.pop()
+        command.revert(app)
+        self.redo_stack.append(command)
+        return True
+        
+    def redo(self, app) -> bool:
+        if not self.redo_stack:
+            return False
+        command = self.redo_stack.pop()
+        command.apply(app)
+        self.undo_stack.append(command)
+        return True
+        
+    def clear(self):
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.bytes_used = 0
+        self.charged.clear()
+        self.resizing.clear()
+
+LOAD_BATCH_SIZE = 500   # Entries handed to the UI per batch
+LOAD_QUEUE_DEPTH = 16   # Batches the worker may get ahead of the UI
+LOAD_POLL_MS = 10
+class FlowchartLoader:
+    """Parses a flowchart file on a worker thread and queues batches for the UI.
+    
+    JSON files are decoded incrementally; binary files are recognised by
+    their magic number and read record by record through mmap.
+    
+    The worker never touches Tk: it validates each entry as it is decoded,
+    builds the shape and arrow objects, and puts ('shapes' | 'arrows' |
+    'legacy_arrows', batch), ('done', None) or ('error', message) messages
+    on a bounded queue that the UI drains from after() callbacks. Arrows
+    from files that predate attached connectors come as 'legacy_arrows' so
+    the UI can snap them to nearby shapes. Invalid entries, and entries
+    reusing an earlier entry's id, are skipped and counted rather than
+    aborting the whole load.
+    """
+    def __init__(self, filename: str, batch_size: int = LOAD_BATCH_SIZE):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.total_size = max(os.path.getsize(filename), 1)
+        self.chars_read = 0
+        self.skipped = 0
+        self.shapes_loaded = 0
+        self.arrows_loaded = 0
+        self.queue: queue.Queue = queue.Queue(maxsize=LOAD_QUEUE_DEPTH)
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="flowchart-loader", daemon=True)
+        
+    def start(self):
+        self.thread.start()
+        
+    def cancel(self):
+        self.cancelled.set()
+        
+    def progress(self) -> float:
+        return min(self.chars_read / self.total_size, 1.0)
+        
+    def _count_read(self, n):
+        self.chars_read += n
+        
+    def _put(self, message) -> bool:
+        # Block while the UI catches up, but give up promptly on cancel
+        while not self.cancelled.is_set():
+            try:
+                self.queue.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+        
+    def _run(self):
+        checks = {'shapes': (check_shape_data, FlowchartShape), 'arrows': (check_arrow_data, FlowchartArrow),
+                  'legacy_arrows': (check_arrow_data, FlowchartArrow)}
+        section, batch = None, []
+        ids = set()  # The document refuses a second object with an id, so skip it here
+        try:
+            with contextlib.ExitStack() as stack:
+                if is_binary_file(self.filename):
+                    reader = stack.enter_context(BinaryFlowchart(self.filename))
+                    entries = reader.iter_entries()
+                    # Records are fixed width, so count progress per entry instead
+                    per_entry = self.total_size / max(reader.shape_count + reader.arrow_count, 1)
+                else:
+                    f = stack.enter_context(open(self.filename, 'r'))
+                    entries = iter_flowchart_json(f, on_read=self._count_read)
+                    per_entry = 0
+                for key, data in entries:
+                    if self.cancelled.is_set():
+                        return
+                    self.chars_read += per_entry
+                    if key == 'arrows' and isinstance(data, dict) and is_legacy_arrow(data):
+                        key = 'legacy_arrows'
+                    if key != section:
+                        if batch and not self._put((section, batch)):
+                            return
+                        section, batch = key, []
+                    check, cls = checks[key]
+                    try:
+                        check(data)
+                    except ValueError:
+                        self.skipped += 1
+                        continue
+                    item = cls.from_dict(data)
+                    if item.id is not None:
+                        if item.id in ids:
+                            self.skipped += 1
+                            continue
+                        ids.add(item.id)
+                    batch.append(item)
+                    if len(batch) >= self.batch_size:
+                        if not self._put((section, batch)):
+                            return
+                        batch = []
+            if batch and not self._put((section, batch)):
+                return
+            self._put(('done', None))
+        except Exception as e:
+            if batch:
+                self._put((section, batch))
+            self._put(('error', str(e)))
 
 class FlowchartMaker:
-    def __init__(self, root):
+    def __init__(self, root, history_budget: int = HISTORY_BYTE_BUDGET, virtualized: bool = True,
+                 frame_budget_ms: int = FRAME_BUDGET_MS, autosave_dir: Optional[str] = None):
         self.root = root
         self.root.title("Advanced Flowchart Maker")
         self.root.geometry("1200x800")
         
         # Data structures
-        self.shapes: List[FlowchartShape] = []
-        self.arrows: List[FlowchartArrow] = []
-        self.history: List[Dict] = []
-        self.history_index = -1
-        self.selected_shape = None
+        self.document = FlowchartDocument()
+        self.history = History(history_budget)
+        self.selected_shape = None  # The shape clicked last; always one of the selection
+        self.selection = set()
+        self.clipboard: Optional[Dict] = None
+        self.paste_count = 0
+        self.shape_index = SpatialGrid()
+        self.arrow_index = SpatialGrid()
+        self.segment_index = SegmentIndex()  # Connector segments, for picking them
+        self.text_index = TextIndex()        # Words of the shape labels, for Find
+        self.selected_arrow = None
+        self.router = OrthogonalRouter(self.shape_index)
+        
+        # Viewport culling: only items near the visible area exist on the canvas
+        self.virtualized = virtualized
+        self.viewport = MIN_SCROLLREGION
+        self.viewport_job = None
+        self.realized_shapes = set()
+        self.realized_arrows = set()
+        self.scrollregion = MIN_SCROLLREGION  # In document coordinates, like everything but the canvas
+        
+        # View transform: canvas coordinates are document coordinates times zoom
+        self.zoom = 1.0
         
         # Drawing states
         self.drawing_shape = False
         self.drawing_arrow = False
         self.moving_shape = False
+        self.selecting_area = False  # Dragging out a rubber band on empty canvas
+        self.dragging_end = None  # 'source' or 'target' while an end of the selected arrow is dragged
+        self.end_origin = None    # The arrow's arrow_ends() when that drag started
         self.start_x = 0
         self.start_y = 0
         self.current_x = 0
@@ -76,14 +519,45 @@ class FlowchartMaker:
         self.temp_items = []  # For temporary drawing items
         self.drag_start_x = 0
         self.drag_start_y = 0
+        self.drag_origin = (0, 0)  # Shape position when a move started
+        self.drag_bounds = []      # Bounds of the dragged shapes then, for routing once they land
+        
+        # Motion coalescing: only the latest pointer position is handled, once per frame
+        self.frame_budget_ms = frame_budget_ms
+        self.pending_motion = None
+        self.motion_job = None
+        self.last_motion_time = 0.0
+        
+        # Background file loading
+        self.loader: Optional[FlowchartLoader] = None
+        self.load_previous: Optional[FlowchartDocument] = None
         
         # Current mode
         self.current_shape_type = 'rectangle'
         self.current_arrow_type = 'straight'
         self.current_mode = 'select'  # 'select', 'draw_shape', 'draw_arrow'
         
+        # Crash recovery journal; started by offer_recovery() once the window is up
+        self.autosave = Autosave(autosave_dir) if autosave_dir else None
+        
+        # Live flow checks: outlines shapes with problems in their ISSUE_COLORS
+        self.checker = GraphChecker()
+        self.checking = False
+        self.check_job = None
+        self.flagged: Dict[int, str] = {}  # Shape id -> issue
+        
+        # Opt-in timing of the hot paths (F12), with an overlay in the status bar
+        self.instrumentation = Instrumentation(self)
+        self.overlay_job = None
+        
+        # Find panel state; find_list is the results listbox once the UI exists
+        self.find_query = ""
+        self.find_results: List[FlowchartShape] = []
+        self.find_list = None
+        
         self.setup_ui()
-        self.save_state()  # Initial state
+        if os.environ.get('FLOWCHART_INSTRUMENT'):
+            self.toggle_instrumentation()
         
     def setup_ui(self):
         # Create main container
@@ -101,7 +575,34 @@ class FlowchartMaker:
         self.setup_left_panel(left_frame)
         self.setup_canvas_area(right_frame)
         
+        self.root.bind("<Escape>", self.cancel_load)
+        self.root.bind("<F12>", self.toggle_instrumentation)
+        self.root.bind("<Shift-F12>", self.dump_stats)
+        # Editing keys act on the diagram unless a text field (Find) has them
+        self.root.bind("<Control-a>", diagram_shortcut(self.select_all))
+        self.root.bind("<Control-c>", diagram_shortcut(self.copy_selected))
+        self.root.bind("<Control-v>", diagram_shortcut(self.paste))
+        self.root.bind("<Delete>", diagram_shortcut(self.delete_selected))
+        self.root.bind("<Control-f>", lambda event: self.find_entry.focus_set())
+        self.root.bind("<Control-plus>", lambda event: self.set_zoom(self.zoom * ZOOM_STEP))
+        self.root.bind("<Control-equal>", lambda event: self.set_zoom(self.zoom * ZOOM_STEP))
+        self.root.bind("<Control-minus>", lambda event: self.set_zoom(self.zoom / ZOOM_STEP))
+        self.root.bind("<Control-0>", lambda event: self.set_zoom(1.0))
+        
     def setup_left_panel(self, parent):
+        # Find section - search the shape labels, pick a result to jump to it
+        find_frame = ttk.LabelFrame(parent, text="Find", padding=5)
+        find_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        self.find_var = tk.StringVar()
+        self.find_var.trace_add('write', lambda *args: self.set_find_query(self.find_var.get()))
+        self.find_entry = ttk.Entry(find_frame, textvariable=self.find_var)
+        self.find_entry.pack(fill=tk.X, pady=2)
+        self.find_entry.bind("<Return>", lambda event: self.jump_to_result(0))
+        self.find_list = tk.Listbox(find_frame, height=5, activestyle='none', exportselection=False)
+        self.find_list.pack(fill=tk.X, pady=2)
+        self.find_list.bind("<<ListboxSelect>>", self.on_find_select)
+        
         # Tools section
         tools_frame = ttk.LabelFrame(parent, text="Tools", padding=5)
         tools_frame.pack(fill=tk.X, padx=5, pady=5)
@@ -109,6 +610,18 @@ class FlowchartMaker:
         ttk.Button(tools_frame, text="Select/Move", command=lambda: self.set_mode('select')).pack(fill=tk.X, pady=2)
         ttk.Button(tools_frame, text="Add Text", command=self.add_text_to_selected).pack(fill=tk.X, pady=2)
         ttk.Button(tools_frame, text="Delete", command=self.delete_selected).pack(fill=tk.X, pady=2)
+        ttk.Button(tools_frame, text="Auto Layout", command=self.auto_layout).pack(fill=tk.X, pady=2)
+        
+        # Arrange section - align the selected shapes
+        arrange_frame = ttk.LabelFrame(parent, text="Arrange", padding=5)
+        arrange_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        for edges in (("Left", "Center", "Right"), ("Top", "Middle", "Bottom")):
+            row = ttk.Frame(arrange_frame)
+            row.pack(fill=tk.X, pady=1)
+            for edge in edges:
+                ttk.Button(row, text=edge, width=6,
+                           command=lambda e=edge.lower(): self.align_selected(e)).pack(side=tk.LEFT, fill=tk.X, expand=True)
         
         # Shapes section - only essential shapes
         shapes_frame = ttk.LabelFrame(parent, text="Shapes", padding=5)
@@ -140,7 +653,9 @@ class FlowchartMaker:
             ("Double Arrow", "double"),
             ("Bidirectional", "bidirectional"),
             ("Thick Arrow", "thick"),
-            ("Dotted Line", "dotted")
+            ("Dotted Line", "dotted"),
+            ("Orthogonal", "orthogonal"),
+            ("Plain Line", "line")
         ]
         
         for name, arrow_type in arrow_types:
@@ -157,6 +672,30 @@ class FlowchartMaker:
         ttk.Button(undo_frame, text="Undo", command=self.undo).pack(side=tk.LEFT, padx=(0,2), fill=tk.X, expand=True)
         ttk.Button(undo_frame, text="Redo", command=self.redo).pack(side=tk.RIGHT, padx=(2,0), fill=tk.X, expand=True)
         
+        # Analyze section - flow checks and graph queries
+        analyze_frame = ttk.LabelFrame(parent, text="Analyze", padding=5)
+        analyze_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Button(analyze_frame, text="Check Flow", command=self.toggle_checks).pack(fill=tk.X, pady=2)
+        query_frame = ttk.Frame(analyze_frame)
+        query_frame.pack(fill=tk.X, pady=2)
+        ttk.Button(query_frame, text="Reachable", width=9,
+                   command=self.select_reachable).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(query_frame, text="Path", width=5,
+                   command=self.select_path).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # View section - zoom
+        view_frame = ttk.LabelFrame(parent, text="View", padding=5)
+        view_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        zoom_frame = ttk.Frame(view_frame)
+        zoom_frame.pack(fill=tk.X, pady=2)
+        ttk.Button(zoom_frame, text="Zoom In", width=8,
+                   command=lambda: self.set_zoom(self.zoom * ZOOM_STEP)).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(zoom_frame, text="Zoom Out", width=8,
+                   command=lambda: self.set_zoom(self.zoom / ZOOM_STEP)).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        ttk.Button(zoom_frame, text="Fit", width=4, command=self.zoom_to_fit).pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
     def setup_canvas_area(self, parent):
         # Top bar with file operations and status
         top_bar = ttk.Frame(parent)
@@ -172,6 +711,10 @@ class FlowchartMaker:
         file_frame = ttk.Frame(top_bar)
         file_frame.pack(side=tk.RIGHT)
         
+        # Performance overlay, blank unless instrumentation is on
+        self.perf_var = tk.StringVar()
+        ttk.Label(top_bar, textvariable=self.perf_var).pack(side=tk.RIGHT, padx=(0, 5))
+        
         ttk.Button(file_frame, text="New", command=self.clear_canvas).pack(side=tk.LEFT, padx=2)
         ttk.Button(file_frame, text="Save", command=self.save_file).pack(side=tk.LEFT, padx=2)
         ttk.Button(file_frame, text="Open", command=self.load_file).pack(side=tk.LEFT, padx=2)
@@ -184,28 +727,39 @@ class FlowchartMaker:
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
         # Scrollbars
-        v_scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.canvas.yview)
+        v_scrollbar = ttk.Scrollbar(canvas_frame, orient=tk.VERTICAL, command=self.on_yscroll)
         v_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.canvas.configure(yscrollcommand=v_scrollbar.set)
         
-        h_scrollbar = ttk.Scrollbar(parent, orient=tk.HORIZONTAL, command=self.canvas.xview)
+        h_scrollbar = ttk.Scrollbar(parent, orient=tk.HORIZONTAL, command=self.on_xscroll)
         h_scrollbar.pack(side=tk.BOTTOM, fill=tk.X)
         self.canvas.configure(xscrollcommand=h_scrollbar.set)
         
-        # Set large scrollregion for drawing
-        self.canvas.configure(scrollregion=(0, 0, 2000, 2000))
+        # Scrollregion starts at a comfortable drawing area and grows with the document
+        self.canvas.configure(scrollregion=self.scrollregion)
+        
+        # Marker item separating the shape layer from the arrow layer
+        self.arrow_layer = self.canvas.create_line(0, 0, 0, 0, state='hidden')
+        
+        self.bind_canvas_events()
         
-        # Bind canvas events
+    def bind_canvas_events(self):
+        # Bound methods are captured here, so this runs again whenever
+        # instrumentation wraps or unwraps the handlers
         self.canvas.bind("<Button-1>", self.on_canvas_press)
         self.canvas.bind("<B1-Motion>", self.on_canvas_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_canvas_release)
         self.canvas.bind("<Double-Button-1>", self.on_double_click)
         self.canvas.bind("<Motion>", self.on_canvas_motion)
+        self.canvas.bind("<Configure>", self.schedule_viewport_update)
+        self.canvas.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-4>", self.on_mouse_wheel)
+        self.canvas.bind("<Button-5>", self.on_mouse_wheel)
         
     def set_mode(self, mode):
         self.current_mode = mode
         if mode == 'select':
-            self.status_var.set("Select mode - Click shapes to select, drag to move")
+            self.status_var.set("Select mode - Click or drag a box to select, Shift adds, drag to move")
         self.canvas.configure(cursor="arrow" if mode == 'select' else "crosshair")
         
     def set_shape_mode(self, shape_type):
@@ -221,18 +775,44 @@ class FlowchartMaker:
         self.canvas.configure(cursor="crosshair")
         
     def on_canvas_press(self, event):
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        if self.loader is not None:
+            self.status_var.set("Still loading - press Esc to stop")
+            return
+        x, y = self.event_point(event)
         self.start_x, self.start_y = x, y
         
         if self.current_mode == 'select':
+            adding = event.state & SHIFT_MASK
+            # Connectors are drawn above the shapes, so they are picked first
+            arrow = None if adding else self.arrow_at_position(x, y)
+            if arrow is not None:
+                self.select_arrow(arrow)
+                self.dragging_end = self.arrow_end_near(arrow, x, y)
+                self.end_origin = arrow_ends(arrow)
+                return
+            self.select_arrow(None)
             clicked_shape = self.get_shape_at_position(x, y)
             if clicked_shape:
-                self.select_shape(clicked_shape)
+                if adding and clicked_shape in self.selection:
+                    self.set_selection(self.selection - {clicked_shape})
+                    return
+                if adding:
+                    self.set_selection(self.selection | {clicked_shape}, clicked_shape)
+                elif clicked_shape in self.selection:
+                    # Pressing on a selected shape drags the whole selection
+                    self.selected_shape = clicked_shape
+                else:
+                    self.select_shape(clicked_shape)
                 self.moving_shape = True
+                self.drag_origin = (clicked_shape.x, clicked_shape.y)
+                self.drag_bounds = [shape.bounds() for shape in self.selection]
                 self.drag_start_x = x - clicked_shape.x
                 self.drag_start_y = y - clicked_shape.y
             else:
-                self.deselect_all()
+                if not adding:
+                    self.deselect_all()
+                self.selecting_area = True
+                self.temp_items = [self.canvas.create_rectangle(self.to_view((x, y, x, y)), outline='blue', dash=(4, 2))]
                 
         elif self.current_mode == 'draw_shape':
             self.drawing_shape = True
@@ -243,33 +823,76 @@ class FlowchartMaker:
             self.temp_items = self.draw_temp_arrow(x, y, x, y)
             
     def on_canvas_drag(self, event):
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        # Remember the newest position and process it on the next frame
+        self.pending_motion = self.event_point(event)
+        if self.motion_job is None:
+            elapsed_ms = (time.perf_counter() - self.last_motion_time) * 1000
+            delay = max(0, int(self.frame_budget_ms - elapsed_ms))
+            self.motion_job = self.canvas.after(delay, self.process_motion)
+            
+    def flush_motion(self):
+        if self.motion_job is not None:
+            self.canvas.after_cancel(self.motion_job)
+            self.process_motion()
+            
+    def process_motion(self):
+        self.motion_job = None
+        if self.pending_motion is None:
+            return
+        x, y = self.pending_motion
+        self.pending_motion = None
+        self.last_motion_time = time.perf_counter()
         self.current_x, self.current_y = x, y
         
-        if self.moving_shape and self.selected_shape:
-            new_x = x - self.drag_start_x
-            new_y = y - self.drag_start_y
-            self.selected_shape.x = new_x
-            self.selected_shape.y = new_y
-            self.redraw_canvas()
+        if self.dragging_end is not None and self.selected_arrow:
+            self.move_arrow_end(self.selected_arrow, self.dragging_end, x, y)
+            
+        elif self.moving_shape and self.selected_shape:
+            shape = self.selected_shape
+            dx = x - self.drag_start_x - shape.x
+            dy = y - self.drag_start_y - shape.y
+            # Journaled, and the connectors routed, once on release rather than every frame
+            self.translate_shapes(self.selection, dx, dy, tag=SELECTION_TAG, journal=False, reroute=False)
+            
+        elif self.selecting_area and self.temp_items:
+            self.canvas.coords(self.temp_items[0], self.to_view((self.start_x, self.start_y, x, y)))
             
         elif self.drawing_shape and self.temp_items:
-            for item in self.temp_items:
-                self.canvas.delete(item)
-            self.temp_items = [self.draw_temp_shape(self.start_x, self.start_y, x, y)]
+            self.update_temp_shape(self.start_x, self.start_y, x, y)
             
-        elif self.drawing_arrow and self.temp_items:
-            for item in self.temp_items:
-                self.canvas.delete(item)
-            self.temp_items = self.draw_temp_arrow(self.start_x, self.start_y, x, y)
+        elif self.drawing_arrow:
+            self.update_temp_arrow(self.start_x, self.start_y, x, y)
             
     def on_canvas_release(self, event):
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        self.flush_motion()
+        x, y = self.event_point(event)
         
-        if self.moving_shape:
+        if self.dragging_end is not None:
+            arrow, end = self.selected_arrow, self.dragging_end
+            self.dragging_end = None
+            if arrow and arrow_ends(arrow) != self.end_origin:
+                # Dropped on or next to a shape, the end connects to it
+                self.attach_ends(arrow, (end,))
+                self.reroute_arrow(arrow)
+                if self.autosave:
+                    self.autosave.add_arrow(arrow)
+                self.save_state(EditArrowCommand(arrow, self.end_origin, arrow_ends(arrow)))
+                
+        elif self.moving_shape:
             self.moving_shape = False
-            if self.selected_shape:
-                self.save_state()
+            shape = self.selected_shape
+            self.settle_routes(self.selection, self.drag_bounds)
+            if shape and (shape.x, shape.y) != self.drag_origin:
+                if self.autosave:
+                    self.autosave.move_shapes(self.selection)
+                self.save_state(MoveGroupCommand(self.selection, shape.x - self.drag_origin[0],
+                                                 shape.y - self.drag_origin[1]))
+                                                 
+        elif self.selecting_area:
+            self.selecting_area = False
+            for item in self.temp_items:
+                self.canvas.delete(item)
+            self.select_area(self.start_x, self.start_y, x, y)
                 
         elif self.drawing_shape:
             self.drawing_shape = False
@@ -288,13 +911,20 @@ class FlowchartMaker:
     def on_canvas_motion(self, event):
         pass
         
+    def on_mouse_wheel(self, event):
+        # X11 reports the wheel as buttons 4 and 5, other platforms as a signed delta
+        if event.num == 4 or event.delta > 0:
+            self.set_zoom(self.zoom * ZOOM_STEP, event.x, event.y)
+        elif event.num == 5 or event.delta < 0:
+            self.set_zoom(self.zoom / ZOOM_STEP, event.x, event.y)
+            
     def on_double_click(self, event):
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        x, y = self.event_point(event)
         shape = self.get_shape_at_position(x, y)
         if shape:
             self.edit_text(shape)
             
-    def draw_temp_shape(self, x1, y1, x2, y2):
+    def temp_shape_bounds(self, x1, y1, x2, y2):
         left = min(x1, x2)
         top = min(y1, y2)
         right = max(x1, x2)
@@ -305,11 +935,30 @@ class FlowchartMaker:
         if bottom - top < 20:
             bottom = top + 20
             
-        return self.draw_shape_on_canvas(self.current_shape_type, left, top, right - left, bottom - top, temp=True)
+        return left, top, right - left, bottom - top
+        
+    def draw_temp_shape(self, x1, y1, x2, y2):
+        return self.draw_shape_on_canvas(self.current_shape_type, *self.temp_shape_bounds(x1, y1, x2, y2), temp=True)
+        
+    def update_temp_shape(self, x1, y1, x2, y2):
+        # Reuse the rubber-band item rather than recreating it every frame
+        kind, points = self.view_outline(self.current_shape_type, *self.temp_shape_bounds(x1, y1, x2, y2), temp=True)
+        self.canvas.coords(self.temp_items[0], points)
         
     def draw_temp_arrow(self, x1, y1, x2, y2):
         return self.draw_arrow_on_canvas(self.current_arrow_type, x1, y1, x2, y2, temp=True)
         
+    def update_temp_arrow(self, x1, y1, x2, y2):
+        lines = arrow_lines(self.current_arrow_type, x1, y1, x2, y2)
+        if len(lines) != len(self.temp_items):
+            # Only happens when a double arrow gains or loses its zero length
+            for item in self.temp_items:
+                self.canvas.delete(item)
+            self.temp_items = self.draw_temp_arrow(x1, y1, x2, y2)
+        else:
+            for item, points in zip(self.temp_items, lines):
+                self.canvas.coords(item, self.to_view(points))
+                
     def create_shape_from_drag(self, x1, y1, x2, y2):
         left = min(x1, x2)
         top = min(y1, y2)
@@ -317,165 +966,645 @@ class FlowchartMaker:
         height = max(abs(y2 - y1), 30)
         
         shape = FlowchartShape(self.current_shape_type, left, top, width, height)
-        self.shapes.append(shape)
-        self.redraw_canvas()
-        self.save_state()
+        self.add_shape(shape)
+        self.save_state(AddShapeCommand(shape))
         self.status_var.set(f"{self.current_shape_type} created")
         
     def create_arrow_from_drag(self, x1, y1, x2, y2):
         if abs(x2 - x1) > 10 or abs(y2 - y1) > 10:
             arrow = FlowchartArrow(self.current_arrow_type, x1, y1, x2, y2)
-            self.arrows.append(arrow)
-            self.redraw_canvas()
-            self.save_state()
+            self.attach_ends(arrow)
+            self.add_arrow(arrow)
+            self.save_state(AddArrowCommand(arrow))
             self.status_var.set(f"{self.current_arrow_type} arrow created")
             
+    def view_outline(self, shape_type, x, y, width, height, temp=False):
+        """shape_outline() in canvas coordinates, with tiny stars and hexagons reduced to boxes."""
+        if not temp and shape_type in SIMPLIFIED_SHAPES and min(width, height) * self.zoom < DETAIL_MIN_SIZE:
+            # Still a polygon, so zooming back in only has to change its coords
+            kind, points = 'polygon', [x, y, x + width, y, x + width, y + height, x, y + height]
+        else:
+            kind, points = shape_outline(shape_type, x, y, width, height)
+        return kind, self.to_view(points)
+        
     def draw_shape_on_canvas(self, shape_type, x, y, width, height, temp=False):
         fill_color = 'lightgray' if temp else 'white'
         outline_color = 'gray' if temp else 'black'
         outline_width = 1 if temp else 2
         
-        x1, y1, x2, y2 = x, y, x + width, y + height
-        center_x, center_y = x + width/2, y + height/2
+        kind, points = self.view_outline(shape_type, x, y, width, height, temp)
         
-        if shape_type == 'rectangle':
-            return self.canvas.create_rectangle(x1, y1, x2, y2, fill=fill_color, outline=outline_color, width=outline_width)
-            
-        elif shape_type == 'oval':
-            return self.canvas.create_oval(x1, y1, x2, y2, fill=fill_color, outline=outline_color, width=outline_width)
-            
-        elif shape_type == 'diamond':
-            points = [center_x, y1, x2, center_y, center_x, y2, x1, center_y]
-            return self.canvas.create_polygon(points, fill=fill_color, outline=outline_color, width=outline_width)
+        if kind == 'oval':
+            return self.canvas.create_oval(points, fill=fill_color, outline=outline_color, width=outline_width)
             
-        elif shape_type == 'triangle':
-            points = [center_x, y1, x2, y2, x1, y2]
-            return self.canvas.create_polygon(points, fill=fill_color, outline=outline_color, width=outline_width)
-            
-        elif shape_type == 'parallelogram':
-            offset = width // 4
-            points = [x1 + offset, y1, x2, y1, x2 - offset, y2, x1, y2]
-            return self.canvas.create_polygon(points, fill=fill_color, outline=outline_color, width=outline_width)
-            
-        elif shape_type == 'hexagon':
-            w_third = width // 3
-            points = [x1 + w_third, y1, x2 - w_third, y1, x2, center_y, x2 - w_third, y2, x1 + w_third, y2, x1, center_y]
-            return self.canvas.create_polygon(points, fill=fill_color, outline=outline_color, width=outline_width)
-            
-        elif shape_type == 'star':
-            points = []
-            for i in range(10):
-                angle = i * math.pi / 5 - math.pi/2
-                if i % 2 == 0:
-                    px = center_x + (width/2) * math.cos(angle)
-                    py = center_y + (height/2) * math.sin(angle)
-                else:
-                    px = center_x + (width/4) * math.cos(angle)
-                    py = center_y + (height/4) * math.sin(angle)
-                points.extend([px, py])
+        elif kind == 'polygon':
             return self.canvas.create_polygon(points, fill=fill_color, outline=outline_color, width=outline_width)
             
         else:
-            return self.canvas.create_rectangle(x1, y1, x2, y2, fill=fill_color, outline=outline_color, width=outline_width)
+            return self.canvas.create_rectangle(points, fill=fill_color, outline=outline_color, width=outline_width)
             
-    def draw_arrow_on_canvas(self, arrow_type, x1, y1, x2, y2, temp=False):
+    def draw_arrow_on_canvas(self, arrow_type, x1, y1, x2, y2, temp=False, waypoints=()):
         color = 'gray' if temp else 'black'
         width = 1 if temp else 2
-        items = []
-        
-        if arrow_type == 'straight':
-            items.append(self.canvas.create_line(x1, y1, x2, y2, arrow=tk.LAST, width=width, fill=color))
-            
-        elif arrow_type == 'curved':
-            # Create a curved arrow using multiple line segments
-            mid_x = (x1 + x2) / 2
-            mid_y = (y1 + y2) / 2
-            # Add curve offset
-            offset = 30
-            curve_x = mid_x + offset if (x2 - x1) * (y2 - y1) > 0 else mid_x - offset
-            curve_y = mid_y - offset if y2 > y1 else mid_y + offset
-            
-            # Draw curved line using smooth curve approximation
-            points = [x1, y1]
-            for t in [0.2, 0.4, 0.6, 0.8, 1.0]:
-                # Quadratic Bezier curve
-                px = (1-t)**2 * x1 + 2*(1-t)*t * curve_x + t**2 * x2
-                py = (1-t)**2 * y1 + 2*(1-t)*t * curve_y + t**2 * y2
-                points.extend([px, py])
-            items.append(self.canvas.create_line(points, smooth=True, arrow=tk.LAST, width=width, fill=color))
-            
-        elif arrow_type == 'dashed':
-            items.append(self.canvas.create_line(x1, y1, x2, y2, arrow=tk.LAST, width=width, fill=color, dash=(5, 5)))
-            
-        elif arrow_type == 'double':
-            # Draw two parallel lines
-            dx, dy = x2 - x1, y2 - y1
-            length = math.sqrt(dx**2 + dy**2)
-            if length > 0:
-                offset_x = -dy / length * 3  # Perpendicular offset
-                offset_y = dx / length * 3
-                items.append(self.canvas.create_line(x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y, 
-                                                   arrow=tk.LAST, width=width, fill=color))
-                items.append(self.canvas.create_line(x1 - offset_x, y1 - offset_y, x2 - offset_x, y2 - offset_y, 
-                                                   arrow=tk.LAST, width=width, fill=color))
-            
-        elif arrow_type == 'bidirectional':
-            items.append(self.canvas.create_line(x1, y1, x2, y2, arrow=tk.BOTH, width=width, fill=color))
-            
-        elif arrow_type == 'thick':
-            items.append(self.canvas.create_line(x1, y1, x2, y2, arrow=tk.LAST, width=width*2, fill=color))
-            
-        elif arrow_type == 'dotted':
-            items.append(self.canvas.create_line(x1, y1, x2, y2, arrow=tk.LAST, width=width, fill=color, dash=(2, 3)))
-            
-        return items
+        style = arrow_style(arrow_type)
+        # Arrowheads are left off when zoomed too far out to make them out
+        head = style['arrow'] if temp or self.zoom >= ARROWHEAD_MIN_ZOOM else 'none'
+        options = {'arrow': head, 'width': width * style['width_scale'], 'fill': color}
+        if style['dash']:
+            options['dash'] = style['dash']
+        if style['smooth']:
+            options['smooth'] = True
+            
+        return [self.canvas.create_line(self.to_view(points), **options)
+                for points in arrow_lines(arrow_type, x1, y1, x2, y2, waypoints)]
             
     def draw_shape(self, shape: FlowchartShape):
-        fill_color = 'lightblue' if shape == self.selected_shape else 'white'
-        outline_color = 'blue' if shape == self.selected_shape else 'black'
-        outline_width = 2 if shape == self.selected_shape else 1
-        
-        # Draw shape
+        # Draw shape below the arrow layer so connectors stay on top
         shape.canvas_id = self.draw_shape_on_canvas(shape.shape_type, shape.x, shape.y, shape.width, shape.height)
+        self.canvas.tag_lower(shape.canvas_id, self.arrow_layer)
+        self.realized_shapes.add(shape)
+        self.style_shape(shape)
         
-        # Update colors for selection
-        if shape == self.selected_shape:
+        # Draw text
+        shape.text_id = None
+        self.update_shape_text(shape)
+        
+    def realize_shape(self, shape: FlowchartShape):
+        """Draw a shape out of order, slotting it under overlapping shapes that sit above it."""
+        self.draw_shape(shape)
+        above = [other for other in self.shape_index.query_rect(*shape.bounds())
+                 if other.canvas_id is not None and other.z > shape.z]
+        if above:
+            lowest = min(above, key=lambda other: other.z)
+            self.canvas.tag_lower(shape.canvas_id, lowest.canvas_id)
+            if shape.text_id is not None:
+                self.canvas.tag_raise(shape.text_id, shape.canvas_id)
+        
+    def style_shape(self, shape: FlowchartShape):
+        if shape.canvas_id is None:
+            return
+        items = (shape.canvas_id,) if shape.text_id is None else (shape.canvas_id, shape.text_id)
+        if shape in self.selection:
             self.canvas.itemconfig(shape.canvas_id, fill='lightblue', outline='blue', width=2)
+            for item in items:
+                self.canvas.addtag_withtag(SELECTION_TAG, item)
+        else:
+            outline = ISSUE_COLORS.get(self.flagged.get(shape.id), 'black')
+            self.canvas.itemconfig(shape.canvas_id, fill='white', outline=outline, width=2)
+            for item in items:
+                self.canvas.dtag(item, SELECTION_TAG)
+            
+    def update_shape_text(self, shape: FlowchartShape):
+        if shape.canvas_id is None:
+            return
+        if shape.text and self.zoom >= LABEL_MIN_ZOOM:
+            center_x = (shape.x + shape.width / 2) * self.zoom
+            center_y = (shape.y + shape.height / 2) * self.zoom
+            if shape.text_id is None:
+                shape.text_id = self.canvas.create_text(
+                    center_x, center_y, text=shape.text, font=self.label_font(), anchor='center',
+                    tags=(LABEL_TAG, SELECTION_TAG) if shape in self.selection else (LABEL_TAG,))
+                # Keep the label directly above its own shape
+                self.canvas.tag_raise(shape.text_id, shape.canvas_id)
+            else:
+                self.canvas.coords(shape.text_id, center_x, center_y)
+                self.canvas.itemconfig(shape.text_id, text=shape.text)
+        elif shape.text_id is not None:
+            self.canvas.delete(shape.text_id)
+            shape.text_id = None
+            
+    def move_shape(self, shape: FlowchartShape, x, y):
+        old_bounds = shape.bounds()
+        dx, dy = x - shape.x, y - shape.y
+        shape.x = x
+        shape.y = y
+        if shape.canvas_id is not None:
+            self.canvas.move(shape.canvas_id, dx * self.zoom, dy * self.zoom)
+        if shape.text_id is not None:
+            self.canvas.move(shape.text_id, dx * self.zoom, dy * self.zoom)
+        self.shape_index.update(shape, shape.bounds())
+        self.grow_scrollregion(shape.bounds())
+        if shape.canvas_id is None and self.is_visible(shape.bounds()):
+            self.realize_shape(shape)
+        self.reroute_arrows(shape)
+        self.obstacles_changed(old_bounds, shape.bounds())
+        if self.autosave:
+            self.autosave.move_shapes((shape,))
         
-        # Draw text
-        if shape.text:
-            center_x = shape.x + shape.width / 2
-            center_y = shape.y + shape.height / 2
-            shape.text_id = self.canvas.create_text(
-                center_x, center_y, text=shape.text, font=('Arial', 10), anchor='center')
+    def move_shapes(self, positions):
+        """Move many shapes at once, re-indexing and redrawing in bulk rather than per shape."""
+        if len(positions) * 4 < self.document.shape_count():
+            # A few shapes, as aligning does, are cheaper to move one by one
+            for shape, (x, y) in positions.items():
+                self.move_shape(shape, x, y)
+            return
+        for shape, (x, y) in positions.items():
+            shape.x, shape.y = x, y
+        if self.autosave:
+            self.autosave.move_shapes(positions)
+        for shape in positions:
+            for arrow in self.document.incident_arrows(shape.id):
+                self.document.route_arrow(arrow)
+        self.rebuild_shape_index()
+        self.fit_scrollregion()
+        self.redraw_canvas()
+        
+    def translate_shapes(self, shapes, dx, dy, tag: Optional[str] = None, journal: bool = True,
+                         reroute: bool = True):
+        """Move a group of shapes by the same offset.
+        
+        When tag marks exactly the group's canvas items, as SELECTION_TAG does
+        for the selection, one canvas.move shifts them all; otherwise each
+        drawn item is moved on its own. Nothing is redrawn either way.
+        
+        Without reroute, as on every frame of a drag, orthogonal connectors
+        are not routed around the shapes: the attached ones get a plain
+        elbow until settle_routes runs.
+        """
+        if not shapes or (not dx and not dy):
+            return
+        changed = [shape.bounds() for shape in shapes]
+        view_dx, view_dy = dx * self.zoom, dy * self.zoom
+        if tag is not None:
+            self.canvas.move(tag, view_dx, view_dy)
+        for shape in shapes:
+            shape.x += dx
+            shape.y += dy
+            if tag is None:
+                if shape.canvas_id is not None:
+                    self.canvas.move(shape.canvas_id, view_dx, view_dy)
+                if shape.text_id is not None:
+                    self.canvas.move(shape.text_id, view_dx, view_dy)
+            self.shape_index.update(shape, shape.bounds())
+            if shape.canvas_id is None and self.is_visible(shape.bounds()):
+                self.realize_shape(shape)
+        self.grow_scrollregion(group_bounds(shapes))
+        
+        # Connectors between two moved shapes are only visited once. Their ends
+        # move first, so connectors re-routed below as obstacles already search
+        # from the new ends and the route_waypoints after that hits the cache.
+        arrows = {arrow.id: arrow for shape in shapes for arrow in self.document.incident_arrows(shape.id)}
+        moved = {arrow for arrow in arrows.values() if self.document.route_arrow(arrow)}
+        if not reroute:
+            for arrow in moved:
+                if arrow.arrow_type == 'orthogonal':
+                    elbow_orthogonal(self.router, self.document, arrow)
+                self.refresh_arrow(arrow)
+        else:
+            changed.extend(shape.bounds() for shape in shapes)
+            self.obstacles_changed(*changed)
+            for arrow in arrows.values():
+                if self.route_waypoints(arrow) or arrow in moved:
+                    self.refresh_arrow(arrow)
+        if journal and self.autosave:
+            self.autosave.move_shapes(shapes)
+            
+    def settle_routes(self, shapes, old_bounds):
+        """Route what a drag left elbowed: the connectors near where the shapes were and are, and their own."""
+        new_bounds = [shape.bounds() for shape in shapes]
+        if new_bounds != old_bounds:
+            self.obstacles_changed(*old_bounds, *new_bounds)
+        arrows = {arrow.id: arrow for shape in shapes for arrow in self.document.incident_arrows(shape.id)}
+        for arrow in arrows.values():
+            if self.route_waypoints(arrow):
+                self.refresh_arrow(arrow)
+        
+    def reroute_arrows(self, shape: FlowchartShape):
+        # Only the connectors attached to this shape need new endpoints
+        for arrow in self.document.incident_arrows(shape.id):
+            self.reroute_arrow(arrow)
+            
+    def reroute_arrow(self, arrow: FlowchartArrow):
+        moved = self.document.route_arrow(arrow)
+        if self.route_waypoints(arrow) or moved:
+            self.refresh_arrow(arrow)
+                
+    def route_waypoints(self, arrow: FlowchartArrow) -> bool:
+        """Route an orthogonal connector around the shapes; True if its path changed."""
+        if arrow.arrow_type != 'orthogonal':
+            return False
+        return route_orthogonal(self.router, self.document, arrow)
+        
+    def obstacles_changed(self, *areas):
+        """Re-route the orthogonal connectors whose cached routes pass near these areas."""
+        for area in areas:
+            for arrow_id in self.router.invalidate(area):
+                arrow = self.document.arrow(arrow_id)
+                if arrow is not None and self.route_waypoints(arrow):
+                    self.refresh_arrow(arrow)
+            
+    def erase_shape(self, shape: FlowchartShape):
+        if shape.canvas_id is not None:
+            self.canvas.delete(shape.canvas_id)
+        if shape.text_id is not None:
+            self.canvas.delete(shape.text_id)
+        shape.canvas_id = None
+        shape.text_id = None
+        self.realized_shapes.discard(shape)
                 
     def draw_arrow(self, arrow: FlowchartArrow):
-        arrow.canvas_ids = self.draw_arrow_on_canvas(arrow.arrow_type, arrow.start_x, arrow.start_y, arrow.end_x, arrow.end_y)
+        arrow.canvas_ids = self.draw_arrow_on_canvas(arrow.arrow_type, arrow.start_x, arrow.start_y, arrow.end_x, arrow.end_y,
+                                                     waypoints=arrow.waypoints)
+        self.realized_arrows.add(arrow)
+        if arrow is self.selected_arrow:
+            self.style_arrow(arrow)
+        
+    def realize_arrow(self, arrow: FlowchartArrow):
+        """Draw an arrow out of order, below the realized arrows that sit above it."""
+        self.draw_arrow(arrow)
+        above = [other for other in self.arrow_index.query_rect(*arrow.bounds())
+                 if other.canvas_ids and other.z > arrow.z]
+        if above:
+            lowest = min(above, key=lambda other: other.z)
+            for item in arrow.canvas_ids:
+                self.canvas.tag_lower(item, lowest.canvas_ids[0])
+                
+    def refresh_arrow(self, arrow: FlowchartArrow):
+        """Bring an arrow's index entries and canvas items up to date after its ends moved."""
+        self.arrow_index.update(arrow, arrow.bounds())
+        self.index_segments(arrow)
+        self.grow_scrollregion(arrow.bounds())
+        if arrow.canvas_ids:
+            lines = arrow_lines(arrow.arrow_type, arrow.start_x, arrow.start_y, arrow.end_x, arrow.end_y, arrow.waypoints)
+            if len(lines) == len(arrow.canvas_ids):
+                for item, points in zip(arrow.canvas_ids, lines):
+                    self.canvas.coords(item, self.to_view(points))
+                return
+            self.erase_arrow(arrow)
+        if self.is_visible(arrow.bounds()):
+            self.realize_arrow(arrow)
+        
+    def erase_arrow(self, arrow: FlowchartArrow):
+        for item in arrow.canvas_ids:
+            self.canvas.delete(item)
+        arrow.canvas_ids = []
+        self.realized_arrows.discard(arrow)
+        
+    def to_view(self, points) -> List[float]:
+        """Document coordinates to canvas coordinates."""
+        zoom = self.zoom
+        if zoom == 1.0:
+            return points
+        return [v * zoom for v in points]
+        
+    def event_point(self, event) -> Tuple[float, float]:
+        """The document point under a pointer event."""
+        return self.canvas.canvasx(event.x) / self.zoom, self.canvas.canvasy(event.y) / self.zoom
+        
+    def label_font(self):
+        return ('Arial', max(1, round(LABEL_FONT_SIZE * self.zoom)))
+        
+    def set_zoom(self, zoom: float, x=None, y=None):
+        """Zoom about a window point (its centre by default), keeping the document point under it in place.
+        
+        The items already drawn are rescaled by a single canvas.scale;
+        only the level-of-detail rules the zoom crossed touch items one by one.
+        """
+        zoom = min(MAX_ZOOM, max(MIN_ZOOM, zoom))
+        if zoom == self.zoom:
+            return
+        if x is None:
+            x, y = self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2
+        doc_x, doc_y = self.canvas.canvasx(x) / self.zoom, self.canvas.canvasy(y) / self.zoom
+        old_zoom, self.zoom = self.zoom, zoom
+        self.canvas.scale('all', 0, 0, zoom / old_zoom, zoom / old_zoom)
+        self.canvas.configure(scrollregion=self.to_view(self.scrollregion))
+        self.scroll_to(doc_x, doc_y, x, y)
+        if zoom > old_zoom:
+            # Fewer items stay in view; drop the rest before the detail pass visits them
+            self.update_viewport()
+            self.update_detail(old_zoom)
+        else:
+            self.update_detail(old_zoom)
+            self.schedule_viewport_update()
+        self.status_var.set(f"Zoom {zoom:.0%}")
+        
+    def scroll_to(self, doc_x, doc_y, x, y):
+        """Scroll so the document point (doc_x, doc_y) sits at window point (x, y)."""
+        rx1, ry1, rx2, ry2 = self.to_view(self.scrollregion)
+        self.canvas.xview_moveto((doc_x * self.zoom - x - rx1) / (rx2 - rx1))
+        self.canvas.yview_moveto((doc_y * self.zoom - y - ry1) / (ry2 - ry1))
+        
+    def zoom_to_fit(self, event=None):
+        """Zoom and scroll so the whole diagram is in view."""
+        items = self.document.shapes() + self.document.arrows()
+        if not items:
+            self.set_zoom(1.0)
+            return
+        x1, y1, x2, y2 = group_bounds(items)
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        self.set_zoom(min((width - 2 * FIT_MARGIN) / max(x2 - x1, 1), (height - 2 * FIT_MARGIN) / max(y2 - y1, 1)))
+        self.scroll_to((x1 + x2) / 2, (y1 + y2) / 2, width / 2, height / 2)
+        self.schedule_viewport_update()
+        
+    def update_detail(self, old_zoom: float):
+        """Apply the level-of-detail changes between old_zoom and the current zoom to the drawn items."""
+        zoom = self.zoom
+        for shape in self.realized_shapes:
+            if shape.shape_type in SIMPLIFIED_SHAPES:
+                size = min(shape.width, shape.height)
+                if (size * old_zoom < DETAIL_MIN_SIZE) != (size * zoom < DETAIL_MIN_SIZE):
+                    kind, points = self.view_outline(shape.shape_type, shape.x, shape.y, shape.width, shape.height)
+                    self.canvas.coords(shape.canvas_id, points)
+                    
+        if (old_zoom >= LABEL_MIN_ZOOM) != (zoom >= LABEL_MIN_ZOOM):
+            # Creates or drops each label as the new zoom calls for
+            for shape in self.realized_shapes:
+                self.update_shape_text(shape)
+        elif zoom >= LABEL_MIN_ZOOM:
+            self.canvas.itemconfig(LABEL_TAG, font=self.label_font())
+            
+        if (old_zoom >= ARROWHEAD_MIN_ZOOM) != (zoom >= ARROWHEAD_MIN_ZOOM):
+            for arrow in self.realized_arrows:
+                head = arrow_style(arrow.arrow_type)['arrow'] if zoom >= ARROWHEAD_MIN_ZOOM else 'none'
+                for item in arrow.canvas_ids:
+                    self.canvas.itemconfig(item, arrow=head)
+        
+    def on_xscroll(self, *args):
+        self.canvas.xview(*args)
+        self.schedule_viewport_update()
+        
+    def on_yscroll(self, *args):
+        self.canvas.yview(*args)
+        self.schedule_viewport_update()
+        
+    def schedule_viewport_update(self, event=None):
+        # Scroll and resize events arrive in bursts; handle them once when idle
+        if self.virtualized and self.viewport_job is None:
+            self.viewport_job = self.canvas.after_idle(self.update_viewport)
+            
+    def visible_area(self) -> Tuple[float, float, float, float]:
+        """The document area in view, plus VIEWPORT_MARGIN screen pixels around it."""
+        left = self.canvas.canvasx(0)
+        top = self.canvas.canvasy(0)
+        right = self.canvas.canvasx(self.canvas.winfo_width())
+        bottom = self.canvas.canvasy(self.canvas.winfo_height())
+        zoom = self.zoom
+        return ((left - VIEWPORT_MARGIN) / zoom, (top - VIEWPORT_MARGIN) / zoom,
+                (right + VIEWPORT_MARGIN) / zoom, (bottom + VIEWPORT_MARGIN) / zoom)
+                
+    def is_visible(self, bounds) -> bool:
+        if not self.virtualized:
+            return True
+        x1, y1, x2, y2 = bounds
+        vx1, vy1, vx2, vy2 = self.viewport
+        return x1 <= vx2 and x2 >= vx1 and y1 <= vy2 and y2 >= vy1
+        
+    def update_viewport(self):
+        """Create items that scrolled into view and drop the ones that left it."""
+        self.viewport_job = None
+        if not self.virtualized:
+            return
+        self.viewport = self.visible_area()
+        
+        visible_shapes = self.shape_index.query_rect(*self.viewport)
+        for shape in self.realized_shapes - visible_shapes:
+            self.erase_shape(shape)
+        entering = visible_shapes - self.realized_shapes
+        for shape in sorted(entering, key=lambda shape: shape.z):
+            self.realize_shape(shape)
+            
+        visible_arrows = self.arrow_index.query_rect(*self.viewport)
+        for arrow in self.realized_arrows - visible_arrows:
+            self.erase_arrow(arrow)
+        for arrow in sorted(visible_arrows - self.realized_arrows, key=lambda arrow: arrow.z):
+            self.draw_arrow(arrow)
+            
+    def grow_scrollregion(self, bounds):
+        x1, y1, x2, y2 = bounds
+        rx1, ry1, rx2, ry2 = self.scrollregion
+        if x1 < rx1 or y1 < ry1 or x2 > rx2 or y2 > ry2:
+            pad = SCROLLREGION_PAD
+            self.scrollregion = (min(rx1, x1 - pad), min(ry1, y1 - pad), max(rx2, x2 + pad), max(ry2, y2 + pad))
+            self.canvas.configure(scrollregion=self.to_view(self.scrollregion))
+            
+    def fit_scrollregion(self):
+        """Recompute the scrollregion from the whole document's bounding box."""
+        self.scrollregion = MIN_SCROLLREGION
+        items = self.document.shapes() + self.document.arrows()
+        if items:
+            all_bounds = [item.bounds() for item in items]
+            self.grow_scrollregion((min(b[0] for b in all_bounds), min(b[1] for b in all_bounds),
+                                    max(b[2] for b in all_bounds), max(b[3] for b in all_bounds)))
+        self.canvas.configure(scrollregion=self.to_view(self.scrollregion))
             
     def get_shape_at_position(self, x, y) -> Optional[FlowchartShape]:
-        for shape in reversed(self.shapes):
-            if (shape.x <= x <= shape.x + shape.width and 
-                shape.y <= y <= shape.y + shape.height):
+        # The grid hands back bounding-box candidates topmost first
+        for shape in self.shape_index.query_point(x, y):
+            if shape.contains_point(x, y):
                 return shape
         return None
         
-    def select_shape(self, shape):
-        self.selected_shape = shape
-        self.redraw_canvas()
+    def index_segments(self, arrow: FlowchartArrow):
+        self.segment_index.set(arrow, connector_polylines(arrow.arrow_type, arrow.start_x, arrow.start_y,
+                                                          arrow.end_x, arrow.end_y, arrow.waypoints, PICK_SPLINE_STEPS))
         
-    def deselect_all(self):
+    def arrow_at_position(self, x, y) -> Optional[FlowchartArrow]:
+        """The connector passing closest to a point, within PICK_TOLERANCE screen pixels."""
+        hit = self.segment_index.nearest(x, y, PICK_TOLERANCE / self.zoom)
+        return hit[0] if hit is not None else None
+        
+    def arrow_end_near(self, arrow: FlowchartArrow, x, y) -> Optional[str]:
+        """Which end of an arrow ('source' or 'target') a point is on, if either."""
+        reach = 2 * PICK_TOLERANCE / self.zoom
+        distances = [(abs(arrow.start_x - x) + abs(arrow.start_y - y), 'source'),
+                     (abs(arrow.end_x - x) + abs(arrow.end_y - y), 'target')]
+        distance, end = min(distances)
+        return end if distance <= reach else None
+        
+    def rebuild_shape_index(self):
+        self.shape_index.clear()
+        for shape in self.document.shapes():
+            self.shape_index.insert(shape, shape.bounds(), shape.z)
+        self.text_index.rebuild((shape, shape.text) for shape in self.document.shapes())
+        self.router.clear()
+        self.arrow_index.clear()
+        self.segment_index.clear()
+        for arrow in self.document.arrows():
+            self.route_waypoints(arrow)
+            self.arrow_index.insert(arrow, arrow.bounds(), arrow.z)
+            self.index_segments(arrow)
+        
+    def add_shape(self, shape: FlowchartShape):
+        self.document.add_shape(shape)
+        self.shape_index.insert(shape, shape.bounds(), shape.z)
+        self.text_index.set(shape, shape.text)
+        self.grow_scrollregion(shape.bounds())
+        
+        # Re-inserted shapes go back underneath the shapes that were above them
+        if self.is_visible(shape.bounds()):
+            self.realize_shape(shape)
+        self.obstacles_changed(shape.bounds())
+        if self.autosave:
+            self.autosave.add_shape(shape)
+            
+    def move_arrow_end(self, arrow: FlowchartArrow, end: str, x, y):
+        """Drag one end of an arrow to a point, freeing it from the shape it was attached to."""
+        self.document.attach(arrow, end, None)
+        if end == 'source':
+            arrow.start_x, arrow.start_y = x, y
+        else:
+            arrow.end_x, arrow.end_y = x, y
+        # The other end may float round to a different side of its shape
+        self.document.route_arrow(arrow)
+        self.route_waypoints(arrow)
+        self.refresh_arrow(arrow)
+        
+    def set_arrow_ends(self, arrow: FlowchartArrow, ends):
+        """Put an arrow's ends and bindings back to an arrow_ends() record."""
+        (arrow.start_x, arrow.start_y, arrow.end_x, arrow.end_y,
+         source_id, source_port, target_id, target_port) = ends
+        self.document.attach(arrow, 'source', self.document.shape(source_id), source_port)
+        self.document.attach(arrow, 'target', self.document.shape(target_id), target_port)
+        self.document.route_arrow(arrow)
+        self.route_waypoints(arrow)
+        self.refresh_arrow(arrow)
+        if self.autosave:
+            # Recording the arrow again replaces the journaled copy
+            self.autosave.add_arrow(arrow)
+                    
+    def remove_shape(self, shape: FlowchartShape):
+        if shape in self.selection:
+            self.set_selection(self.selection - {shape})
+        self.erase_shape(shape)
+        self.shape_index.remove(shape)
+        self.text_index.remove(shape)
+        self.document.remove_shape(shape)
+        self.obstacles_changed(shape.bounds())
+        if self.autosave:
+            self.autosave.remove_shape(shape)
+        
+    def add_arrow(self, arrow: FlowchartArrow):
+        self.document.add_arrow(arrow)
+        # Attached shapes may have moved while the arrow was out of the document
+        self.document.route_arrow(arrow)
+        self.route_waypoints(arrow)
+        self.arrow_index.insert(arrow, arrow.bounds(), arrow.z)
+        self.index_segments(arrow)
+        self.grow_scrollregion(arrow.bounds())
+        if self.is_visible(arrow.bounds()):
+            self.realize_arrow(arrow)
+        if self.autosave:
+            self.autosave.add_arrow(arrow)
+            
+    def attach_ends(self, arrow: FlowchartArrow, ends=('source', 'target')):
+        """Attach each free end of an arrow to the shape it was dropped on, at the nearest port."""
+        attach_ends(self.document, self.shape_index, arrow, ends)
+                    
+    def remove_arrow(self, arrow: FlowchartArrow):
+        if arrow is self.selected_arrow:
+            self.selected_arrow = None
+            self.dragging_end = None
+        self.router.forget(arrow.id)
+        self.erase_arrow(arrow)
+        self.arrow_index.remove(arrow)
+        self.segment_index.remove(arrow)
+        self.document.remove_arrow(arrow)
+        if self.autosave:
+            self.autosave.remove_arrow(arrow)
+        
+    def set_shape_text(self, shape: FlowchartShape, text: str):
+        shape.text = text
+        self.text_index.set(shape, text)
+        self.update_shape_text(shape)
+        if self.autosave:
+            self.autosave.set_text(shape)
+        
+    def replace_document(self, document: FlowchartDocument):
+        self.document = document
         self.selected_shape = None
+        self.selection = set()
+        self.selected_arrow = None
+        self.dragging_end = None
+        self.flagged = {}
+        if self.autosave:
+            self.autosave.reset(document)
+        self.rebuild_shape_index()
+        self.fit_scrollregion()
         self.redraw_canvas()
+        self.document_changed()
+        
+    def set_selection(self, shapes, primary: Optional[FlowchartShape] = None):
+        """Make exactly these shapes the selection, restyling only the ones that changed."""
+        shapes = set(shapes)
+        if shapes and self.selected_arrow is not None:
+            self.select_arrow(None)
+        changed = self.selection ^ shapes
+        self.selection = shapes
+        if primary is None and self.selected_shape in shapes:
+            primary = self.selected_shape
+        if primary is None and shapes:
+            primary = max(shapes, key=lambda shape: shape.z)
+        self.selected_shape = primary
+        for shape in changed:
+            self.style_shape(shape)
+            
+    def select_arrow(self, arrow: Optional[FlowchartArrow]):
+        """Select one arrow (None for none); arrows and shapes are never selected together."""
+        previous = self.selected_arrow
+        if arrow is not None:
+            self.deselect_all()
+        self.selected_arrow = arrow
+        if previous is not None and previous is not arrow:
+            self.style_arrow(previous)
+        if arrow is not None:
+            self.style_arrow(arrow)
+            self.status_var.set("Connector selected - drag an end to reconnect it, Del deletes it")
+            
+    def style_arrow(self, arrow: FlowchartArrow):
+        color = 'blue' if arrow is self.selected_arrow else 'black'
+        for item in arrow.canvas_ids:
+            self.canvas.itemconfig(item, fill=color)
+            
+    def select_shape(self, shape):
+        self.set_selection((shape,), shape)
+        
+    def deselect_all(self):
+        self.set_selection(())
+        
+    def select_all(self, event=None):
+        self.set_selection(self.document.shapes())
+        self.status_var.set(f"Selected {len(self.selection)} shapes")
+        
+    def select_area(self, x1, y1, x2, y2):
+        """Add the shapes lying wholly inside a rubber band to the selection."""
+        left, right = min(x1, x2), max(x1, x2)
+        top, bottom = min(y1, y2), max(y1, y2)
+        enclosed = [shape for shape in self.shape_index.query_rect(left, top, right, bottom)
+                    if left <= shape.x and shape.x + shape.width <= right
+                    and top <= shape.y and shape.y + shape.height <= bottom]
+        if enclosed:
+            self.set_selection(self.selection | set(enclosed))
+            self.status_var.set(f"Selected {len(self.selection)} shapes")
         
     def redraw_canvas(self):
+        # Forget the ids of everything currently drawn before wiping the canvas
+        for shape in self.realized_shapes:
+            shape.canvas_id = None
+            shape.text_id = None
+        for arrow in self.realized_arrows:
+            arrow.canvas_ids = []
         self.canvas.delete("all")
         
+        # Recreate the layer marker so new shapes slot in underneath the arrows
+        self.arrow_layer = self.canvas.create_line(0, 0, 0, 0, state='hidden')
+        self.realized_shapes.clear()
+        self.realized_arrows.clear()
+        
+        if self.virtualized:
+            # Only build items near the viewport, still in stacking order
+            self.viewport = self.visible_area()
+            shapes = sorted(self.shape_index.query_rect(*self.viewport), key=lambda shape: shape.z)
+            arrows = sorted(self.arrow_index.query_rect(*self.viewport), key=lambda arrow: arrow.z)
+        else:
+            shapes, arrows = self.document.shapes(), self.document.arrows()
+            
         # Draw all shapes
-        for shape in self.shapes:
+        for shape in shapes:
             self.draw_shape(shape)
             
         # Draw all arrows
-        for arrow in self.arrows:
+        for arrow in arrows:
             self.draw_arrow(arrow)
             
     def add_text_to_selected(self):
@@ -488,134 +1617,438 @@ class FlowchartMaker:
         current_text = shape.text if shape.text else ""
         new_text = simpledialog.askstring("Edit Text", "Enter text for shape:", initialvalue=current_text)
         
-        if new_text is not None:
-            shape.text = new_text
-            self.redraw_canvas()
-            self.save_state()
+        if new_text is not None and new_text != shape.text:
+            command = EditTextCommand(shape, shape.text, new_text)
+            self.set_shape_text(shape, new_text)
+            self.save_state(command)
             
-    def delete_selected(self):
-        if not self.selected_shape:
-            messagebox.showwarning("No Selection", "Please select a shape first")
+    def delete_selected(self, event=None):
+        if self.selected_arrow is not None:
+            command = DeleteArrowCommand(self.selected_arrow)
+            command.apply(self)
+            self.save_state(command)
+            self.status_var.set("Connector deleted")
+            return
+        if not self.selection:
+            if event is None:
+                messagebox.showwarning("No Selection", "Please select a shape first")
             return
             
-        self.shapes.remove(self.selected_shape)
-        self.selected_shape = None
-        self.redraw_canvas()
-        self.save_state()
-        self.status_var.set("Shape deleted")
+        # Each shape takes the connectors still attached when its turn comes,
+        # so a connector between two selected shapes is deleted exactly once
+        commands = []
+        for shape in sorted(self.selection, key=lambda shape: shape.z):
+            command = DeleteShapeCommand(shape, self.document.incident_arrows(shape.id))
+            command.apply(self)
+            commands.append(command)
+        self.save_state(commands[0] if len(commands) == 1 else GroupCommand(commands))
+        self.status_var.set("Shape deleted" if len(commands) == 1 else f"{len(commands)} shapes deleted")
         
-    def save_state(self):
-        state = {
-            'shapes': [shape.to_dict() for shape in self.shapes],
-            'arrows': [arrow.to_dict() for arrow in self.arrows]
+    def copy_selected(self, event=None):
+        """Copy the selected shapes, and the connectors running between them, to the clipboard."""
+        if not self.selection:
+            return
+        ids = {shape.id for shape in self.selection}
+        arrows = {arrow.id: arrow for shape in self.selection for arrow in self.document.incident_arrows(shape.id)
+                  if arrow.source_id in ids and arrow.target_id in ids}
+        self.clipboard = {
+            'shapes': [shape.to_dict() for shape in sorted(self.selection, key=lambda shape: shape.z)],
+            'arrows': [arrow.to_dict() for arrow in sorted(arrows.values(), key=lambda arrow: arrow.z)],
         }
+        self.paste_count = 0
+        self.status_var.set(f"Copied {len(ids)} shapes")
+        
+    def paste(self, event=None):
+        """Add a copy of the clipboard, offset from the last one, and select it."""
+        if not self.clipboard:
+            return
+        self.cancel_load()
+        self.paste_count += 1
+        offset = PASTE_OFFSET * self.paste_count
+        commands = []
+        copies = {}
+        for data in self.clipboard['shapes']:
+            shape = FlowchartShape.from_dict(dict(data, id=None))
+            shape.x += offset
+            shape.y += offset
+            copies[data['id']] = shape
+            commands.append(AddShapeCommand(shape))
+        for data in self.clipboard['arrows']:
+            arrow = FlowchartArrow.from_dict(dict(data, id=None))
+            commands.append(AddArrowCommand(arrow))
+        # The copies only get ids as they are added; point the arrows at them then
+        for command in commands:
+            if isinstance(command, AddArrowCommand):
+                arrow = command.arrow
+                arrow.source_id = copies[arrow.source_id].id
+                arrow.target_id = copies[arrow.target_id].id
+            command.apply(self)
+        self.save_state(GroupCommand(commands))
+        self.set_selection(copies.values())
+        self.status_var.set(f"Pasted {len(copies)} shapes")
+        
+    def align_selected(self, edge: str):
+        """Line the selected shapes up on one edge or centre line of their bounding box."""
+        if len(self.selection) < 2:
+            self.status_var.set("Select at least two shapes to align")
+            return
+        left, top, right, bottom = group_bounds(self.selection)
+        moves = {}
+        for shape in self.selection:
+            x, y = shape.x, shape.y
+            if edge == 'left':
+                x = left
+            elif edge == 'center':
+                x = (left + right - shape.width) / 2
+            elif edge == 'right':
+                x = right - shape.width
+            elif edge == 'top':
+                y = top
+            elif edge == 'middle':
+                y = (top + bottom - shape.height) / 2
+            elif edge == 'bottom':
+                y = bottom - shape.height
+            else:
+                raise ValueError(f"Unknown alignment {edge!r}")
+            if (x, y) != (shape.x, shape.y):
+                moves[shape] = (x, y)
+        if not moves:
+            self.status_var.set("Already aligned")
+            return
+        command = MoveShapesCommand({shape: (shape.x, shape.y) for shape in moves}, moves)
+        command.apply(self)
+        self.save_state(command)
+        self.status_var.set(f"Aligned {len(self.selection)} shapes ({edge})")
+        
+    def auto_layout(self):
+        # Loaded on first use: it brings NumPy in, which would slow every startup
+        from flowchart.layout import layered_layout
+        self.cancel_load()
+        positions = layered_layout(self.document)
+        moves = {}
+        for shape in self.document.shapes():
+            if positions[shape.id] != (shape.x, shape.y):
+                moves[shape] = positions[shape.id]
+        if not moves:
+            self.status_var.set("Nothing to lay out")
+            return
+        command = MoveShapesCommand({shape: (shape.x, shape.y) for shape in moves}, moves)
+        command.apply(self)
+        self.save_state(command)
+        self.status_var.set(f"Laid out {len(moves)} shapes")
+        
+    def toggle_instrumentation(self, event=None):
+        instrumentation = self.instrumentation
+        if instrumentation.enabled:
+            instrumentation.disable()
+            if self.overlay_job is not None:
+                self.root.after_cancel(self.overlay_job)
+                self.overlay_job = None
+            self.perf_var.set("")
+            self.status_var.set("Performance overlay off")
+        else:
+            instrumentation.enable()
+            self.update_overlay()
+            self.status_var.set("Performance overlay on - Shift+F12 saves the stats")
+        self.bind_canvas_events()
         
-        # Remove future history if we're not at the end
-        if self.history_index < len(self.history) - 1:
-            self.history = self.history[:self.history_index + 1]
+    def update_overlay(self):
+        self.perf_var.set(self.instrumentation.overlay_text())
+        self.overlay_job = self.root.after(OVERLAY_INTERVAL_MS, self.update_overlay)
+        
+    def dump_stats(self, event=None):
+        filename = filedialog.asksaveasfilename(
+            defaultextension=".json",
+            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+        )
+        
+        if filename:
+            try:
+                self.instrumentation.dump(filename)
+                self.status_var.set(f"Performance stats saved to {filename}")
+            except OSError as e:
+                messagebox.showerror("Error", f"Failed to save stats: {str(e)}")
+                
+    def document_changed(self):
+        """Bring the views derived from the document up to date after an edit, undo or load."""
+        self.schedule_check()
+        if self.find_query:
+            self.show_find_results()
+            
+    def set_find_query(self, query: str):
+        self.find_query = query
+        total = self.show_find_results()
+        if query:
+            shown = f" (showing the first {len(self.find_results)})" if total > len(self.find_results) else ""
+            self.status_var.set(f"Find: {total} matches{shown}")
             
-        self.history.append(state)
-        self.history_index += 1
+    def find(self, query: str) -> Tuple[List[FlowchartShape], int]:
+        """The first FIND_LIMIT shapes whose label matches the query, and how many match in all."""
+        found = self.text_index.search(query)
+        return heapq.nsmallest(FIND_LIMIT, found, key=lambda shape: (shape.y, shape.x, shape.id)), len(found)
         
-        # Limit history size
-        if len(self.history) > 50:
-            self.history.pop(0)
-            self.history_index -= 1
+    def show_find_results(self) -> int:
+        """List the matches of the current query; returns how many there are in all."""
+        self.find_results, total = self.find(self.find_query) if self.find_query else ([], 0)
+        if self.find_list is not None:
+            self.find_list.delete(0, tk.END)
+            for shape in self.find_results:
+                self.find_list.insert(tk.END, " ".join(shape.text.split()))
+        return total
+        
+    def on_find_select(self, event=None):
+        chosen = self.find_list.curselection()
+        if chosen:
+            self.jump_to_result(chosen[0])
+            
+    def jump_to_result(self, index: int):
+        if index < len(self.find_results):
+            self.jump_to_shape(self.find_results[index])
+            
+    def jump_to_shape(self, shape: FlowchartShape):
+        """Scroll a shape to the middle of the view and select it."""
+        center_x, center_y = shape.x + shape.width / 2, shape.y + shape.height / 2
+        self.scroll_to(center_x, center_y, self.canvas.winfo_width() / 2, self.canvas.winfo_height() / 2)
+        self.update_viewport()
+        self.select_shape(shape)
+        
+    def toggle_checks(self, event=None):
+        if self.checking:
+            self.checking = False
+            if self.check_job is not None:
+                self.root.after_cancel(self.check_job)
+                self.check_job = None
+            self.show_issues({})
+            self.status_var.set("Flow checks off")
+        else:
+            self.checking = True
+            self.run_checks()
+            
+    def schedule_check(self):
+        # Edits come in bursts (a paste, a load); check once they settle
+        if self.checking and self.check_job is None:
+            self.check_job = self.root.after(CHECK_DELAY_MS, self.run_checks)
+            
+    def run_checks(self):
+        """Outline the shapes with problems; the checker only redoes what the graph edits since its last run can have changed."""
+        self.check_job = None
+        if not self.checking:
+            return
+        issues = self.checker.check(self.document)
+        self.show_issues(self.checker.flagged(self.document))
+        found = [f"{len(issues[issue])} {label}" for issue, label in ISSUE_LABELS.items() if issues[issue]]
+        self.status_var.set("Flow check: " + (", ".join(found) if found else "no problems found"))
+        
+    def show_issues(self, flagged: Dict[int, str]):
+        """Restyle only the shapes whose issue changed."""
+        changed = [shape_id for shape_id in flagged.keys() | self.flagged.keys()
+                   if flagged.get(shape_id) != self.flagged.get(shape_id)]
+        self.flagged = flagged
+        for shape_id in changed:
+            shape = self.document.shape(shape_id)
+            if shape is not None:
+                self.style_shape(shape)
+                
+    def select_reachable(self):
+        """Select every shape the selected ones lead to."""
+        if not self.selection:
+            messagebox.showwarning("No Selection", "Please select a shape first")
+            return
+        found = reachable(self.document, [shape.id for shape in self.selection])
+        self.set_selection([self.document.shape(shape_id) for shape_id in found], self.selected_shape)
+        self.status_var.set(f"{len(found)} shapes reachable from the selection")
+        
+    def select_path(self):
+        """Select the shortest path between two selected shapes, whichever way the arrows run."""
+        if len(self.selection) != 2:
+            messagebox.showwarning("Path", "Please select exactly two shapes")
+            return
+        first, second = self.selection
+        paths = [path for path in (shortest_path(self.document, first.id, second.id),
+                                   shortest_path(self.document, second.id, first.id)) if path is not None]
+        if not paths:
+            self.status_var.set("No path connects the selected shapes")
+            return
+        path = min(paths, key=len)
+        self.set_selection([self.document.shape(shape_id) for shape_id in path])
+        self.status_var.set(f"Shortest path: {len(path)} shapes, {len(path) - 1} arrows")
+        
+    def save_state(self, command: HistoryCommand, coalesce: bool = False):
+        self.history.record(command, coalesce)
+        self.document_changed()
             
     def undo(self):
-        if self.history_index > 0:
-            self.history_index -= 1
-            self.restore_state(self.history[self.history_index])
+        self.cancel_load()
+        if self.history.undo(self):
             self.status_var.set("Undone")
+            self.document_changed()
         else:
             self.status_var.set("Nothing to undo")
             
     def redo(self):
-        if self.history_index < len(self.history) - 1:
-            self.history_index += 1
-            self.restore_state(self.history[self.history_index])
+        self.cancel_load()
+        if self.history.redo(self):
             self.status_var.set("Redone")
+            self.document_changed()
         else:
             self.status_var.set("Nothing to redo")
             
-    def restore_state(self, state):
-        # Clear current state
-        self.shapes.clear()
-        self.arrows.clear()
-        self.selected_shape = None
-        
-        # Restore shapes
-        for shape_data in state['shapes']:
-            shape = FlowchartShape.from_dict(shape_data)
-            self.shapes.append(shape)
-            
-        # Restore arrows
-        for arrow_data in state['arrows']:
-            arrow = FlowchartArrow.from_dict(arrow_data)
-            self.arrows.append(arrow)
-            
-        self.redraw_canvas()
-        
     def save_file(self):
         filename = filedialog.asksaveasfilename(
             defaultextension=".json",
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("JSON files", "*.json"), ("Binary flowchart", "*.fcb"), ("All files", "*.*")]
         )
         
         if filename:
             try:
-                data = {
-                    'shapes': [shape.to_dict() for shape in self.shapes],
-                    'arrows': [arrow.to_dict() for arrow in self.arrows]
-                }
-                
-                with open(filename, 'w') as f:
-                    json.dump(data, f, indent=2)
-                    
-                self.status_var.set(f"Saved to {filename}")
-                
+                self.save_to(filename)
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save file: {str(e)}")
                 
+    def save_to(self, filename: str):
+        save_document(self.document, filename)
+        self.status_var.set(f"Saved to {filename}")
+                
     def load_file(self):
         filename = filedialog.askopenfilename(
-            filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
+            filetypes=[("Flowcharts", "*.json *.fcb"), ("JSON files", "*.json"), ("Binary flowchart", "*.fcb"),
+                       ("Graphviz DOT", "*.dot *.gv"), ("Mermaid", "*.mmd *.mermaid"), ("All files", "*.*")]
         )
         
-        if filename:
+        if not filename:
+            return
+        if filename.lower().endswith(IMPORT_EXTENSIONS):
+            self.import_diagram(filename)
+        else:
+            self.start_load(filename)
+            
+    def import_diagram(self, filename: str):
+        """Replace the diagram with a laid out DOT or Mermaid file, as one undoable step."""
+        self.cancel_load()
+        try:
+            document, skipped = import_file(filename)
+        except (OSError, UnicodeDecodeError, ValueError) as e:
+            messagebox.showerror("Error", f"Failed to import file: {str(e)}")
+            return
+        self.save_state(ReplaceDocumentCommand(self.document, document))
+        self.replace_document(document)
+        imported = f"{document.shape_count()} shapes, {document.arrow_count()} arrows"
+        if skipped:
+            imported += f", skipped {skipped} unreadable statements"
+        self.status_var.set(f"Imported {filename} ({imported})")
+            
+    def start_load(self, filename: str):
+        """Stream a file into a fresh document, showing shapes as they arrive."""
+        self.cancel_load()
+        try:
+            loader = FlowchartLoader(filename)
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to load file: {str(e)}")
+            return
+            
+        self.load_previous = self.document
+        self.replace_document(FlowchartDocument())
+        self.loader = loader
+        loader.start()
+        self.root.after(LOAD_POLL_MS, self.poll_load)
+        
+    def poll_load(self):
+        loader = self.loader
+        if loader is None:
+            return
+            
+        # Apply batches for at most one frame (but at least one batch), then
+        # give the event loop a turn
+        deadline = time.perf_counter() + self.frame_budget_ms / 1000
+        while True:
             try:
-                with open(filename, 'r') as f:
-                    data = json.load(f)
-                    
-                self.clear_canvas(confirm=False)
-                
-                for shape_data in data['shapes']:
-                    shape = FlowchartShape.from_dict(shape_data)
-                    self.shapes.append(shape)
-                    
-                for arrow_data in data['arrows']:
-                    arrow = FlowchartArrow.from_dict(arrow_data)
-                    self.arrows.append(arrow)
-                        
-                self.redraw_canvas()
-                self.save_state()
-                self.status_var.set(f"Loaded from {filename}")
+                kind, payload = loader.queue.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'shapes':
+                for shape in payload:
+                    self.add_shape(shape)
+                loader.shapes_loaded += len(payload)
+            elif kind in ('arrows', 'legacy_arrows'):
+                for arrow in payload:
+                    if kind == 'legacy_arrows':
+                        # Older files only kept coordinates; reattach ends that touch a shape
+                        self.attach_ends(arrow)
+                    self.add_arrow(arrow)
+                loader.arrows_loaded += len(payload)
+            else:
+                self.finish_load(error=payload if kind == 'error' else None)
+                return
+            if time.perf_counter() >= deadline:
+                break
                 
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load file: {str(e)}")
+        self.status_var.set(f"Loading {os.path.basename(loader.filename)}: {loader.progress():.0%} "
+                            f"({loader.shapes_loaded} shapes, {loader.arrows_loaded} arrows) - Esc to cancel")
+        self.root.after(LOAD_POLL_MS, self.poll_load)
+        
+    def cancel_load(self, event=None):
+        if self.loader is not None:
+            self.loader.cancel()
+            self.finish_load(cancelled=True)
+            
+    def finish_load(self, error: Optional[str] = None, cancelled: bool = False):
+        loader = self.loader
+        self.loader = None
+        
+        # Whatever made it in becomes one undoable step
+        self.save_state(ReplaceDocumentCommand(self.load_previous, self.document))
+        self.load_previous = None
+        
+        loaded = f"{loader.shapes_loaded} shapes, {loader.arrows_loaded} arrows"
+        if loader.skipped:
+            loaded += f", skipped {loader.skipped} invalid entries"
+        if error is not None:
+            self.status_var.set(f"Load of {loader.filename} failed ({loaded})")
+            messagebox.showerror("Error", f"Failed to load file: {error}\n\nKept what was read before the problem ({loaded}).")
+        elif cancelled:
+            self.status_var.set(f"Load of {loader.filename} cancelled ({loaded})")
+        else:
+            self.status_var.set(f"Loaded from {loader.filename} ({loaded})")
                 
+    def offer_recovery(self):
+        """Offer back the diagram a crashed session left in the autosave journal, then start journaling."""
+        if self.autosave is None:
+            return
+        try:
+            recovered = self.autosave.recover()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            recovered = None
+            self.status_var.set(f"Could not read the autosave journal: {e}")
+        if recovered and messagebox.askyesno(
+                "Recover Diagram",
+                f"The last session ended unexpectedly. Recover its diagram "
+                f"({recovered.shape_count()} shapes, {recovered.arrow_count()} arrows)?"):
+            self.save_state(ReplaceDocumentCommand(self.document, recovered))
+            self.replace_document(recovered)
+            self.status_var.set("Recovered the diagram from the last session")
+        self.autosave.start(self.document)
+        
+    def quit(self):
+        self.cancel_load()
+        # A clean exit leaves nothing to recover
+        if self.autosave:
+            self.autosave.close(discard=True)
+        self.root.destroy()
+        
     def clear_canvas(self, confirm=True):
-        if not confirm or not (self.shapes or self.arrows) or messagebox.askyesno("Clear Canvas", "Are you sure you want to clear everything?"):
-            self.shapes.clear()
-            self.arrows.clear()
-            self.selected_shape = None
-            self.redraw_canvas()
-            self.save_state()
+        self.cancel_load()
+        if not confirm or not self.document or messagebox.askyesno("Clear Canvas", "Are you sure you want to clear everything?"):
+            document = FlowchartDocument()
+            command = ReplaceDocumentCommand(self.document, document)
+            self.replace_document(document)
+            self.save_state(command)
             self.status_var.set("Canvas cleared")
 
 def main():
     root = tk.Tk()
-    app = FlowchartMaker(root)
+    app = FlowchartMaker(root, autosave_dir=default_autosave_dir())
+    root.protocol("WM_DELETE_WINDOW", app.quit)
+    root.after_idle(app.offer_recovery)
     root.mainloop()
 
 if __name__ == "__main__":
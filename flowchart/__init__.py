@@ -0,0 +1,65 @@
+"""Headless flowchart core: the document model, file formats and geometry.
+
+Nothing in this package imports Tk, so scripts can load, query, transform
+and save flowcharts without a display, and importing it stays cheap:
+NumPy and the heavier submodules load only when they are used.
+
+    from flowchart import FlowchartDocument, FlowchartShape, read_document, save_document
+    
+    document, skipped = read_document('diagram.fcb')
+    for shape in document.shapes():
+        shape.x += 100
+    save_document(document, 'moved.json')
+
+The names below make up the supported API. Each loads its submodule the
+first time it is used, and the submodules can be imported directly:
+
+- flowchart.model: FlowchartShape, FlowchartArrow, FlowchartDocument
+- flowchart.fileformat: read_document, save_document, streamed JSON and
+  the binary .fcb container
+- flowchart.geometry: outlines, ports, connector paths, spatial indexes
+- flowchart.layout: layered_layout, the automatic layout
+- flowchart.routing: orthogonal connector routing
+- flowchart.analysis: reachability, dead ends, cycles, shortest paths
+- flowchart.search: TextIndex, the word and prefix index behind Find
+- flowchart.importers: import_file, Graphviz DOT and Mermaid flowcharts
+  laid out automatically
+- flowchart.raster: render_png, tiled and streamed PNG output for
+  images of any size
+
+main() starts the editor, and only then is the GUI (and Tk) loaded.
+"""
+import importlib
+
+# Public name -> the submodule defining it. Looked up on first access
+# (PEP 562), so importing the package itself loads none of them.
+_EXPORTS = {
+    'ARROW_TYPES': 'geometry',
+    'PORTS': 'geometry',
+    'SHAPE_TYPES': 'geometry',
+    'FlowchartArrow': 'model',
+    'FlowchartDocument': 'model',
+    'FlowchartShape': 'model',
+    'import_file': 'importers',
+    'read_document': 'fileformat',
+    'render_png': 'raster',
+    'save_document': 'fileformat',
+}
+
+__all__ = sorted(_EXPORTS) + ['main']
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return __all__
+
+def main():
+    """Run the editor."""
+    from fl import main as run_editor
+    run_editor()
+    
\ No newline at end of file
@@ -0,0 +1,3 @@
+from flowchart import main
+
+main()
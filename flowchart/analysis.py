@@ -0,0 +1,439 @@
+"""Graph queries over a flowchart: reachability, dead ends, cycles, paths and decisions.
+
+Shapes are the nodes and arrows bound at both ends are the edges, read
+straight from the successor and predecessor counts the document keeps up
+to date on every edit. Nothing is rebuilt per query, and each query only
+costs the part of the graph it visits. Bindings to shapes that are not
+in the document are ignored. Tk-free like the layout code; GraphChecker
+runs the whole set of checks once per document revision, which is what
+lets the editor re-check after every edit.
+"""
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+TERMINAL_SHAPE = 'oval'       # Start and end terminators
+DECISION_SHAPE = 'diamond'
+MIN_DECISION_BRANCHES = 2
+
+# Check names, most serious first
+ISSUES = ('unreachable', 'dead_end', 'decision', 'cycle')
+
+def _nodes(document):
+    """The document's shapes and the set of their ids, for filtering out dangling bindings."""
+    shapes = document.shapes()
+    return shapes, {shape.id for shape in shapes}
+
+def _branches(document, shape_id: int, live: Set[int]) -> int:
+    return sum(1 for target in document.successors(shape_id) if target in live)
+
+def start_shapes(document) -> List[int]:
+    """Where the flow begins: terminators nothing points at, or failing that any shape nothing points at."""
+    shapes, live = _nodes(document)
+    predecessors = document.predecessors
+    roots = [shape for shape in shapes if live.isdisjoint(predecessors(shape.id))]
+    terminals = [shape.id for shape in roots if shape.shape_type == TERMINAL_SHAPE]
+    return terminals or [shape.id for shape in roots]
+
+def reachable(document, starts: Iterable[int]) -> Set[int]:
+    """Ids of the shapes reachable from any of the start ids, the starts included."""
+    shape, successors = document.shape, document.successors
+    seen = {start for start in starts if shape(start) is not None}
+    pending = list(seen)
+    while pending:
+        for target in successors(pending.pop()):
+            if target not in seen and shape(target) is not None:
+                seen.add(target)
+                pending.append(target)
+    return seen
+
+def unreachable(document, starts: Optional[Iterable[int]] = None) -> List[int]:
+    """Ids of the shapes no path leads to from the starts (start_shapes() by default)."""
+    starts = start_shapes(document) if starts is None else list(starts)
+    if not starts:
+        return []  # Every shape is on a cycle; there is nothing to measure from
+    seen = reachable(document, starts)
+    return [shape.id for shape in document.shapes() if shape.id not in seen]
+
+def dead_ends(document) -> List[int]:
+    """Ids of the shapes other than terminators that the flow cannot leave."""
+    shapes, live = _nodes(document)
+    successors = document.successors
+    return [shape.id for shape in shapes
+            if shape.shape_type != TERMINAL_SHAPE and live.isdisjoint(successors(shape.id))]
+
+def decision_problems(document) -> List[int]:
+    """Ids of the decisions that branch to fewer than MIN_DECISION_BRANCHES distinct shapes."""
+    shapes, live = _nodes(document)
+    return [shape.id for shape in shapes
+            if shape.shape_type == DECISION_SHAPE and _branches(document, shape.id, live) < MIN_DECISION_BRANCHES]
+
+def _components(successors, roots: Iterable[int], inside) -> Iterator[List[int]]:
+    """Strongly connected components among the ids in inside, sinks first (Tarjan, without recursion)."""
+    order: Dict[int, int] = {}
+    low: Dict[int, int] = {}
+    stack: List[int] = []
+    on_stack: Set[int] = set()
+    for root in roots:
+        if root in order:
+            continue
+        order[root] = low[root] = len(order)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(successors(root)))]
+        while work:
+            node, pending = work[-1]
+            for target in pending:
+                if target not in inside:
+                    continue
+                if target not in order:
+                    order[target] = low[target] = len(order)
+                    stack.append(target)
+                    on_stack.add(target)
+                    work.append((target, iter(successors(target))))
+                    break
+                if target in on_stack and order[target] < low[node]:
+                    low[node] = order[target]
+            else:
+                work.pop()
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+                if low[node] == order[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    yield component[::-1]
+
+def _is_cycle(successors, component: List[int]) -> bool:
+    return len(component) > 1 or component[0] in successors(component[0])
+
+def cycles(document) -> List[List[int]]:
+    """The loops in the flow, as strongly connected components.
+    
+    A component counts when it has more than one shape or a shape with an
+    arrow to itself.
+    """
+    shapes, live = _nodes(document)
+    successors = document.successors
+    return [component for component in _components(successors, [shape.id for shape in shapes], live)
+            if _is_cycle(successors, component)]
+
+def shortest_path(document, source: int, target: int) -> Optional[List[int]]:
+    """The ids along a path with the fewest arrows from source to target, or None if there is none."""
+    shape = document.shape
+    if shape(source) is None or shape(target) is None:
+        return None
+    previous = {source: None}
+    pending = deque([source])
+    while pending:
+        node = pending.popleft()
+        if node == target:
+            path = []
+            while node is not None:
+                path.append(node)
+                node = previous[node]
+            return path[::-1]
+        for successor in document.successors(node):
+            if successor not in previous and shape(successor) is not None:
+                previous[successor] = node
+                pending.append(successor)
+    return None
+
+class GraphChecker:
+    """Runs every check on a document, then keeps the results up to date edit by edit.
+    
+    check() answers from the previous run while the document's revision is
+    unchanged, so edits that only move shapes or change their text cost
+    nothing. Otherwise it reads what changed from document.graph_changes()
+    and redoes only the affected part:
+    
+    - dead ends, decisions and start shapes are judged again for the shapes
+      touched and their neighbours;
+    - the reachable set grows from new arrows and starts, and is walked
+      again only when a reached shape, an arrow between reached shapes or
+      a start goes away;
+    - the strongly connected components are kept in a topological order.
+      An arrow that goes against the order searches just the components
+      between its ends, merging them if it closes a loop and reordering
+      them otherwise (Pearce and Kelly's algorithm); a component that loses
+      a shape or arrow is split by running Tarjan on its own members.
+      
+    A batch of changes large next to the graph (a load, a big paste) is
+    checked from scratch instead.
+    """
+    def __init__(self):
+        self.document = None
+        self.revision = None
+        self.issues: Dict[str, List] = {}
+        # Ordered sets of shape ids
+        self.dead_ends: Dict[int, None] = {}
+        self.decisions: Dict[int, None] = {}
+        self.unreachable: Dict[int, None] = {}
+        self.roots: Set[int] = set()
+        self.terminal_roots: Set[int] = set()
+        self.starts: Set[int] = set()
+        self.reached: Set[int] = set()
+        # Components: shape id -> component, and per component its shapes and its
+        # place in the order, which increases along every arrow between components
+        self.component: Dict[int, int] = {}
+        self.members: Dict[int, List[int]] = {}
+        self.position: Dict[int, Tuple[int, ...]] = {}
+        self.cyclic: Dict[int, None] = {}
+        self.cycles: List[List[int]] = []
+        self.cycles_changed = False
+        self.next_component = 0
+        self.first_position = -1
+        
+    def check(self, document) -> Dict[str, List]:
+        """Issue name -> shape ids (lists of ids for 'cycle'), in ISSUES order."""
+        if document is not self.document or document.revision != self.revision:
+            changes = None if document is not self.document else document.graph_changes(self.revision)
+            self.document = document
+            self.revision = document.revision
+            if changes is None or 4 * len(changes) > len(self.component):
+                self._rebuild()
+            else:
+                self._update(changes)
+            if self.cycles_changed:
+                self.cycles = [list(self.members[component]) for component in self.cyclic]
+                self.cycles_changed = False
+            self.issues = {
+                'unreachable': list(self.unreachable),
+                'dead_end': list(self.dead_ends),
+                'decision': list(self.decisions),
+                'cycle': self.cycles,
+            }
+        return self.issues
+        
+    def _rebuild(self):
+        document = self.document
+        successors, predecessors = document.successors, document.predecessors
+        shapes, live = _nodes(document)
+        found = list(_components(successors, [shape.id for shape in shapes], live))
+        found.reverse()
+        first = self.next_component
+        self.next_component += len(found)
+        self.members = dict(zip(range(first, self.next_component), found))
+        self.position = {key: (key - first,) for key in self.members}
+        self.component = {shape_id: key for key, members in self.members.items() for shape_id in members}
+        self.cyclic = dict.fromkeys(key for key, members in self.members.items()
+                                    if len(members) > 1 or members[0] in successors(members[0]))
+        self.cycles_changed = True
+        self.dead_ends = dict.fromkeys(dead_ends(document))
+        self.decisions = dict.fromkeys(decision_problems(document))
+        self.roots = {shape.id for shape in shapes if live.isdisjoint(predecessors(shape.id))}
+        self.terminal_roots = {shape.id for shape in shapes
+                               if shape.shape_type == TERMINAL_SHAPE and shape.id in self.roots}
+        self._walk()
+        
+    def _new_component(self, members: List[int], position: Tuple[int, ...]) -> int:
+        key = self.next_component
+        self.next_component += 1
+        self.members[key] = members
+        self.position[key] = position
+        for shape_id in members:
+            self.component[shape_id] = key
+        if _is_cycle(self.document.successors, members):
+            self.cyclic[key] = None
+            self.cycles_changed = True
+        return key
+        
+    def _drop_component(self, key: int):
+        del self.members[key]
+        del self.position[key]
+        if key in self.cyclic:
+            del self.cyclic[key]
+            self.cycles_changed = True
+            
+    def _judge(self, shape_id: int):
+        """Settle one shape's dead end, decision and start status from its neighbours."""
+        for table in (self.dead_ends, self.decisions):
+            table.pop(shape_id, None)
+        self.roots.discard(shape_id)
+        self.terminal_roots.discard(shape_id)
+        shape = self.document.shape(shape_id)
+        if shape is None:
+            return
+        live = self.component.keys()
+        successors = self.document.successors(shape_id)
+        if shape.shape_type != TERMINAL_SHAPE and live.isdisjoint(successors):
+            self.dead_ends[shape_id] = None
+        if shape.shape_type == DECISION_SHAPE and sum(1 for target in successors if target in live) < MIN_DECISION_BRANCHES:
+            self.decisions[shape_id] = None
+        if live.isdisjoint(self.document.predecessors(shape_id)):
+            self.roots.add(shape_id)
+            if shape.shape_type == TERMINAL_SHAPE:
+                self.terminal_roots.add(shape_id)
+                
+    def _walk(self):
+        """Find the reachable shapes again from the current starts."""
+        self.starts = set(self.terminal_roots or self.roots)
+        if not self.starts:
+            self.reached, self.unreachable = set(), {}  # Every shape is on a cycle
+            return
+        self.reached = reachable(self.document, self.starts)
+        self.unreachable = {shape.id: None for shape in self.document.shapes() if shape.id not in self.reached}
+        
+    def _update(self, changes: List[Tuple[int, Optional[int]]]):
+        document = self.document
+        successors, predecessors = document.successors, document.predecessors
+        touched_shapes = {a for a, b in changes if b is None}
+        pairs = {(a, b) for a, b in changes if b is not None}
+        removed = [shape_id for shape_id in touched_shapes
+                   if shape_id in self.component and document.shape(shape_id) is None]
+        added = [shape_id for shape_id in touched_shapes
+                 if shape_id not in self.component and document.shape(shape_id) is not None]
+        # Arrows present now but not yet placed in the order; searches ignore them until they are
+        pending = {(source, target) for source, target in pairs if target in successors(source)}
+        gone = pairs - pending
+        
+        split = set()
+        for shape_id in removed:
+            key = self.component.pop(shape_id)
+            self.members[key].remove(shape_id)
+            split.add(key)
+        for shape_id in added:
+            self._new_component([shape_id], (self.first_position,))
+            self.first_position -= 1
+            # First in the order, so only arrows into it can go against it
+            pending.update((source, shape_id) for source in predecessors(shape_id) if source in self.component)
+        for source, target in gone:
+            key = self.component.get(source)
+            if key is not None and key == self.component.get(target):
+                split.add(key)
+        touched = set()
+        for key in split:
+            touched.update(self._split(key, pending))
+        for pair in list(pending):
+            pending.discard(pair)
+            touched.update(self._insert(pair[0], pair[1], pending))
+        for key in touched:
+            if key in self.members:
+                was_cycle = key in self.cyclic
+                if _is_cycle(successors, self.members[key]):
+                    self.cyclic[key] = None
+                elif was_cycle:
+                    del self.cyclic[key]
+                self.cycles_changed |= was_cycle or key in self.cyclic
+                
+        judge = set(touched_shapes)
+        for source, target in pairs:
+            judge.add(source)
+            judge.add(target)
+        for shape_id in touched_shapes:
+            judge.update(successors(shape_id))
+            judge.update(predecessors(shape_id))
+        for shape_id in judge:
+            self._judge(shape_id)
+            
+        starts = self.terminal_roots or self.roots
+        reached = self.reached
+        if (not self.starts or not starts or not self.starts <= starts
+                or any(shape_id in reached for shape_id in removed)
+                or any(source in reached and target in reached for source, target in gone)):
+            self._walk()
+            return
+        for shape_id in removed:
+            self.unreachable.pop(shape_id, None)
+        frontier = [shape_id for shape_id in starts if shape_id not in self.starts]
+        self.starts = set(starts)
+        for shape_id in added:
+            self.unreachable[shape_id] = None
+            if not reached.isdisjoint(predecessors(shape_id)):
+                frontier.append(shape_id)
+        frontier.extend(target for source, target in pairs if source in reached and target in successors(source))
+        # Walk on from there, stopping at shapes already reached
+        work = [shape_id for shape_id in set(frontier) if shape_id not in reached and shape_id in self.component]
+        reached.update(work)
+        while work:
+            shape_id = work.pop()
+            self.unreachable.pop(shape_id, None)
+            for target in successors(shape_id):
+                if target not in reached and target in self.component:
+                    reached.add(target)
+                    work.append(target)
+                    
+    def _targets(self, shape_id: int, pending):
+        targets = self.document.successors(shape_id)
+        return [target for target in targets if (shape_id, target) not in pending] if pending else targets
+        
+    def _split(self, key: int, pending) -> List[int]:
+        """Break a component that lost a shape or an arrow into the components of what is left."""
+        members = self.members[key]
+        if not members:
+            self._drop_component(key)
+            return []
+        found = list(_components(lambda shape_id: self._targets(shape_id, pending), members, set(members)))
+        if len(found) == 1:
+            return [key]
+        position = self.position[key]
+        self._drop_component(key)
+        # Extending the position keeps the pieces between the component's neighbours
+        return [self._new_component(piece, position + (index,)) for index, piece in enumerate(reversed(found))]
+        
+    def _search(self, start: int, pending, forward: bool, bound: Tuple[int, ...]) -> Set[int]:
+        """Components reachable from start along (or against) the arrows without passing bound."""
+        neighbours = self.document.successors if forward else self.document.predecessors
+        component, members, position = self.component, self.members, self.position
+        seen = {start}
+        work = [start]
+        while work:
+            for shape_id in members[work.pop()]:
+                for other in neighbours(shape_id):
+                    key = component.get(other)
+                    if key is None or key in seen:
+                        continue
+                    if ((shape_id, other) if forward else (other, shape_id)) in pending:
+                        continue
+                    if position[key] <= bound if forward else position[key] >= bound:
+                        seen.add(key)
+                        work.append(key)
+        return seen
+        
+    def _insert(self, source: int, target: int, pending) -> List[int]:
+        """Place a new arrow in the order, merging the components it closes a loop through."""
+        source_key = self.component.get(source)
+        target_key = self.component.get(target)
+        if source_key is None or target_key is None:
+            return []
+        if source_key == target_key:
+            return [source_key]  # Possibly a new arrow to itself
+        position = self.position
+        if position[source_key] < position[target_key]:
+            return []
+        after = self._search(target_key, pending, True, position[source_key])
+        before = self._search(source_key, pending, False, position[target_key])
+        slots = sorted(position[key] for key in after | before)
+        loop = after & before
+        if loop:
+            loop |= {source_key, target_key}
+            before -= loop
+            after -= loop
+        # Whatever leads to the arrow's source takes the lowest places, whatever its
+        # target leads to the highest, and a merged loop the place in between; each
+        # group keeps its own order, so arrows from or to the rest stay in order
+        order = sorted(before, key=position.__getitem__)
+        merged = None
+        if loop:
+            members = [shape_id for key in loop for shape_id in self.members[key]]
+            for key in loop:
+                self._drop_component(key)
+            merged = self._new_component(members, slots[len(order)])
+            order.append(merged)
+        after = sorted(after, key=position.__getitem__)
+        for key, slot in zip(order + after, slots[:len(order)] + slots[len(slots) - len(after):]):
+            position[key] = slot
+        return [] if merged is None else [merged]
+        
+    def flagged(self, document) -> Dict[int, str]:
+        """Shape id -> the most serious issue it has, for highlighting."""
+        flagged = {}
+        for issue, found in reversed(list(self.check(document).items())):
+            for item in found:
+                for shape_id in (item if issue == 'cycle' else (item,)):
+                    flagged[shape_id] = issue
+        return flagged
+        
\ No newline at end of file
@@ -0,0 +1,387 @@
+"""Reading and writing flowchart files: streamed JSON and the binary .fcb container."""
+from __future__ import annotations
+
+import math
+import mmap
+import struct
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, Tuple
+
+from .geometry import PORTS, SpatialGrid, attach_ends
+from .model import FlowchartArrow, FlowchartDocument, FlowchartShape
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def check_shape_data(data):
+    """Raise ValueError unless data is a well-formed shape entry."""
+    if not isinstance(data, dict):
+        raise ValueError("shape entry is not an object")
+    if not isinstance(data.get('shape_type'), str):
+        raise ValueError("shape entry has no shape_type")
+    for key in ('x', 'y', 'width', 'height'):
+        if not _is_number(data.get(key)):
+            raise ValueError(f"shape entry has an invalid {key}")
+    if data['width'] < 0 or data['height'] < 0:
+        raise ValueError("shape entry has a negative size")
+    if not isinstance(data.get('text'), str):
+        raise ValueError("shape entry has no text")
+
+def check_arrow_data(data):
+    """Raise ValueError unless data is a well-formed arrow entry."""
+    if not isinstance(data, dict):
+        raise ValueError("arrow entry is not an object")
+    if not isinstance(data.get('arrow_type'), str):
+        raise ValueError("arrow entry has no arrow_type")
+    for key in ('start_x', 'start_y', 'end_x', 'end_y'):
+        if not _is_number(data.get(key)):
+            raise ValueError(f"arrow entry has an invalid {key}")
+    for end in ('source', 'target'):
+        shape_id = data.get(end)
+        if shape_id is not None and (not isinstance(shape_id, int) or isinstance(shape_id, bool)):
+            raise ValueError(f"arrow entry has an invalid {end}")
+        if data.get(end + '_port') not in PORTS + (None,):
+            raise ValueError(f"arrow entry has an invalid {end}_port")
+
+def is_legacy_arrow(data) -> bool:
+    """True for arrows saved before connectors could attach to shapes."""
+    return 'source' not in data and 'target' not in data
+
+JSON_MAX_ENTRY = 1 << 24  # Characters one top-level value may span before the file is taken for corrupt
+JSON_TOKEN_TAIL = 16      # A value, or parse error, this close to the end of the buffer may be cut short
+
+def iter_flowchart_json(fp, chunk_size: int = 1 << 16, on_read=None):
+    """Yield ('shapes' | 'arrows', entry) pairs from a flowchart JSON file.
+    
+    Entries are decoded one at a time as the file is read, so memory stays
+    bounded by the largest single entry rather than the whole file. Other
+    top-level keys are parsed and ignored. on_read, if given, is called with
+    the number of characters consumed by each read.
+    
+    A malformed value raises ValueError, naming its byte offset, as soon
+    as enough of the file has been read to tell; one that never ends
+    raises once it passes JSON_MAX_ENTRY characters, instead of reading
+    the rest of the file in the hope of finishing it.
+    """
+    import json  # Here rather than at the top: it is most of what importing this module would cost
+    decoder = json.JSONDecoder()
+    encoding = getattr(fp, 'encoding', None) or 'utf-8'
+    buf = ''
+    pos = 0
+    size = 0  # Bytes read into buf so far
+    eof = False
+    
+    def fill():
+        nonlocal buf, pos, size, eof
+        chunk = fp.read(chunk_size)
+        if on_read is not None:
+            on_read(len(chunk))
+        if not chunk:
+            eof = True
+            return False
+        size += len(chunk.encode(encoding, 'replace'))
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+        
+    def peek():
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not fill():
+                return ''
+                
+    def fail(what, at=None):
+        at = pos if at is None else at
+        offset = size - len(buf[at:].encode(encoding, 'replace'))
+        return ValueError(f"Malformed flowchart file: {what} at byte {offset}")
+        
+    def take(expected):
+        nonlocal pos
+        char = peek()
+        if char not in expected:
+            raise fail(f"expected {' or '.join(repr(c) for c in expected)}")
+        pos += 1
+        return char
+        
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+                # Even a number that ends just short of the end may go on in the next chunk
+                if end < len(buf) - JSON_TOKEN_TAIL or eof:
+                    pos = end
+                    return obj
+            except json.JSONDecodeError as e:
+                # A string missing its closing quote is reported where it starts
+                if eof or e.pos < len(buf) - JSON_TOKEN_TAIL and not e.msg.startswith('Unterminated string'):
+                    raise fail(f"invalid value ({e.msg})", e.pos)
+            if len(buf) - pos > JSON_MAX_ENTRY:
+                raise fail(f"value longer than {JSON_MAX_ENTRY} characters")
+            fill()
+            
+    take('{')
+    if peek() == '}':
+        return
+    while True:
+        key = value()
+        if not isinstance(key, str):
+            raise fail("expected a key")
+        take(':')
+        if key in ('shapes', 'arrows'):
+            take('[')
+            if peek() == ']':
+                pos += 1
+            else:
+                while True:
+                    yield key, value()
+                    if take(',]') == ']':
+                        break
+        else:
+            value()
+        if take(',}') == '}':
+            return
+
+BINARY_MAGIC = b'FLWC'
+BINARY_VERSION = 2
+# magic, version, reserved, shape count, arrow count, type count,
+# then offsets of the shape table, arrow table, string table and type table
+BINARY_HEADER = struct.Struct('<4sHHIIIQQQQ')
+# id, type index, x, y, width, height, text offset, text length
+BINARY_SHAPE_RECORD = struct.Struct('<qH4dII')
+# id, type index, start x, start y, end x, end y, source id, target id,
+# source port, target port (ids of -1 and ports of 255 mean unattached)
+BINARY_ARROW_RECORD = struct.Struct('<qH4dqqBB')
+# Version 1 files predate attached connectors
+BINARY_ARROW_RECORD_V1 = struct.Struct('<qH4d')
+NO_PORT = 255
+# string offset, length
+BINARY_TYPE_ENTRY = struct.Struct('<II')
+
+def _plain_number(value: float):
+    # Records store doubles; hand integral values back as ints so a JSON
+    # round trip reproduces the original file
+    return int(value) if value.is_integer() else value
+
+def _port_name(index: int):
+    # Out-of-range indexes are passed through for check_arrow_data to reject
+    if index == NO_PORT:
+        return None
+    return PORTS[index] if index < len(PORTS) else index
+
+def save_binary(filename: str, data: Dict):
+    """Write a document in the to_dict() schema as a binary container.
+    
+    Layout: a fixed header, then fixed-width shape and arrow record tables,
+    a UTF-8 string table holding every label, and a table of type names
+    that records refer to by index.
+    """
+    type_names: Dict[str, int] = {}
+    strings = bytearray()
+    
+    def intern(text: str) -> Tuple[int, int]:
+        encoded = text.encode('utf-8')
+        offset = len(strings)
+        strings.extend(encoded)
+        return offset, len(encoded)
+        
+    def type_index(name: str) -> int:
+        return type_names.setdefault(name, len(type_names))
+        
+    with open(filename, 'wb') as f:
+        f.write(bytes(BINARY_HEADER.size))
+        
+        shape_offset = f.tell()
+        for shape in data['shapes']:
+            text_offset, text_length = intern(shape['text'])
+            f.write(BINARY_SHAPE_RECORD.pack(
+                -1 if shape.get('id') is None else shape['id'], type_index(shape['shape_type']),
+                shape['x'], shape['y'], shape['width'], shape['height'], text_offset, text_length))
+                
+        arrow_offset = f.tell()
+        for arrow in data['arrows']:
+            f.write(BINARY_ARROW_RECORD.pack(
+                -1 if arrow.get('id') is None else arrow['id'], type_index(arrow['arrow_type']),
+                arrow['start_x'], arrow['start_y'], arrow['end_x'], arrow['end_y'],
+                -1 if arrow.get('source') is None else arrow['source'],
+                -1 if arrow.get('target') is None else arrow['target'],
+                NO_PORT if arrow.get('source_port') is None else PORTS.index(arrow['source_port']),
+                NO_PORT if arrow.get('target_port') is None else PORTS.index(arrow['target_port'])))
+                
+        type_entries = [intern(name) for name in type_names]
+        string_offset = f.tell()
+        f.write(strings)
+        type_offset = f.tell()
+        for entry in type_entries:
+            f.write(BINARY_TYPE_ENTRY.pack(*entry))
+            
+        f.seek(0)
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, len(data['shapes']), len(data['arrows']),
+                                   len(type_entries), shape_offset, arrow_offset, string_offset, type_offset))
+
+def is_binary_file(filename: str) -> bool:
+    with open(filename, 'rb') as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+class BinaryFlowchart:
+    """Read-only view of a binary flowchart file through mmap.
+    
+    Opening only parses the header and the type table; shape and arrow
+    records are decoded when they are asked for.
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._file = open(filename, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Not a binary flowchart file: file is empty")
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+            
+    def _read_header(self):
+        if len(self._map) < BINARY_HEADER.size:
+            raise ValueError("Not a binary flowchart file: header is truncated")
+        (magic, version, _, self.shape_count, self.arrow_count, type_count,
+         self.shape_offset, self.arrow_offset, self.string_offset, type_offset) = BINARY_HEADER.unpack_from(self._map, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a binary flowchart file")
+        if version > BINARY_VERSION:
+            raise ValueError(f"Binary flowchart version {version} is newer than this program supports")
+        self.arrow_record = BINARY_ARROW_RECORD_V1 if version < 2 else BINARY_ARROW_RECORD
+        if (self.shape_offset + self.shape_count * BINARY_SHAPE_RECORD.size > len(self._map)
+                or self.arrow_offset + self.arrow_count * self.arrow_record.size > len(self._map)
+                or type_offset + type_count * BINARY_TYPE_ENTRY.size > len(self._map)):
+            raise ValueError("Binary flowchart file is truncated")
+        self.version = version
+        self.type_names = [self._string(*BINARY_TYPE_ENTRY.unpack_from(self._map, type_offset + i * BINARY_TYPE_ENTRY.size))
+                           for i in range(type_count)]
+                           
+    def _string(self, offset: int, length: int) -> str:
+        start = self.string_offset + offset
+        return self._map[start:start + length].decode('utf-8')
+        
+    def close(self):
+        self._map.close()
+        self._file.close()
+        
+    def __enter__(self):
+        return self
+        
+    def __exit__(self, *exc):
+        self.close()
+        
+    def shape_dict(self, index: int) -> Dict:
+        if not 0 <= index < self.shape_count:
+            raise IndexError(index)
+        shape_id, kind, x, y, width, height, text_offset, text_length = BINARY_SHAPE_RECORD.unpack_from(
+            self._map, self.shape_offset + index * BINARY_SHAPE_RECORD.size)
+        return {
+            'id': None if shape_id < 0 else shape_id,
+            'shape_type': self.type_names[kind],
+            'x': _plain_number(x),
+            'y': _plain_number(y),
+            'width': _plain_number(width),
+            'height': _plain_number(height),
+            'text': self._string(text_offset, text_length)
+        }
+        
+    def arrow_dict(self, index: int) -> Dict:
+        if not 0 <= index < self.arrow_count:
+            raise IndexError(index)
+        record = self.arrow_record.unpack_from(self._map, self.arrow_offset + index * self.arrow_record.size)
+        arrow_id, kind, start_x, start_y, end_x, end_y = record[:6]
+        data = {
+            'id': None if arrow_id < 0 else arrow_id,
+            'arrow_type': self.type_names[kind],
+            'start_x': _plain_number(start_x),
+            'start_y': _plain_number(start_y),
+            'end_x': _plain_number(end_x),
+            'end_y': _plain_number(end_y)
+        }
+        if len(record) > 6:
+            source, target, source_port, target_port = record[6:]
+            data['source'] = None if source < 0 else source
+            data['source_port'] = _port_name(source_port)
+            data['target'] = None if target < 0 else target
+            data['target_port'] = _port_name(target_port)
+        return data
+        
+    def iter_entries(self):
+        """Yield ('shapes' | 'arrows', entry) pairs, like iter_flowchart_json."""
+        for i in range(self.shape_count):
+            yield 'shapes', self.shape_dict(i)
+        for i in range(self.arrow_count):
+            yield 'arrows', self.arrow_dict(i)
+            
+    def to_dict(self) -> Dict:
+        return {
+            'shapes': [self.shape_dict(i) for i in range(self.shape_count)],
+            'arrows': [self.arrow_dict(i) for i in range(self.arrow_count)]
+        }
+
+def read_document(filename: str) -> Tuple[FlowchartDocument, int]:
+    """Load a JSON or binary flowchart in one go, skipping invalid entries.
+    
+    Arrows from files that predate attached connectors are snapped to the
+    shapes their ends touch, as the editor does when it loads them.
+    Returns the document and the number of entries that were skipped.
+    """
+    checks = {'shapes': (check_shape_data, FlowchartShape), 'arrows': (check_arrow_data, FlowchartArrow)}
+    document = FlowchartDocument()
+    legacy = []
+    skipped = 0
+    
+    def consume(entries):
+        nonlocal skipped
+        for key, data in entries:
+            check, cls = checks[key]
+            try:
+                check(data)
+                item = cls.from_dict(data)
+                if key == 'shapes':
+                    document.add_shape(item)
+                else:
+                    document.add_arrow(item)
+            except ValueError:
+                skipped += 1  # Malformed, or its id is taken already
+                continue
+            if key == 'arrows' and is_legacy_arrow(data):
+                legacy.append(item)
+                
+    if is_binary_file(filename):
+        with BinaryFlowchart(filename) as reader:
+            consume(reader.iter_entries())
+    else:
+        with open(filename, 'r') as f:
+            consume(iter_flowchart_json(f))
+    if legacy:
+        shapes = SpatialGrid()
+        for shape in document.shapes():
+            shapes.insert(shape, shape.bounds(), shape.z)
+        for arrow in legacy:
+            attach_ends(document, shapes, arrow)
+            document.route_arrow(arrow)
+    return document, skipped
+
+def save_document(document: FlowchartDocument, filename: str):
+    """Write a document as binary .fcb if the name says so, otherwise as JSON."""
+    data = document.to_dict()
+    if filename.lower().endswith('.fcb'):
+        save_binary(filename, data)
+    else:
+        import json
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
+            
\ No newline at end of file
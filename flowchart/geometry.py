@@ -0,0 +1,592 @@
+"""Backend-agnostic flowchart geometry.
+
+Everything here works on plain numbers, so the Tk canvas and the headless
+exporters draw exactly the same outlines, connectors and arrowheads.
+"""
+from __future__ import annotations
+
+import functools
+import math
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:  # Annotations only: importing typing would cost more than the rest of the package
+    from typing import Dict, List, Optional, Tuple
+
+SHAPE_TYPES = ('rectangle', 'oval', 'diamond', 'triangle', 'parallelogram', 'hexagon', 'star')
+POLYGON_SHAPES = ('diamond', 'triangle', 'parallelogram', 'hexagon', 'star')
+ARROW_BOUNDS_PAD = 30
+NUMPY_BATCH_THRESHOLD = 64  # Below this many shapes NumPy's call overhead doesn't pay off
+SNAP_DISTANCE = 15          # Connector ends this close to a shape attach to it
+
+# Unit-space star template: outer points on the half-size ellipse, inner
+# points on the quarter-size one, starting straight up
+STAR_TEMPLATE = tuple(
+    ((0.5 if i % 2 == 0 else 0.25) * math.cos(i * math.pi / 5 - math.pi/2),
+     (0.5 if i % 2 == 0 else 0.25) * math.sin(i * math.pi / 5 - math.pi/2))
+    for i in range(10))
+SHAPE_CACHE_SIZE = 4096  # Distinct (type, width, height) outlines kept around
+
+@functools.lru_cache(maxsize=None)
+def numpy_module():
+    """NumPy, or None if it is not installed.
+    
+    Imported on first use rather than with this module, because loading it
+    costs far more than importing the whole package does without it.
+    NumPy is optional; the batch helpers fall back to plain Python.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+def _vertices(shape_type: str, x, y, width, height):
+    """Outline x and y coordinates as two parallel lists.
+    
+    Only uses arithmetic operators, so it works on plain floats and on
+    NumPy arrays (one shape per element) alike.
+    """
+    x1, y1, x2, y2 = x, y, x + width, y + height
+    center_x, center_y = x + width/2, y + height/2
+    
+    if shape_type == 'diamond':
+        return [center_x, x2, center_x, x1], [y1, center_y, y2, center_y]
+        
+    elif shape_type == 'triangle':
+        return [center_x, x2, x1], [y1, y2, y2]
+        
+    elif shape_type == 'parallelogram':
+        offset = width // 4
+        return [x1 + offset, x2, x2 - offset, x1], [y1, y1, y2, y2]
+        
+    elif shape_type == 'hexagon':
+        w_third = width // 3
+        return ([x1 + w_third, x2 - w_third, x2, x2 - w_third, x1 + w_third, x1],
+                [y1, y1, center_y, y2, y2, center_y])
+                
+    elif shape_type == 'star':
+        return ([center_x + width * ux for ux, _ in STAR_TEMPLATE],
+                [center_y + height * uy for _, uy in STAR_TEMPLATE])
+                
+    return [x1, x2], [y1, y2]
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def shape_offsets(shape_type: str, width: float, height: float) -> Tuple[float, ...]:
+    """Outline coordinates relative to the shape's top-left corner, memoized per size."""
+    xs, ys = _vertices(shape_type, 0, 0, width, height)
+    return tuple(v for pair in zip(xs, ys) for v in pair)
+
+def shape_points(shape_type: str, x: float, y: float, width: float, height: float) -> List[float]:
+    """Return the flat canvas coordinates describing a shape's outline.
+    
+    Polygon shapes get their vertex list; rectangles, ovals and unknown
+    types get their bounding box, which is what Tk expects for those items.
+    """
+    offsets = shape_offsets(shape_type, width, height)
+    return [v + x if i % 2 == 0 else v + y for i, v in enumerate(offsets)]
+
+def shape_points_batch(shape_types, xs, ys, widths, heights) -> List[List[float]]:
+    """shape_points() for many shapes at once, results in input order.
+    
+    With NumPy installed, shapes are grouped by type and each group is
+    transformed in one vectorized pass; otherwise the memoized per-size
+    outlines are translated one by one.
+    """
+    count = len(shape_types)
+    np = numpy_module() if count >= NUMPY_BATCH_THRESHOLD else None
+    if np is None:
+        return [shape_points(shape_types[i], xs[i], ys[i], widths[i], heights[i]) for i in range(count)]
+        
+    result: List[Optional[List[float]]] = [None] * count
+    groups: Dict[str, List[int]] = {}
+    for i, shape_type in enumerate(shape_types):
+        groups.setdefault(shape_type, []).append(i)
+    for shape_type, indices in groups.items():
+        take = np.asarray(indices)
+        cols_x, cols_y = _vertices(shape_type, np.asarray(xs, dtype=float)[take], np.asarray(ys, dtype=float)[take],
+                                   np.asarray(widths, dtype=float)[take], np.asarray(heights, dtype=float)[take])
+        rows = np.empty((len(indices), 2 * len(cols_x)))
+        rows[:, 0::2] = np.column_stack(cols_x)
+        rows[:, 1::2] = np.column_stack(cols_y)
+        for index, row in zip(indices, rows.tolist()):
+            result[index] = row
+    return result
+
+ARROW_TYPES = ('straight', 'curved', 'dashed', 'double', 'bidirectional', 'thick', 'dotted', 'orthogonal', 'line')
+
+# Per connector type: which ends carry arrowheads, line width multiplier,
+# dash pattern, and whether the polyline is drawn as a smoothed spline
+ARROW_STYLES = {
+    'straight': {'arrow': 'last', 'width_scale': 1, 'dash': None, 'smooth': False},
+    'curved': {'arrow': 'last', 'width_scale': 1, 'dash': None, 'smooth': True},
+    'dashed': {'arrow': 'last', 'width_scale': 1, 'dash': (5, 5), 'smooth': False},
+    'double': {'arrow': 'last', 'width_scale': 1, 'dash': None, 'smooth': False},
+    'bidirectional': {'arrow': 'both', 'width_scale': 1, 'dash': None, 'smooth': False},
+    'thick': {'arrow': 'last', 'width_scale': 2, 'dash': None, 'smooth': False},
+    'dotted': {'arrow': 'last', 'width_scale': 1, 'dash': (2, 3), 'smooth': False},
+    'orthogonal': {'arrow': 'last', 'width_scale': 1, 'dash': None, 'smooth': False},
+    'line': {'arrow': 'none', 'width_scale': 1, 'dash': None, 'smooth': False},
+}
+ARROWHEAD_SHAPE = (8, 10, 3)  # Tk's default arrowshape
+SPLINE_STEPS = 12             # Tk's default splinesteps for smoothed lines
+
+def arrow_lines(arrow_type: str, x1: float, y1: float, x2: float, y2: float,
+                waypoints=()) -> List[List[float]]:
+    """Return the polylines making up a connector, one per canvas line item.
+    
+    waypoints are the flat bend points of a routed 'orthogonal' connector;
+    without them it is drawn straight until the router has run.
+    """
+    if arrow_type == 'orthogonal':
+        return [[x1, y1, *waypoints, x2, y2]]
+        
+    elif arrow_type == 'curved':
+        # Create a curved arrow using multiple line segments
+        mid_x = (x1 + x2) / 2
+        mid_y = (y1 + y2) / 2
+        # Add curve offset
+        offset = 30
+        curve_x = mid_x + offset if (x2 - x1) * (y2 - y1) > 0 else mid_x - offset
+        curve_y = mid_y - offset if y2 > y1 else mid_y + offset
+        
+        # Smooth curve approximation through points on a quadratic Bezier
+        points = [x1, y1]
+        for t in [0.2, 0.4, 0.6, 0.8, 1.0]:
+            px = (1-t)**2 * x1 + 2*(1-t)*t * curve_x + t**2 * x2
+            py = (1-t)**2 * y1 + 2*(1-t)*t * curve_y + t**2 * y2
+            points.extend([px, py])
+        return [points]
+        
+    elif arrow_type == 'double':
+        # Two parallel lines
+        dx, dy = x2 - x1, y2 - y1
+        length = math.sqrt(dx**2 + dy**2)
+        if length == 0:
+            return []
+        offset_x = -dy / length * 3  # Perpendicular offset
+        offset_y = dx / length * 3
+        return [[x1 + offset_x, y1 + offset_y, x2 + offset_x, y2 + offset_y],
+                [x1 - offset_x, y1 - offset_y, x2 - offset_x, y2 - offset_y]]
+                
+    elif arrow_type in ARROW_TYPES:
+        return [[x1, y1, x2, y2]]
+        
+    return []
+
+def shape_outline(shape_type: str, x: float, y: float, width: float, height: float) -> Tuple[str, List[float]]:
+    """Return ('rectangle' | 'oval' | 'polygon', points) for a shape."""
+    return shape_kind(shape_type), shape_points(shape_type, x, y, width, height)
+
+def shape_kind(shape_type: str) -> str:
+    """Which primitive ('rectangle' | 'oval' | 'polygon') draws a shape type."""
+    if shape_type == 'oval':
+        return 'oval'
+    if shape_type in POLYGON_SHAPES:
+        return 'polygon'
+    return 'rectangle'
+
+# Connection points on each shape, named after the side they sit on
+PORTS = ('top', 'right', 'bottom', 'left')
+PORT_DIRECTIONS = {'top': (0, -1), 'right': (1, 0), 'bottom': (0, 1), 'left': (-1, 0)}
+
+@functools.lru_cache(maxsize=SHAPE_CACHE_SIZE)
+def port_offset(shape_type: str, width: float, height: float, port: str) -> Tuple[float, float]:
+    """Where a port sits relative to the shape's top-left corner.
+    
+    Ports start at the middle of a bounding-box side; for polygons they are
+    pulled in along the ray from the centre to the outermost point where
+    that ray crosses the outline, so connectors touch the drawn edge.
+    """
+    dir_x, dir_y = PORT_DIRECTIONS[port]
+    center_x, center_y = width / 2, height / 2
+    ray_x, ray_y = dir_x * width / 2, dir_y * height / 2
+    if shape_type not in POLYGON_SHAPES or (ray_x == 0 and ray_y == 0):
+        return center_x + ray_x, center_y + ray_y
+        
+    points = shape_offsets(shape_type, width, height)
+    best = None
+    n = len(points) // 2
+    for i in range(n):
+        ax, ay = points[2*i], points[2*i + 1]
+        bx, by = points[(2*i + 2) % (2*n)], points[(2*i + 3) % (2*n)]
+        edge_x, edge_y = bx - ax, by - ay
+        denom = ray_x * edge_y - ray_y * edge_x
+        if denom == 0:
+            continue
+        # Solve centre + t * ray == a + u * edge
+        t = ((ax - center_x) * edge_y - (ay - center_y) * edge_x) / denom
+        u = ((ax - center_x) * ray_y - (ay - center_y) * ray_x) / denom
+        if t >= 0 and 0 <= u <= 1 and (best is None or t > best):
+            best = t
+    if best is None:
+        best = 1.0
+    return center_x + best * ray_x, center_y + best * ray_y
+
+def port_position(shape_type: str, x: float, y: float, width: float, height: float, port: str) -> Tuple[float, float]:
+    dx, dy = port_offset(shape_type, width, height, port)
+    return x + dx, y + dy
+
+def nearest_port(shape_type: str, x: float, y: float, width: float, height: float, px: float, py: float) -> str:
+    """The port of a shape closest to a point."""
+    def distance(port):
+        port_x, port_y = port_position(shape_type, x, y, width, height, port)
+        return (port_x - px) ** 2 + (port_y - py) ** 2
+    return min(PORTS, key=distance)
+
+def arrow_style(arrow_type: str) -> Dict:
+    return ARROW_STYLES.get(arrow_type, ARROW_STYLES['straight'])
+
+def arrowhead(tip_x: float, tip_y: float, from_x: float, from_y: float, line_width: float,
+              shape: Tuple[float, float, float] = ARROWHEAD_SHAPE) -> Tuple[List[float], float, float]:
+    """Compute an arrowhead the way Tk does.
+    
+    Returns the arrowhead polygon and the point the line itself should now
+    end at, pulled back so its square end stays hidden inside the head.
+    """
+    shape_a = shape[0] + 0.001
+    shape_b = shape[1] + 0.001
+    shape_c = shape[2] + line_width / 2 + 0.001
+    frac_height = (line_width / 2) / shape_c
+    backup = frac_height * shape_b + shape_a * (1 - frac_height) / 2
+    
+    dx, dy = tip_x - from_x, tip_y - from_y
+    length = math.hypot(dx, dy)
+    if length == 0:
+        sin_theta = cos_theta = 0.0
+    else:
+        sin_theta, cos_theta = dy / length, dx / length
+        
+    neck_x = tip_x - shape_a * cos_theta
+    neck_y = tip_y - shape_a * sin_theta
+    temp_x, temp_y = shape_c * sin_theta, shape_c * cos_theta
+    left_x = tip_x - shape_b * cos_theta + temp_x
+    left_y = tip_y - shape_b * sin_theta - temp_y
+    right_x = left_x - 2 * temp_x
+    right_y = left_y + 2 * temp_y
+    inner_left_x = left_x * frac_height + neck_x * (1 - frac_height)
+    inner_left_y = left_y * frac_height + neck_y * (1 - frac_height)
+    inner_right_x = right_x * frac_height + neck_x * (1 - frac_height)
+    inner_right_y = right_y * frac_height + neck_y * (1 - frac_height)
+    
+    polygon = [tip_x, tip_y, left_x, left_y, inner_left_x, inner_left_y,
+               inner_right_x, inner_right_y, right_x, right_y]
+    return polygon, tip_x - backup * cos_theta, tip_y - backup * sin_theta
+
+def spline_segments(points: List[float]) -> List[Tuple[float, float, float, float, float, float]]:
+    """Split a smoothed line into quadratic Bezier segments (x0, y0, cx, cy, x1, y1).
+    
+    Matches Tk's parabolic splines for open lines: the curve passes through
+    the first and last points and the midpoints between interior ones.
+    """
+    n = len(points) // 2
+    if n < 3:
+        return []
+    segments = []
+    for i in range(1, n - 1):
+        px, py = points[2*i], points[2*i + 1]
+        if i == 1:
+            sx, sy = points[0], points[1]
+        else:
+            sx, sy = (points[2*i - 2] + px) / 2, (points[2*i - 1] + py) / 2
+        if i == n - 2:
+            ex, ey = points[2*i + 2], points[2*i + 3]
+        else:
+            ex, ey = (px + points[2*i + 2]) / 2, (py + points[2*i + 3]) / 2
+        segments.append((sx, sy, px, py, ex, ey))
+    return segments
+
+def smooth_polyline(points: List[float], steps: int = SPLINE_STEPS) -> List[float]:
+    """Sample a smoothed line into a plain polyline."""
+    segments = spline_segments(points)
+    if not segments:
+        return list(points)
+    flat = [segments[0][0], segments[0][1]]
+    for sx, sy, cx, cy, ex, ey in segments:
+        for step in range(1, steps + 1):
+            t = step / steps
+            u = 1 - t
+            flat.append(u * u * sx + 2 * u * t * cx + t * t * ex)
+            flat.append(u * u * sy + 2 * u * t * cy + t * t * ey)
+    return flat
+
+def connector_geometry(arrow_type: str, x1: float, y1: float, x2: float, y2: float,
+                       line_width: float, waypoints=()) -> List[Tuple[List[float], List[List[float]]]]:
+    """Describe a connector as (line points, arrowhead polygons) per line.
+    
+    line_width is the base width; the style's multiplier is applied here.
+    Line points are control points when the style is smoothed.
+    """
+    style = arrow_style(arrow_type)
+    width = line_width * style['width_scale']
+    result = []
+    for points in arrow_lines(arrow_type, x1, y1, x2, y2, waypoints):
+        points = list(points)
+        heads = []
+        if style['arrow'] in ('last', 'both'):
+            polygon, points[-2], points[-1] = arrowhead(points[-2], points[-1], points[-4], points[-3], width)
+            heads.append(polygon)
+        if style['arrow'] in ('first', 'both'):
+            polygon, points[0], points[1] = arrowhead(points[0], points[1], points[2], points[3], width)
+            heads.append(polygon)
+        result.append((points, heads))
+    return result
+
+def connector_polylines(arrow_type: str, x1: float, y1: float, x2: float, y2: float,
+                        waypoints=(), steps: int = SPLINE_STEPS) -> List[List[float]]:
+    """The lines of a connector as plain polylines, sampling the smoothed ones into steps per spline piece."""
+    lines = arrow_lines(arrow_type, x1, y1, x2, y2, waypoints)
+    if arrow_style(arrow_type)['smooth']:
+        return [smooth_polyline(points, steps) for points in lines]
+    return lines
+
+def point_segment_distances(px: float, py: float, segments) -> List[float]:
+    """Distance from a point to each (x1, y1, x2, y2) segment, vectorized with NumPy for long lists."""
+    np = numpy_module() if len(segments) >= NUMPY_BATCH_THRESHOLD else None
+    if np is not None:
+        x1, y1, x2, y2 = np.asarray(segments, dtype=float).T
+        dx, dy = x2 - x1, y2 - y1
+        length2 = dx * dx + dy * dy
+        # Projection onto each segment, clamped to its ends; points stand for zero-length segments
+        t = np.clip(((px - x1) * dx + (py - y1) * dy) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+        return np.hypot(x1 + t * dx - px, y1 + t * dy - py).tolist()
+        
+    distances = []
+    for x1, y1, x2, y2 in segments:
+        dx, dy = x2 - x1, y2 - y1
+        length2 = dx * dx + dy * dy
+        t = min(1.0, max(0.0, ((px - x1) * dx + (py - y1) * dy) / length2)) if length2 else 0.0
+        distances.append(math.hypot(x1 + t * dx - px, y1 + t * dy - py))
+    return distances
+
+def point_in_polygon(px: float, py: float, points: List[float]) -> bool:
+    """Even-odd ray casting test against a flat [x0, y0, x1, y1, ...] list."""
+    inside = False
+    n = len(points) // 2
+    j = n - 1
+    for i in range(n):
+        xi, yi = points[2*i], points[2*i + 1]
+        xj, yj = points[2*j], points[2*j + 1]
+        if (yi > py) != (yj > py):
+            cross_x = xi + (py - yi) * (xj - xi) / (yj - yi)
+            if px <= cross_x:
+                inside = not inside
+        j = i
+    return inside
+
+class SpatialGrid:
+    """Uniform grid that buckets items by bounding box for fast lookups.
+    
+    Every item also carries an insertion order so point queries can hand
+    back candidates topmost-first, matching the drawing order on the canvas.
+    Items spanning more than max_cells cells (long connectors, huge shapes)
+    are kept in a small side list instead of being copied into every cell.
+    """
+    def __init__(self, cell_size: int = 128, max_cells: int = 64):
+        self.cell_size = cell_size
+        self.max_cells = max_cells
+        self.cells: Dict[Tuple[int, int], set] = {}
+        self.oversized: set = set()
+        # item -> (cell range or None when oversized, order, bounds)
+        self.entries: Dict[object, Tuple[Optional[Tuple[int, int, int, int]], int, Tuple[float, float, float, float]]] = {}
+        self.next_order = 0
+        
+    def __len__(self):
+        return len(self.entries)
+        
+    def _cell_range(self, bounds):
+        x1, y1, x2, y2 = bounds
+        size = self.cell_size
+        return (math.floor(min(x1, x2) / size), math.floor(min(y1, y2) / size),
+                math.floor(max(x1, x2) / size), math.floor(max(y1, y2) / size))
+                
+    def insert(self, item, bounds, order: Optional[int] = None):
+        if item in self.entries:
+            self.remove(item)
+        if order is None:
+            order = self.next_order
+        self.next_order = max(self.next_order, order + 1)
+        cell_range = self._cell_range(bounds)
+        cx1, cy1, cx2, cy2 = cell_range
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.max_cells:
+            self.oversized.add(item)
+            cell_range = None
+        else:
+            for cx in range(cx1, cx2 + 1):
+                for cy in range(cy1, cy2 + 1):
+                    self.cells.setdefault((cx, cy), set()).add(item)
+        self.entries[item] = (cell_range, order, tuple(bounds))
+        
+    def remove(self, item):
+        entry = self.entries.pop(item, None)
+        if entry is None:
+            return
+        if entry[0] is None:
+            self.oversized.discard(item)
+            return
+        cx1, cy1, cx2, cy2 = entry[0]
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket is not None:
+                    bucket.discard(item)
+                    if not bucket:
+                        del self.cells[(cx, cy)]
+                        
+    def update(self, item, bounds):
+        entry = self.entries.get(item)
+        if entry is None:
+            self.insert(item, bounds)
+        elif entry[0] is not None and self._cell_range(bounds) == entry[0]:
+            self.entries[item] = (entry[0], entry[1], tuple(bounds))
+        else:
+            self.remove(item)
+            self.insert(item, bounds, entry[1])
+            
+    def order_of(self, item) -> int:
+        return self.entries[item][1]
+        
+    def bounds_of(self, item) -> Tuple[float, float, float, float]:
+        return self.entries[item][2]
+        
+    def clear(self):
+        self.cells.clear()
+        self.oversized.clear()
+        self.entries.clear()
+        self.next_order = 0
+        
+    def rebuild(self, items, bounds_of):
+        self.clear()
+        for item in items:
+            self.insert(item, bounds_of(item))
+            
+    def _oversized_in(self, x1, y1, x2, y2):
+        for item in self.oversized:
+            bx1, by1, bx2, by2 = self.entries[item][2]
+            if bx1 <= x2 and bx2 >= x1 and by1 <= y2 and by2 >= y1:
+                yield item
+                
+    def query_point(self, x: float, y: float) -> list:
+        size = self.cell_size
+        candidates = list(self.cells.get((math.floor(x / size), math.floor(y / size)), ()))
+        if self.oversized:
+            candidates.extend(self._oversized_in(x, y, x, y))
+        return sorted(candidates, key=self.order_of, reverse=True)
+        
+    def query_rect(self, x1: float, y1: float, x2: float, y2: float) -> set:
+        cx1, cy1, cx2, cy2 = self._cell_range((x1, y1, x2, y2))
+        found = set(self._oversized_in(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)))
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(self.cells):
+            # Large query windows are cheaper to answer by scanning the occupied cells
+            for (cx, cy), bucket in self.cells.items():
+                if cx1 <= cx <= cx2 and cy1 <= cy <= cy2:
+                    found.update(bucket)
+            return found
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+def shape_near(shapes: SpatialGrid, x: float, y: float, distance: float = SNAP_DISTANCE):
+    """The topmost shape under a point, or failing that the closest one within distance."""
+    for shape in shapes.query_point(x, y):
+        if shape.contains_point(x, y):
+            return shape
+    best, best_distance = None, distance
+    for candidate in shapes.query_rect(x - distance, y - distance, x + distance, y + distance):
+        x1, y1, x2, y2 = candidate.bounds()
+        gap = max(x1 - x, 0, x - x2) + max(y1 - y, 0, y - y2)
+        if gap <= best_distance:
+            best, best_distance = candidate, gap
+    return best
+
+def attach_ends(document, shapes: SpatialGrid, arrow, ends=('source', 'target')):
+    """Attach each free end of an arrow to the shape it lies on or next to, at the nearest port.
+    
+    How the editor attaches a dropped connector end, and how arrows from
+    files that predate attached connectors are snapped when they are read.
+    """
+    for end, x, y in (('source', arrow.start_x, arrow.start_y), ('target', arrow.end_x, arrow.end_y)):
+        if end not in ends or getattr(arrow, end + '_id') is not None:
+            continue
+        shape = shape_near(shapes, x, y)
+        if shape is not None:
+            port = nearest_port(shape.shape_type, shape.x, shape.y, shape.width, shape.height, x, y)
+            document.attach(arrow, end, shape, port)
+
+class SegmentIndex:
+    """Spatial index over the straight segments of polylines, for picking thin items like connectors.
+
+    Segments are bucketed into grid cells by their own extent rather than
+    their polyline's, with long ones cut into cell-sized pieces, so a
+    query only measures the few segments that actually pass near the
+    point. Each key's buckets are remembered, making re-indexing a moved
+    polyline cheap.
+    """
+    def __init__(self, cell_size: int = 128):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Dict[Tuple[object, int], Tuple[float, float, float, float]]] = {}
+        self.entries: Dict[object, List[Tuple[Tuple[int, int], int]]] = {}  # key -> [(cell, piece number)]
+        
+    def __len__(self):
+        return len(self.entries)
+        
+    def set(self, key, polylines):
+        """Index (or re-index) the flat [x0, y0, x1, y1, ...] polylines making up key."""
+        self.remove(key)
+        size = self.cell_size
+        cells = self.cells
+        entries = []
+        n = 0
+        floor = math.floor
+        for points in polylines:
+            for i in range(0, len(points) - 2, 2):
+                x1, y1, x2, y2 = points[i:i + 4]
+                pieces = math.ceil(max(abs(x2 - x1), abs(y2 - y1)) / size)
+                if pieces <= 1:
+                    split = [(x1, y1, x2, y2)]
+                else:
+                    dx, dy = (x2 - x1) / pieces, (y2 - y1) / pieces
+                    split = [(x1 + dx * k, y1 + dy * k, x1 + dx * (k + 1), y1 + dy * (k + 1)) for k in range(pieces)]
+                for piece in split:
+                    # No longer than a cell, so a piece touches at most four of them
+                    cx1, cx2 = floor(piece[0] / size), floor(piece[2] / size)
+                    cy1, cy2 = floor(piece[1] / size), floor(piece[3] / size)
+                    for cx in range(min(cx1, cx2), max(cx1, cx2) + 1):
+                        for cy in range(min(cy1, cy2), max(cy1, cy2) + 1):
+                            cells.setdefault((cx, cy), {})[(key, n)] = piece
+                            entries.append(((cx, cy), n))
+                    n += 1
+        self.entries[key] = entries
+        
+    def remove(self, key):
+        for cell, n in self.entries.pop(key, ()):
+            bucket = self.cells[cell]
+            bucket.pop((key, n), None)
+            if not bucket:
+                del self.cells[cell]
+                
+    def clear(self):
+        self.cells.clear()
+        self.entries.clear()
+        
+    def nearest(self, x: float, y: float, tolerance: float) -> Optional[Tuple[object, float]]:
+        """The key owning the segment closest to (x, y) and its distance, if within tolerance."""
+        size = self.cell_size
+        found = {}
+        for cx in range(math.floor((x - tolerance) / size), math.floor((x + tolerance) / size) + 1):
+            for cy in range(math.floor((y - tolerance) / size), math.floor((y + tolerance) / size) + 1):
+                bucket = self.cells.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        if not found:
+            return None
+        entries = list(found)
+        distances = point_segment_distances(x, y, list(found.values()))
+        best = min(range(len(entries)), key=distances.__getitem__)
+        if distances[best] > tolerance:
+            return None
+        return entries[best][0], distances[best]
+        
+        
\ No newline at end of file
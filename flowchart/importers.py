@@ -0,0 +1,601 @@
+"""Importing Graphviz DOT and Mermaid flowcharts.
+
+Both readers work straight off the open file: DOT through a tokenizer that
+pulls the text in chunks, Mermaid one line at a time. So the memory used
+while parsing is about the size of the document being built, not of the
+file. Nodes become shapes sized to their labels and edges become arrows
+bound to them. Positions come from the layered automatic layout, turned
+to follow the file's rank direction. Tk-free like the rest of the
+package.
+
+    document, skipped = import_file('pipeline.dot')
+"""
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .model import FlowchartArrow, FlowchartDocument, FlowchartShape
+
+DOT_EXTENSIONS = ('.dot', '.gv')
+MERMAID_EXTENSIONS = ('.mmd', '.mermaid')
+IMPORT_EXTENSIONS = DOT_EXTENSIONS + MERMAID_EXTENSIONS
+CHUNK_SIZE = 1 << 16
+
+# Shapes are sized to fit their label in the canvas font
+IMPORT_ORIGIN = 50
+CHAR_WIDTH = 7
+LINE_HEIGHT = 16
+TEXT_PADDING = 30
+MIN_WIDTH = 100
+MIN_HEIGHT = 50
+# Outlines narrower than their box need more room around the same text
+SHAPE_TEXT_SCALE = {'oval': 1.2, 'diamond': 1.6, 'hexagon': 1.25, 'parallelogram': 1.3,
+                    'triangle': 1.8, 'star': 1.8}
+
+DOT_SHAPES = {
+    'box': 'rectangle', 'rect': 'rectangle', 'rectangle': 'rectangle', 'square': 'rectangle',
+    'ellipse': 'oval', 'oval': 'oval', 'circle': 'oval', 'doublecircle': 'oval', 'point': 'oval', 'egg': 'oval',
+    'diamond': 'diamond', 'mdiamond': 'diamond',
+    'hexagon': 'hexagon', 'pentagon': 'hexagon', 'septagon': 'hexagon', 'octagon': 'hexagon',
+    'doubleoctagon': 'hexagon', 'tripleoctagon': 'hexagon',
+    'parallelogram': 'parallelogram', 'trapezium': 'parallelogram', 'invtrapezium': 'parallelogram',
+    'triangle': 'triangle', 'invtriangle': 'triangle',
+    'star': 'star',
+}
+DOT_DEFAULT_SHAPE = 'ellipse'
+DOT_SPLINES = {'ortho': 'orthogonal', 'curved': 'curved'}
+BOLD_PENWIDTH = 2
+
+def _label_size(shape_type: str, text: str) -> Tuple[int, int]:
+    lines = text.split('\n') if text else []
+    scale = SHAPE_TEXT_SCALE.get(shape_type, 1)
+    width = (max((len(line) for line in lines), default=0) * CHAR_WIDTH + TEXT_PADDING) * scale
+    height = (len(lines) * LINE_HEIGHT + TEXT_PADDING) * scale
+    return max(MIN_WIDTH, round(width)), max(MIN_HEIGHT, round(height))
+
+class _DocumentBuilder:
+    """Collects named nodes and the edges between them into a document."""
+    def __init__(self):
+        self.document = FlowchartDocument()
+        self.shapes: Dict[str, FlowchartShape] = {}
+        self.untyped: List[FlowchartArrow] = []  # Arrows taking the graph's default type
+        self.direction = 'TB'
+        
+    def node(self, name: str, shape_type: Optional[str] = None, text: Optional[str] = None) -> FlowchartShape:
+        """The shape called name, created on first mention; given values replace the current ones."""
+        shape = self.shapes.get(name)
+        if shape is None:
+            shape = FlowchartShape(shape_type or 'rectangle', IMPORT_ORIGIN, IMPORT_ORIGIN, text=name if text is None else text)
+            self.document.add_shape(shape)
+            self.shapes[name] = shape
+        else:
+            if shape_type is not None:
+                shape.shape_type = shape_type
+            if text is not None:
+                shape.text = text
+        return shape
+        
+    def edge(self, source: str, target: str, arrow_type: Optional[str]):
+        arrow = FlowchartArrow(arrow_type or 'straight', 0, 0, 0, 0)
+        arrow.source_id = self.node(source).id
+        arrow.target_id = self.node(target).id
+        if source == target:
+            # A loop between the nearest ports would have no length
+            arrow.source_port, arrow.target_port = 'right', 'top'
+        self.document.add_arrow(arrow)
+        if arrow_type is None:
+            self.untyped.append(arrow)
+            
+    def finish(self, default_arrow_type: str = 'straight') -> FlowchartDocument:
+        """Size every shape to its label, lay the document out and route the arrows."""
+        document = self.document
+        for arrow in self.untyped:
+            arrow.arrow_type = default_arrow_type
+        for shape in self.shapes.values():
+            shape.width, shape.height = _label_size(shape.shape_type, shape.text)
+        place(document, self.direction)
+        for arrow in document.arrows():
+            for end in ('source', 'target'):
+                shape = document.shape(getattr(arrow, end + '_id'))
+                setattr(arrow, 'start_x' if end == 'source' else 'end_x', shape.x + shape.width / 2)
+                setattr(arrow, 'start_y' if end == 'source' else 'end_y', shape.y + shape.height / 2)
+            document.route_arrow(arrow)
+        return document
+
+def place(document: FlowchartDocument, direction: str = 'TB'):
+    """Move every shape to its layered layout position, ranks running in direction.
+    
+    The layout itself runs top to bottom (TB). Left to right (LR) lays out the
+    transposed shapes and transposes the result back; BT and RL mirror the
+    layout inside its own bounds.
+    """
+    # Loaded on first use: it brings NumPy in, which the extension lists here should not
+    from .layout import layered_layout
+    shapes = document.shapes()
+    if not shapes:
+        return
+    across = direction in ('LR', 'RL')
+    if across:
+        for shape in shapes:
+            shape.width, shape.height = shape.height, shape.width
+    try:
+        positions = layered_layout(document)
+    finally:
+        if across:
+            for shape in shapes:
+                shape.width, shape.height = shape.height, shape.width
+    for shape in shapes:
+        x, y = positions[shape.id]
+        shape.x, shape.y = (y, x) if across else (x, y)
+    if direction in ('BT', 'RL'):
+        if direction == 'BT':
+            top = min(shape.y for shape in shapes)
+            bottom = max(shape.y + shape.height for shape in shapes)
+            for shape in shapes:
+                shape.y = top + bottom - shape.y - shape.height
+        else:
+            left = min(shape.x for shape in shapes)
+            right = max(shape.x + shape.width for shape in shapes)
+            for shape in shapes:
+                shape.x = left + right - shape.x - shape.width
+
+def _direction(value: Optional[str]) -> str:
+    value = (value or 'TB').upper()
+    return 'TB' if value == 'TD' else value if value in ('TB', 'LR', 'BT', 'RL') else 'TB'
+
+# --- DOT ---------------------------------------------------------------
+
+# Whitespace and comments, then at most one token
+_DOT_TOKEN = re.compile(r'''
+    (?:\s+|//[^\n]*|\#[^\n]*|/\*.*?\*/)*
+    (?:(?P<string>"(?:[^"\\]|\\.)*")
+     | (?P<op>->|--|[{}\[\];,=:+])
+     | (?P<id>-?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)|[^\W0-9]\w*)
+     | (?P<html><))?
+''', re.S | re.X)
+_ANGLE = re.compile(r'[<>]')
+_HTML_BREAK = re.compile(r'<br\s*/?>', re.I)
+_HTML_TAG = re.compile(r'<[^>]*>')
+_DOT_ESCAPE = re.compile(r'\\(.)', re.S)
+
+def _dot_tokens(fp, chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[str, str, int]]:
+    """Yield (kind, text, line) for each DOT token, reading fp a chunk at a time.
+    
+    kind is 'id' for bare words and numerals, 'string' for quoted and HTML
+    strings (with their quotes and brackets removed), and an operator's own
+    text for operators.
+    """
+    buffer = ''
+    pos = 0
+    line = 1
+    eof = False
+    
+    def more() -> bool:
+        nonlocal buffer, eof
+        if eof:
+            return False
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buffer += chunk
+        return True
+        
+    while True:
+        if pos >= chunk_size:
+            buffer, pos = buffer[pos:], 0
+        match = _DOT_TOKEN.match(buffer, pos)
+        kind = match.lastgroup
+        # A token running into the end of the buffer may continue in the next
+        # chunk, and text nothing matched may be a comment or string cut short
+        if (kind is None or match.end() == len(buffer)) and more():
+            continue
+        start = match.start(kind) if kind else match.end()
+        line += buffer.count('\n', pos, start)
+        if kind is None:
+            if start == len(buffer):
+                return
+            raise ValueError(f"unexpected {buffer[start:start + 10]!r} on line {line}")
+        if kind == 'html':
+            depth, end = 0, start
+            while True:
+                angle = _ANGLE.search(buffer, end)
+                if angle is None:
+                    if more():
+                        continue
+                    raise ValueError(f"unterminated HTML string on line {line}")
+                depth += 1 if angle.group() == '<' else -1
+                end = angle.end()
+                if depth == 0:
+                    break
+            yield 'string', _html_text(buffer[start + 1:end - 1]), line
+        else:
+            end = match.end()
+            text = match.group(kind)
+            if kind == 'string':
+                yield kind, text[1:-1].replace('\\\r\n', '').replace('\\\n', '').replace('\\"', '"'), line
+            else:
+                yield (text if kind == 'op' else kind), text, line
+        line += buffer.count('\n', start, end)
+        pos = end
+
+def _html_text(markup: str) -> str:
+    import html  # Only HTML-like labels need entities decoded
+    return html.unescape(_HTML_TAG.sub('', _HTML_BREAK.sub('\n', markup))).strip()
+
+def _dot_label(label: str, name: str, graph: str) -> str:
+    def replace(match):
+        char = match.group(1)
+        if char in 'nlr':
+            return '\n'
+        return {'N': name, 'G': graph}.get(char, char)
+    return _DOT_ESCAPE.sub(replace, label).rstrip('\n')
+
+def _number(value: Optional[str]) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def dot_arrow_type(attributes: Dict[str, str]) -> Optional[str]:
+    """The arrow type for an edge's attributes, or None where the graph's default applies."""
+    style = attributes.get('style', '').lower()
+    if attributes.get('dir', '').lower() == 'both':
+        return 'bidirectional'
+    if 'dashed' in style:
+        return 'dashed'
+    if 'dotted' in style:
+        return 'dotted'
+    if ':' in attributes.get('color', ''):
+        return 'double'  # A color list draws parallel lines
+    if 'bold' in style or _number(attributes.get('penwidth')) >= BOLD_PENWIDTH:
+        return 'thick'
+    return None
+
+class _DotParser:
+    """Recursive descent over the DOT grammar, building as it goes.
+    
+    Node and edge defaults are scoped to their subgraph. Ports, and every
+    attribute without a counterpart in this tool, are read and dropped.
+    """
+    def __init__(self, tokens: Iterator[Tuple[str, str, int]], builder: _DocumentBuilder):
+        self.tokens = tokens
+        self.builder = builder
+        self.end = ('', '', 0)
+        self.token = next(tokens, self.end)
+        self.name = ''
+        self.attributes: Dict[str, str] = {}  # Top-level graph attributes
+        
+    def advance(self) -> Tuple[str, str, int]:
+        token = self.token
+        self.token = next(self.tokens, self.end)
+        return token
+        
+    def at(self, op: str) -> bool:
+        return self.token[0] == op
+        
+    def accept(self, op: str) -> bool:
+        if self.at(op):
+            self.advance()
+            return True
+        return False
+        
+    def expect(self, op: str):
+        if not self.accept(op):
+            raise ValueError(f"expected {op!r} but found {self.describe()}")
+            
+    def describe(self) -> str:
+        if self.token is self.end:
+            return "the end of the file"
+        return f"{self.token[1]!r} on line {self.token[2]}"
+        
+    def keyword(self, *words: str) -> bool:
+        return self.token[0] == 'id' and self.token[1].lower() in words
+        
+    def at_identifier(self) -> bool:
+        return self.token[0] in ('id', 'string')
+        
+    def identifier(self) -> str:
+        if not self.at_identifier():
+            raise ValueError(f"expected a name but found {self.describe()}")
+        kind, text, _ = self.advance()
+        while kind == 'string' and self.accept('+'):
+            text += self.identifier()
+        return text
+        
+    def parse(self) -> _DocumentBuilder:
+        if self.keyword('strict'):
+            self.advance()
+        if not self.keyword('graph', 'digraph'):
+            raise ValueError(f"expected a graph but found {self.describe()}")
+        self.advance()
+        if self.at_identifier():
+            self.name = self.identifier()
+        self.expect('{')
+        self.statements({}, {}, {}, top=True)
+        self.expect('}')
+        return self.builder
+        
+    def statements(self, node_defaults: Dict[str, str], edge_defaults: Dict[str, str],
+                   members: Dict[str, None], top: bool = False):
+        while self.token is not self.end and not self.at('}'):
+            self.statement(node_defaults, edge_defaults, members, top)
+            self.accept(';')
+            
+    def statement(self, node_defaults, edge_defaults, members, top):
+        if self.keyword('node', 'edge', 'graph'):
+            kind = self.advance()[1].lower()
+            attributes = self.attribute_list()
+            if kind == 'node':
+                node_defaults.update(attributes)
+            elif kind == 'edge':
+                edge_defaults.update(attributes)
+            elif top:
+                self.attributes.update(attributes)
+            return
+        if self.at('{') or self.keyword('subgraph'):
+            operand = self.subgraph(node_defaults, edge_defaults)
+            members.update(operand)
+        else:
+            name = self.identifier()
+            if self.accept('='):
+                value = self.identifier()
+                if top:
+                    self.attributes[name] = value
+                return
+            self.port()
+            if not (self.at('->') or self.at('--')):
+                self.node(name, node_defaults, self.attribute_list())
+                members[name] = None
+                return
+            operand = {name: None}
+            self.node(name, node_defaults)
+            members[name] = None
+            
+        # An edge chain: every node of each operand connects to every node of the next
+        operands = [operand]
+        while self.accept('->') or self.accept('--'):
+            if self.at('{') or self.keyword('subgraph'):
+                operand = self.subgraph(node_defaults, edge_defaults)
+            else:
+                name = self.identifier()
+                self.port()
+                self.node(name, node_defaults)
+                operand = {name: None}
+            members.update(operand)
+            operands.append(operand)
+        attributes = dict(edge_defaults)
+        attributes.update(self.attribute_list())
+        arrow_type = dot_arrow_type(attributes)
+        for sources, targets in zip(operands, operands[1:]):
+            for source in sources:
+                for target in targets:
+                    self.builder.edge(source, target, arrow_type)
+                    
+    def subgraph(self, node_defaults, edge_defaults) -> Dict[str, None]:
+        if self.keyword('subgraph'):
+            self.advance()
+            if self.at_identifier():
+                self.identifier()
+        self.expect('{')
+        members: Dict[str, None] = {}
+        self.statements(dict(node_defaults), dict(edge_defaults), members)
+        self.expect('}')
+        return members
+        
+    def port(self):
+        # node:port or node:port:compass; connectors attach to the nearest port here
+        while self.accept(':'):
+            self.identifier()
+            
+    def attribute_list(self) -> Dict[str, str]:
+        attributes = {}
+        while self.accept('['):
+            while not self.accept(']'):
+                key = self.identifier()
+                attributes[key.lower()] = self.identifier() if self.accept('=') else 'true'
+                if not self.accept(','):
+                    self.accept(';')
+        return attributes
+        
+    def node(self, name: str, defaults: Dict[str, str], attributes: Optional[Dict[str, str]] = None):
+        builder = self.builder
+        if name in builder.shapes:
+            if not attributes:
+                return
+        else:
+            attributes = {**defaults, **(attributes or {})}
+        shape_type = None
+        if 'shape' in attributes or name not in builder.shapes:
+            shape_type = DOT_SHAPES.get(attributes.get('shape', DOT_DEFAULT_SHAPE).lower(), 'rectangle')
+        text = None
+        if 'label' in attributes or name not in builder.shapes:
+            text = _dot_label(attributes.get('label', '\\N'), name, self.name)
+        builder.node(name, shape_type, text)
+
+def read_dot(fp) -> Tuple[FlowchartDocument, int]:
+    """Import the first graph of an open DOT file; returns the document and 0 skipped statements.
+    
+    Raises ValueError on a syntax error.
+    """
+    parser = _DotParser(_dot_tokens(fp), _DocumentBuilder())
+    builder = parser.parse()
+    builder.direction = _direction(parser.attributes.get('rankdir'))
+    return builder.finish(DOT_SPLINES.get(parser.attributes.get('splines', '').lower(), 'straight')), 0
+
+# --- Mermaid -----------------------------------------------------------
+
+# Openers longest first; each lists the closers it accepts
+MERMAID_SHAPES = (
+    ('(((', (')))',), 'oval'),
+    ('((', ('))',), 'oval'),
+    ('([', ('])',), 'oval'),
+    ('[[', (']]',), 'rectangle'),
+    ('[(', (')]',), 'rectangle'),
+    ('[/', ('/]', '\\]'), 'parallelogram'),
+    ('[\\', ('\\]', '/]'), 'parallelogram'),
+    ('{{', ('}}',), 'hexagon'),
+    ('{', ('}',), 'diamond'),
+    ('[', (']',), 'rectangle'),
+    ('(', (')',), 'rectangle'),
+    ('>', (']',), 'rectangle'),
+)
+MERMAID_SKIPPED = frozenset(('classdef', 'class', 'style', 'linkstyle', 'click', 'direction', 'subgraph', 'end',
+                             'acctitle', 'accdescr'))
+
+_MERMAID_HEADER = re.compile(r'(?:flowchart|graph)(?:\s+(\w+))?\s*$', re.I)
+_MERMAID_STATEMENT = re.compile(r'(?:"[^"]*"|[^;"])+')
+_MERMAID_NODE = re.compile(r'\s*(\w+(?:-\w+)*)')
+_MERMAID_CLASS = re.compile(r':::[\w-]+')
+_MERMAID_AND = re.compile(r'\s*&')
+_MERMAID_TEXT_LINK = re.compile(r'\s*(<|[ox](?=[-=]))?(--|==|-\.)\s+(?![-=.>])(.+?)\s+(-{2,}|={2,}|\.-+)(>|[ox](?!\w))?')
+_MERMAID_LINK = re.compile(r'\s*(<|[ox](?=[-=.~]))?(-{2,}|={2,}|-\.+-|~{3,})(>|[ox](?!\w))?(?:\s*\|[^|]*\|)?')
+_MERMAID_BREAK = re.compile(r'<br\s*/?>', re.I)
+
+def mermaid_arrow_type(start: Optional[str], line: str, end: Optional[str]) -> Optional[str]:
+    """The arrow type for a link's pieces, or None for an invisible link.
+    
+    An open link (---) becomes a plain line. Open thick and dotted links
+    (===, -.-) have no headless counterpart and keep their arrowhead.
+    """
+    if line.startswith('~'):
+        return None
+    if start and end:
+        return 'bidirectional'
+    if '=' in line:
+        return 'thick'
+    if '.' in line:
+        return 'dotted'
+    return 'straight' if end else 'line'
+
+def _mermaid_text(text: str) -> str:
+    text = text.strip()
+    if len(text) >= 2 and text[0] == text[-1] == '"':
+        text = text[1:-1]
+    if len(text) >= 2 and text[0] == text[-1] == '`':
+        text = text[1:-1]  # Markdown strings
+    return _MERMAID_BREAK.sub('\n', text).strip()
+
+def _mermaid_node(statement: str, pos: int, nodes: List[Tuple[str, Optional[str], Optional[str]]]) -> Tuple[Optional[str], int]:
+    """Parse one node reference at pos into nodes; returns its name (None if there is none) and the end."""
+    match = _MERMAID_NODE.match(statement, pos)
+    if match is None:
+        return None, pos
+    name, pos = match.group(1), match.end()
+    shape_type = text = None
+    for opener, closers, kind in MERMAID_SHAPES:
+        if not statement.startswith(opener, pos):
+            continue
+        start = pos + len(opener)
+        search = start
+        stripped = statement[start:].lstrip()
+        if stripped.startswith('"'):
+            # Quoted text may contain the closing brackets
+            quote = statement.find('"', len(statement) - len(stripped) + 1)
+            if quote < 0:
+                return None, pos
+            search = quote + 1
+        ends = [(statement.find(closer, search), closer) for closer in closers]
+        ends = [(index, closer) for index, closer in ends if index >= 0]
+        if not ends:
+            return None, pos
+        index, closer = min(ends)
+        shape_type, text = kind, _mermaid_text(statement[start:index])
+        pos = index + len(closer)
+        break
+    match = _MERMAID_CLASS.match(statement, pos)
+    if match is not None:
+        pos = match.end()
+    nodes.append((name, shape_type, text))
+    return name, pos
+
+def _mermaid_group(statement: str, pos: int, nodes) -> Tuple[List[str], int]:
+    names = []
+    while True:
+        name, pos = _mermaid_node(statement, pos, nodes)
+        if name is None:
+            return [], pos
+        names.append(name)
+        match = _MERMAID_AND.match(statement, pos)
+        if match is None:
+            return names, pos
+        pos = match.end()
+
+def _mermaid_statement(statement: str, builder: _DocumentBuilder) -> bool:
+    """Apply a node or link statement; False (applying nothing) if it could not be read."""
+    nodes: List[Tuple[str, Optional[str], Optional[str]]] = []
+    edges: List[Tuple[str, str, str]] = []
+    group, pos = _mermaid_group(statement, 0, nodes)
+    if not group:
+        return False
+    while True:
+        match = _MERMAID_TEXT_LINK.match(statement, pos) or _MERMAID_LINK.match(statement, pos)
+        if match is None:
+            break
+        if match.re is _MERMAID_TEXT_LINK:
+            start, opener, _, closer, end = match.groups()
+            line = opener + closer
+        else:
+            start, line, end = match.groups()
+        targets, pos = _mermaid_group(statement, match.end(), nodes)
+        if not targets:
+            return False
+        arrow_type = mermaid_arrow_type(start, line, end)
+        if arrow_type is not None:
+            edges.extend((source, target, arrow_type) for source in group for target in targets)
+        group = targets
+    if statement[pos:].strip():
+        return False
+    for node in nodes:
+        builder.node(*node)
+    for edge in edges:
+        builder.edge(*edge)
+    return True
+
+def read_mermaid(fp) -> Tuple[FlowchartDocument, int]:
+    """Import an open Mermaid flowchart, reading it line by line.
+    
+    Returns the document and the number of statements that could not be
+    read and were skipped. Styling, classes, click handlers and subgraph
+    boundaries are dropped; the nodes inside subgraphs are kept. Raises
+    ValueError if the file is not a flowchart.
+    """
+    builder = _DocumentBuilder()
+    skipped = 0
+    header = False
+    front_matter = False
+    for number, line in enumerate(fp, 1):
+        line = line.strip()
+        if number == 1 and line == '---':
+            front_matter = True
+            continue
+        if front_matter:
+            front_matter = line != '---'
+            continue
+        if not line or line.startswith('%%'):
+            continue
+        for statement in _MERMAID_STATEMENT.findall(line):
+            statement = statement.strip()
+            if not statement:
+                continue
+            if not header:
+                match = _MERMAID_HEADER.match(statement)
+                if match is None:
+                    raise ValueError(f"line {number} is not a flowchart header: {statement[:40]!r}")
+                builder.direction = _direction(match.group(1))
+                header = True
+            elif statement.split(None, 1)[0].lower() not in MERMAID_SKIPPED:
+                if not _mermaid_statement(statement, builder):
+                    skipped += 1
+    if not header:
+        raise ValueError("no flowchart header")
+    return builder.finish(), skipped
+
+def import_file(filename: str) -> Tuple[FlowchartDocument, int]:
+    """Import a DOT (.dot, .gv) or Mermaid (.mmd, .mermaid) file, laid out.
+    
+    Returns the document and the number of statements skipped.
+    """
+    reader = read_mermaid if filename.lower().endswith(MERMAID_EXTENSIONS) else read_dot
+    with open(filename, 'r', encoding='utf-8') as f:
+        return reader(f)
+        
\ No newline at end of file
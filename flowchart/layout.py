@@ -0,0 +1,314 @@
+"""Layered (Sugiyama-style) automatic layout.
+
+Works on a document's shapes and the arrows attached between them, top to
+bottom: break cycles, assign layers, order each layer to cut crossings,
+then assign coordinates. Tk-free like the rest of the geometry code; the
+per-layer barycenter and packing passes run vectorized when NumPy is
+installed and fall back to plain Python otherwise.
+"""
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
+from .geometry import NUMPY_BATCH_THRESHOLD, numpy_module
+
+np = numpy_module()  # Layouts are heavy enough that loading NumPy with this module costs nothing extra
+
+LAYER_GAP = 80        # Vertical space between consecutive layers
+NODE_GAP = 40         # Horizontal space between neighbours within a layer
+CROSSING_SWEEPS = 4   # Down-and-up barycenter sweeps when ordering layers
+COORD_PASSES = 4      # Down-and-up passes pulling shapes over their neighbours
+TIGHTEN_PASSES = 2    # Passes moving nodes between layers to shorten edges
+
+def _graph(document) -> Tuple[list, List[Tuple[int, int]]]:
+    """Shapes in z order and the distinct edges between their indices."""
+    shapes = document.shapes()
+    index = {shape.id: i for i, shape in enumerate(shapes)}
+    edges = set()
+    for arrow in document.arrows():
+        source, target = index.get(arrow.source_id), index.get(arrow.target_id)
+        if source is not None and target is not None and source != target:
+            edges.add((source, target))
+    return shapes, sorted(edges)
+
+def _break_cycles(count: int, edges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Reverse the back edges of a depth-first search so the graph is acyclic."""
+    successors: List[List[int]] = [[] for _ in range(count)]
+    for source, target in edges:
+        successors[source].append(target)
+    state = bytearray(count)  # 0 unvisited, 1 on the stack, 2 finished
+    back = set()
+    for root in range(count):
+        if state[root]:
+            continue
+        state[root] = 1
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            node, pending = stack[-1]
+            for target in pending:
+                if state[target] == 1:
+                    back.add((node, target))
+                elif state[target] == 0:
+                    state[target] = 1
+                    stack.append((target, iter(successors[target])))
+                    break
+            else:
+                state[node] = 2
+                stack.pop()
+    return [(target, source) if (source, target) in back else (source, target) for source, target in edges]
+
+def _assign_layers(count: int, edges: List[Tuple[int, int]]) -> List[int]:
+    """Longest-path layering: every edge points at least one layer down."""
+    successors: List[List[int]] = [[] for _ in range(count)]
+    indegree = [0] * count
+    for source, target in edges:
+        successors[source].append(target)
+        indegree[target] += 1
+    layer = [0] * count
+    ready = [node for node in range(count) if not indegree[node]]
+    while ready:
+        node = ready.pop()
+        for target in successors[node]:
+            if layer[target] <= layer[node]:
+                layer[target] = layer[node] + 1
+            indegree[target] -= 1
+            if not indegree[target]:
+                ready.append(target)
+    return layer
+
+def _tighten(layer: List[int], edges: List[Tuple[int, int]], passes: int = TIGHTEN_PASSES):
+    """Shorten edges by sliding nodes between their neighbours' layers.
+    
+    Longest-path layering leaves sources at the top however far down their
+    targets are, which would stretch their edges over many dummy nodes.
+    A node with more edges out than in moves as far down as its targets
+    allow, one with more in than out as far up as its sources allow.
+    """
+    predecessors: List[List[int]] = [[] for _ in layer]
+    successors: List[List[int]] = [[] for _ in layer]
+    for source, target in edges:
+        successors[source].append(target)
+        predecessors[target].append(source)
+    by_depth = sorted(range(len(layer)), key=layer.__getitem__, reverse=True)
+    for _ in range(passes):
+        for node in by_depth:
+            balance = len(successors[node]) - len(predecessors[node])
+            if balance > 0:
+                layer[node] = min(layer[target] for target in successors[node]) - 1
+            elif balance < 0:
+                layer[node] = max(layer[source] for source in predecessors[node]) + 1
+    # Close up any layers left empty
+    used = {depth: rank for rank, depth in enumerate(sorted(set(layer)))}
+    layer[:] = [used[depth] for depth in layer]
+
+def _split_long_edges(layer: List[int], edges: List[Tuple[int, int]], vectorized: bool):
+    """Chain edges spanning several layers through dummy nodes, one per layer crossed.
+    
+    Returns the layer of every node, dummies numbered after the shapes, and
+    the upper and lower ends of the resulting edges, which all join
+    adjacent layers.
+    """
+    if not vectorized:
+        layer = layer[:]
+        uppers, lowers = [], []
+        for source, target in edges:
+            upper = source
+            for depth in range(layer[source] + 1, layer[target]):
+                layer.append(depth)
+                uppers.append(upper)
+                lowers.append(len(layer) - 1)
+                upper = len(layer) - 1
+            uppers.append(upper)
+            lowers.append(target)
+        return layer, uppers, lowers
+        
+    layer = np.asarray(layer, dtype=np.intp)
+    sources, targets = np.asarray(edges, dtype=np.intp).reshape(-1, 2).T
+    extra = layer[targets] - layer[sources] - 1
+    first = len(layer) + np.cumsum(extra) - extra  # Each chain's first dummy
+    owner = np.repeat(np.arange(len(extra)), extra)
+    dummies = np.arange(len(layer), len(layer) + extra.sum())
+    step = dummies - first[owner]                  # Place along the chain
+    # Every dummy hangs below the previous node of its chain, and every
+    # chain ends in an edge from its last node to the real target
+    above = np.where(step == 0, sources[owner], dummies - 1)
+    last = np.where(extra > 0, first + extra - 1, sources)
+    return (np.concatenate([layer, layer[sources[owner]] + 1 + step]),
+            np.concatenate([above, last]), np.concatenate([dummies, targets]))
+
+class _Layers:
+    """Layer membership plus the edges between adjacent layers, grouped per layer.
+    
+    Each node keeps a fixed slot within its layer; its current place in the
+    layer's order lives in pos and is what the sweeps rearrange.
+    """
+    def __init__(self, layer, uppers, lowers, vectorized: bool):
+        self.vectorized = vectorized
+        if vectorized:
+            depth = int(layer.max()) + 1
+            order = np.argsort(layer, kind='stable')
+            sizes = np.bincount(layer, minlength=depth)
+            starts = np.cumsum(sizes) - sizes
+            self.slot = np.empty(len(layer), dtype=np.intp)
+            self.slot[order] = np.arange(len(layer)) - starts[layer[order]]
+            self.members = np.split(order, starts[1:])
+            self.pos = self.slot.astype(float)
+        else:
+            depth = max(layer) + 1
+            self.members: List[List[int]] = [[] for _ in range(depth)]
+            self.slot = [0] * len(layer)
+            for node, level in enumerate(layer):
+                self.slot[node] = len(self.members[level])
+                self.members[level].append(node)
+            self.pos = self.slot[:]
+            
+        # Downward sweeps look at each layer's edges from above, upward
+        # sweeps at its edges from below
+        self.above = self._group(depth, layer, lowers, uppers)
+        self.below = self._group(depth, layer, uppers, lowers)
+        
+    def _group(self, depth: int, layer, owners, others) -> list:
+        """Per layer: the slots of the edges' nodes in it and the neighbours at their other ends."""
+        if self.vectorized:
+            levels = layer[owners]
+            order = np.argsort(levels, kind='stable')
+            bounds = np.cumsum(np.bincount(levels, minlength=depth))[:-1]
+            return list(zip(np.split(self.slot[owners[order]], bounds), np.split(others[order], bounds)))
+        groups = [([], []) for _ in range(depth)]
+        for owner, other in zip(owners, others):
+            group = groups[layer[owner]]
+            group[0].append(self.slot[owner])
+            group[1].append(other)
+        return groups
+        
+    def pull(self, level: int, values, neighbours) -> list:
+        """Mean of values over each node's neighbours, or its own value if it has none."""
+        members = self.members[level]
+        own, other = neighbours[level]
+        if self.vectorized:
+            mine = values[members]
+            if not len(own):
+                return mine
+            counts = np.bincount(own, minlength=len(members))
+            sums = np.bincount(own, weights=values[other], minlength=len(members))
+            return np.where(counts > 0, sums / np.maximum(counts, 1), mine)
+        sums = [0.0] * len(members)
+        counts = [0] * len(members)
+        for slot, node in zip(own, other):
+            sums[slot] += values[node]
+            counts[slot] += 1
+        return [sums[slot] / counts[slot] if counts[slot] else values[node] for slot, node in enumerate(members)]
+        
+    def reorder(self, level: int, neighbours):
+        """Sort one layer by its barycenters over the adjacent layer, ties kept in place."""
+        members = self.members[level]
+        keys = self.pull(level, self.pos, neighbours)
+        if self.vectorized:
+            order = np.lexsort((self.pos[members], keys))
+            self.pos[members[order]] = np.arange(len(members))
+            return
+        order = sorted(range(len(members)), key=lambda slot: (keys[slot], self.pos[members[slot]]))
+        for rank, slot in enumerate(order):
+            self.pos[members[slot]] = rank
+            
+    def ordered(self, level: int):
+        """The layer's nodes in their current left-to-right order."""
+        members = self.members[level]
+        if self.vectorized:
+            return members[np.argsort(self.pos[members], kind='stable')]
+        return sorted(members, key=self.pos.__getitem__)
+
+def _pack(desired, separation):
+    """Centers as close to desired as the minimum separations between neighbours allow.
+    
+    Pushing right from the left and left from the right each give a
+    feasible placement; their average is feasible too and stays centered.
+    """
+    if np is not None and isinstance(desired, np.ndarray):
+        offsets = np.cumsum(separation)
+        slack = desired - offsets
+        from_left = offsets + np.maximum.accumulate(slack)
+        from_right = offsets + np.minimum.accumulate(slack[::-1])[::-1]
+        return (from_left + from_right) / 2
+    offsets = list(accumulate(separation))
+    slack = [d - o for d, o in zip(desired, offsets)]
+    from_left = accumulate(slack, max)
+    from_right = reversed(list(accumulate(reversed(slack), min)))
+    return [o + (a + b) / 2 for o, a, b in zip(offsets, from_left, from_right)]
+
+def layered_layout(document, layer_gap: float = LAYER_GAP, node_gap: float = NODE_GAP,
+                   sweeps: int = CROSSING_SWEEPS, passes: int = COORD_PASSES) -> Dict[int, Tuple[int, int]]:
+    """Lay a document's shapes out top to bottom along their connectors.
+    
+    Returns the new top-left corner for every shape id, with the layout's
+    top-left corner where the diagram's was. The document is not modified.
+    """
+    shapes, edges = _graph(document)
+    if not shapes:
+        return {}
+    count = len(shapes)
+    acyclic = _break_cycles(count, edges)
+    layer = _assign_layers(count, acyclic)
+    _tighten(layer, acyclic)
+    vectorized = np is not None and count >= NUMPY_BATCH_THRESHOLD
+    layers = _Layers(*_split_long_edges(layer, acyclic, vectorized), vectorized)
+    depth = len(layers.members)
+    
+    # Crossing minimization: alternate barycenter sweeps down and up
+    for _ in range(sweeps):
+        for level in range(1, depth):
+            layers.reorder(level, layers.above)
+        for level in range(depth - 2, -1, -1):
+            layers.reorder(level, layers.below)
+            
+    # Coordinate assignment: pack each layer in order, then let shapes drift
+    # towards their neighbours without overlapping or changing the order
+    total = len(layers.slot)
+    widths = [shape.width for shape in shapes] + [0] * (total - count)
+    if layers.vectorized:
+        widths = np.asarray(widths, dtype=float)
+        x = np.zeros(total)
+    else:
+        x = [0.0] * total
+    rows = [layers.ordered(level) for level in range(depth)]
+    separations = []
+    for nodes in rows:
+        if layers.vectorized:
+            row_widths = widths[nodes]
+            separation = np.zeros(len(nodes))
+            separation[1:] = (row_widths[:-1] + row_widths[1:]) / 2 + node_gap
+            packed = np.cumsum(separation)
+            x[nodes] = packed - packed[-1] / 2
+        else:
+            row_widths = [widths[node] for node in nodes]
+            separation = [0] + [(a + b) / 2 + node_gap for a, b in zip(row_widths, row_widths[1:])]
+            packed = list(accumulate(separation))
+            for node, value in zip(nodes, packed):
+                x[node] = value - packed[-1] / 2
+        separations.append(separation)
+        
+    for _ in range(passes):
+        for order, neighbours in ((range(1, depth), layers.above), (range(depth - 2, -1, -1), layers.below)):
+            for level in order:
+                nodes = rows[level]
+                # pull() answers in slot order; _pack() wants layer order
+                desired = layers.pull(level, x, neighbours)
+                if layers.vectorized:
+                    x[nodes] = _pack(desired[layers.slot[nodes]], separations[level])
+                else:
+                    packed = _pack([desired[layers.slot[node]] for node in nodes], separations[level])
+                    for node, value in zip(nodes, packed):
+                        x[node] = value
+                        
+    # Layers stack downwards, each as tall as its tallest shape
+    heights = [0.0] * depth
+    for i, shape in enumerate(shapes):
+        heights[layer[i]] = max(heights[layer[i]], shape.height)
+    centers = [0.0] * depth
+    for level in range(1, depth):
+        centers[level] = centers[level - 1] + (heights[level - 1] + heights[level]) / 2 + layer_gap
+        
+    corners = [(x[i] - shape.width / 2, centers[layer[i]] - shape.height / 2) for i, shape in enumerate(shapes)]
+    dx = min(shape.x for shape in shapes) - min(cx for cx, _ in corners)
+    dy = min(shape.y for shape in shapes) - min(cy for _, cy in corners)
+    return {shape.id: (round(cx + dx), round(cy + dy)) for shape, (cx, cy) in zip(shapes, corners)}
+    
\ No newline at end of file
@@ -0,0 +1,353 @@
+"""Flowchart document model: shapes, arrows and the document that owns them."""
+from __future__ import annotations
+
+from array import array
+from collections import deque
+from itertools import islice
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Dict, List, Optional, Tuple
+
+from .geometry import (ARROW_BOUNDS_PAD, ARROW_TYPES, POLYGON_SHAPES, SHAPE_TYPES,
+                      nearest_port, point_in_polygon, port_position, shape_points)
+
+GRAPH_LOG_SIZE = 10000  # Graph changes remembered for readers that catch up incrementally
+
+class FlowchartShape:
+    __slots__ = ('shape_type', 'x', 'y', 'width', 'height', 'text', 'id', 'z', 'canvas_id', 'text_id')
+    
+    def __init__(self, shape_type: str, x: int, y: int, width: int = 100, height: int = 50, text: str = ""):
+        self.shape_type = shape_type
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.text = text
+        self.id = None  # Assigned by the FlowchartDocument that owns the shape
+        self.z = None
+        self.canvas_id = None
+        self.text_id = None
+        
+    def bounds(self) -> Tuple[float, float, float, float]:
+        return (self.x, self.y, self.x + self.width, self.y + self.height)
+        
+    def contains_point(self, px: float, py: float) -> bool:
+        """Exact hit test against the outline drawn for this shape."""
+        x1, y1, x2, y2 = self.bounds()
+        if not (x1 <= px <= x2 and y1 <= py <= y2):
+            return False
+        if self.shape_type == 'oval':
+            rx, ry = self.width / 2, self.height / 2
+            if rx <= 0 or ry <= 0:
+                return False
+            dx = (px - (x1 + rx)) / rx
+            dy = (py - (y1 + ry)) / ry
+            return dx * dx + dy * dy <= 1.0
+        if self.shape_type in POLYGON_SHAPES:
+            return point_in_polygon(px, py, shape_points(self.shape_type, self.x, self.y, self.width, self.height))
+        return True
+        
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'shape_type': self.shape_type,
+            'x': self.x,
+            'y': self.y,
+            'width': self.width,
+            'height': self.height,
+            'text': self.text
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        shape = cls(data['shape_type'], data['x'], data['y'], 
+                    data['width'], data['height'], data['text'])
+        shape.id = data.get('id')
+        return shape
+
+class FlowchartArrow:
+    __slots__ = ('arrow_type', 'start_x', 'start_y', 'end_x', 'end_y', 'source_id', 'source_port',
+                 'target_id', 'target_port', 'waypoints', 'id', 'z', 'canvas_ids')
+    
+    def __init__(self, arrow_type: str, start_x: float, start_y: float, end_x: float, end_y: float):
+        self.arrow_type = arrow_type  # 'straight', 'curved', 'dashed', 'double', 'bidirectional'
+        self.start_x = start_x
+        self.start_y = start_y
+        self.end_x = end_x
+        self.end_y = end_y
+        # Shapes the ends are attached to, by id. A bound end follows its shape;
+        # a port of None floats to whichever side faces the other end.
+        self.source_id = None
+        self.source_port = None
+        self.target_id = None
+        self.target_port = None
+        # Bend points of a routed 'orthogonal' connector; derived, not saved
+        self.waypoints = []
+        self.id = None
+        self.z = None
+        self.canvas_ids = []  # Multiple canvas items for complex arrows
+        
+    def bounds(self) -> Tuple[float, float, float, float]:
+        # Padded to cover the curved connector's bulge and the arrowheads
+        pad = ARROW_BOUNDS_PAD
+        xs = [self.start_x, self.end_x] + self.waypoints[0::2]
+        ys = [self.start_y, self.end_y] + self.waypoints[1::2]
+        return (min(xs) - pad, min(ys) - pad, max(xs) + pad, max(ys) + pad)
+        
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'arrow_type': self.arrow_type,
+            'start_x': self.start_x,
+            'start_y': self.start_y,
+            'end_x': self.end_x,
+            'end_y': self.end_y,
+            'source': self.source_id,
+            'source_port': self.source_port,
+            'target': self.target_id,
+            'target_port': self.target_port
+        }
+        
+    @classmethod
+    def from_dict(cls, data):
+        arrow = cls(data['arrow_type'], data['start_x'], data['start_y'], data['end_x'], data['end_y'])
+        arrow.id = data.get('id')
+        arrow.source_id = data.get('source')
+        arrow.source_port = data.get('source_port')
+        arrow.target_id = data.get('target')
+        arrow.target_port = data.get('target_port')
+        return arrow
+
+class FlowchartDocument:
+    """Owns the shapes and arrows of one flowchart.
+    
+    Every object gets an integer id that stays stable for the lifetime of the
+    document. Ids are never reused, so undo can bring a deleted object back
+    under the same id; adding an object whose id is taken is an error. Objects live in dicts keyed by id, which makes deletes
+    O(1), and each carries an explicit z value that defines stacking order.
+    
+    Arrows attach to shapes by id. An adjacency index maps each shape id to
+    the arrows touching it, so moving or deleting a shape only has to visit
+    its own connectors. Bindings may name shapes that are not in the
+    document (yet); such ends just keep their stored coordinates.
+    
+    Arrows bound at both ends also form a directed graph between shape ids,
+    kept as successor and predecessor counts that every edit updates in
+    place. revision changes whenever that graph or the set of shapes does
+    (moves leave it alone), so graph queries can cache their results, and
+    graph_changes() lists what changed since a given revision so they can
+    update them instead.
+    """
+    def __init__(self, shapes=(), arrows=()):
+        self._shapes: Dict[int, FlowchartShape] = {}
+        self._arrows: Dict[int, FlowchartArrow] = {}
+        self._incident: Dict[int, Dict[int, FlowchartArrow]] = {}
+        self._successors: Dict[int, Dict[int, int]] = {}    # source id -> {target id: arrows}
+        self._predecessors: Dict[int, Dict[int, int]] = {}  # target id -> {source id: arrows}
+        self.revision = 0
+        self._graph_log: deque = deque(maxlen=GRAPH_LOG_SIZE)  # One entry per revision
+        # Dict order doubles as z-order until an object comes back below the top
+        self._shapes_sorted = True
+        self._arrows_sorted = True
+        self.next_id = 1
+        self.next_z = 0
+        for shape in shapes:
+            self.add_shape(shape)
+        for arrow in arrows:
+            self.add_arrow(arrow)
+            
+    def __bool__(self):
+        return bool(self._shapes or self._arrows)
+        
+    def _claim(self, item, table):
+        if item.id is None:
+            item.id = self.next_id
+        elif item.id in self._shapes or item.id in self._arrows:
+            # Handing out another id would leave bindings to this one pointing at the wrong object
+            raise ValueError(f"id {item.id} is already in use")
+        self.next_id = max(self.next_id, item.id + 1)
+        if item.z is None:
+            item.z = self.next_z
+        self.next_z = max(self.next_z, item.z + 1)
+        table[item.id] = item
+        
+    def add_shape(self, shape: FlowchartShape) -> int:
+        """Add a new shape, or bring a removed one back with its old id and z.
+        
+        Raises ValueError if another shape or arrow already has the shape's id.
+        """
+        restoring = shape.z is not None and shape.z < self.next_z
+        self._claim(shape, self._shapes)
+        if restoring:
+            self._shapes_sorted = False
+        self._graph_changed(shape.id)
+        return shape.id
+        
+    def remove_shape(self, shape: FlowchartShape):
+        del self._shapes[shape.id]
+        self._graph_changed(shape.id)
+        
+    def add_arrow(self, arrow: FlowchartArrow) -> int:
+        restoring = arrow.z is not None and arrow.z < self.next_z
+        self._claim(arrow, self._arrows)
+        if restoring:
+            self._arrows_sorted = False
+        self._link(arrow)
+        return arrow.id
+        
+    def remove_arrow(self, arrow: FlowchartArrow):
+        self._unlink(arrow)
+        del self._arrows[arrow.id]
+        
+    def _link(self, arrow: FlowchartArrow):
+        for shape_id in (arrow.source_id, arrow.target_id):
+            if shape_id is not None:
+                self._incident.setdefault(shape_id, {})[arrow.id] = arrow
+        source, target = arrow.source_id, arrow.target_id
+        if source is not None and target is not None:
+            successors = self._successors.setdefault(source, {})
+            successors[target] = successors.get(target, 0) + 1
+            predecessors = self._predecessors.setdefault(target, {})
+            predecessors[source] = predecessors.get(source, 0) + 1
+            self._graph_changed(source, target)
+                
+    def _unlink(self, arrow: FlowchartArrow):
+        for shape_id in (arrow.source_id, arrow.target_id):
+            incident = self._incident.get(shape_id)
+            if incident is not None:
+                incident.pop(arrow.id, None)
+                if not incident:
+                    del self._incident[shape_id]
+        source, target = arrow.source_id, arrow.target_id
+        if source is not None and target is not None:
+            for table, a, b in ((self._successors, source, target), (self._predecessors, target, source)):
+                counts = table[a]
+                counts[b] -= 1
+                if not counts[b]:
+                    del counts[b]
+                    if not counts:
+                        del table[a]
+            self._graph_changed(source, target)
+            
+    def _graph_changed(self, shape_id: int, target: Optional[int] = None):
+        self.revision += 1
+        self._graph_log.append((shape_id, target))
+        
+    def graph_changes(self, since: int) -> Optional[List[Tuple[int, Optional[int]]]]:
+        """What changed the graph after revision since, oldest first, or None if that is too long ago.
+        
+        A shape added or removed is (its id, None); an arrow bound or unbound
+        at both ends is (source id, target id), whether or not that changed
+        which shapes follow the source.
+        """
+        missing = self.revision - since
+        if not 0 <= missing <= len(self._graph_log):
+            return None
+        return list(islice(reversed(self._graph_log), missing))[::-1]
+                    
+    def incident_arrows(self, shape_id: int) -> List[FlowchartArrow]:
+        """Arrows with either end attached to the given shape."""
+        return list(self._incident.get(shape_id, {}).values())
+        
+    def successors(self, shape_id: int) -> Dict[int, int]:
+        """Ids the shape has arrows to, each with the number of those arrows. Do not modify."""
+        return self._successors.get(shape_id, {})
+        
+    def predecessors(self, shape_id: int) -> Dict[int, int]:
+        """Ids with arrows to the shape, each with the number of those arrows. Do not modify."""
+        return self._predecessors.get(shape_id, {})
+        
+    def attach(self, arrow: FlowchartArrow, end: str, shape: Optional[FlowchartShape], port: Optional[str] = None):
+        """Bind the 'source' or 'target' end of an arrow to a shape, or free it with None."""
+        live = arrow.id is not None and self._arrows.get(arrow.id) is arrow
+        if live:
+            self._unlink(arrow)
+        setattr(arrow, end + '_id', None if shape is None else shape.id)
+        setattr(arrow, end + '_port', None if shape is None else port)
+        if live:
+            self._link(arrow)
+            
+    def _end_point(self, shape_id, port, other_x, other_y):
+        shape = self._shapes.get(shape_id) if shape_id is not None else None
+        if shape is None:
+            return None
+        if port is None:
+            port = nearest_port(shape.shape_type, shape.x, shape.y, shape.width, shape.height, other_x, other_y)
+        return port_position(shape.shape_type, shape.x, shape.y, shape.width, shape.height, port)
+        
+    def route_arrow(self, arrow: FlowchartArrow) -> bool:
+        """Move an arrow's bound ends onto their shapes' ports; True if anything moved."""
+        old = (arrow.start_x, arrow.start_y, arrow.end_x, arrow.end_y)
+        start = self._end_point(arrow.source_id, arrow.source_port, arrow.end_x, arrow.end_y)
+        if start is not None:
+            arrow.start_x, arrow.start_y = start
+        end = self._end_point(arrow.target_id, arrow.target_port, arrow.start_x, arrow.start_y)
+        if end is not None:
+            arrow.end_x, arrow.end_y = end
+        return (arrow.start_x, arrow.start_y, arrow.end_x, arrow.end_y) != old
+        
+    def shape(self, shape_id: int) -> Optional[FlowchartShape]:
+        return self._shapes.get(shape_id)
+        
+    def arrow(self, arrow_id: int) -> Optional[FlowchartArrow]:
+        return self._arrows.get(arrow_id)
+        
+    def shape_count(self) -> int:
+        return len(self._shapes)
+        
+    def arrow_count(self) -> int:
+        return len(self._arrows)
+        
+    def shapes(self) -> List[FlowchartShape]:
+        """Live shapes from bottom to top."""
+        if not self._shapes_sorted:
+            self._shapes = {shape.id: shape for shape in sorted(self._shapes.values(), key=lambda shape: shape.z)}
+            self._shapes_sorted = True
+        return list(self._shapes.values())
+        
+    def arrows(self) -> List[FlowchartArrow]:
+        """Live arrows from bottom to top."""
+        if not self._arrows_sorted:
+            self._arrows = {arrow.id: arrow for arrow in sorted(self._arrows.values(), key=lambda arrow: arrow.z)}
+            self._arrows_sorted = True
+        return list(self._arrows.values())
+        
+    def shape_columns(self) -> Dict[str, array]:
+        """Shape geometry as parallel typed arrays, in z-order, for bulk processing."""
+        shapes = self.shapes()
+        return {
+            'id': array('q', [shape.id for shape in shapes]),
+            'kind': array('b', [SHAPE_TYPES.index(shape.shape_type) if shape.shape_type in SHAPE_TYPES else -1
+                                for shape in shapes]),
+            'x': array('d', [shape.x for shape in shapes]),
+            'y': array('d', [shape.y for shape in shapes]),
+            'width': array('d', [shape.width for shape in shapes]),
+            'height': array('d', [shape.height for shape in shapes]),
+        }
+        
+    def arrow_columns(self) -> Dict[str, array]:
+        """Arrow endpoints and bound shape ids (-1 if free) as parallel typed arrays, in z-order."""
+        arrows = self.arrows()
+        return {
+            'id': array('q', [arrow.id for arrow in arrows]),
+            'kind': array('b', [ARROW_TYPES.index(arrow.arrow_type) if arrow.arrow_type in ARROW_TYPES else -1
+                                for arrow in arrows]),
+            'start_x': array('d', [arrow.start_x for arrow in arrows]),
+            'start_y': array('d', [arrow.start_y for arrow in arrows]),
+            'end_x': array('d', [arrow.end_x for arrow in arrows]),
+            'end_y': array('d', [arrow.end_y for arrow in arrows]),
+            'source': array('q', [-1 if arrow.source_id is None else arrow.source_id for arrow in arrows]),
+            'target': array('q', [-1 if arrow.target_id is None else arrow.target_id for arrow in arrows]),
+        }
+        
+    def to_dict(self):
+        return {
+            'shapes': [shape.to_dict() for shape in self.shapes()],
+            'arrows': [arrow.to_dict() for arrow in self.arrows()]
+        }
+        
+    @classmethod
+    def from_dict(cls, data):
+        return cls([FlowchartShape.from_dict(shape_data) for shape_data in data['shapes']],
+                   [FlowchartArrow.from_dict(arrow_data) for arrow_data in data['arrows']])
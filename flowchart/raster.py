@@ -0,0 +1,570 @@
+"""Rasterizing flowcharts to PNG without Tk, at any size.
+
+Draws what draw_shape_on_canvas and draw_arrow_on_canvas draw, bottom to
+top: white shapes with black outlines, then the connectors and their
+arrowheads. Shape interiors are filled scanline by scanline; outlines,
+lines and arrowheads are anti-aliased, each pixel row sampled SUBSAMPLES
+times and every sample line covered exactly along x. Labels are not drawn.
+
+The image is cut into tiles. Every tile is rendered, in a pool of worker
+processes if asked, from just the pieces of the drawing that touch it, and
+a band of tiles at a time is compressed into PNG rows and written out, so
+memory stays at a few bands however large the image is. Tiles are drawn
+with NumPy when it is installed, and in plain Python otherwise:
+
+    render_png(document, 'diagram.png', bounds, scale=2, workers=8)
+"""
+import math
+import struct
+import zlib
+from array import array
+from collections import deque
+from typing import Dict, List, Tuple
+
+from .geometry import arrow_style, connector_geometry, numpy_module, shape_kind, shape_points, smooth_polyline
+
+TILE_SIZE = 512          # Tile edge in pixels; a band is one row of tiles
+SUBSAMPLES = 4           # Sample lines per pixel row for anti-aliasing
+BANDS_IN_FLIGHT = 2      # Bands rendering in the pool while an earlier one is written
+OUTLINE_WIDTH = 2        # As draw_shape_on_canvas and draw_arrow_on_canvas draw them
+LINE_WIDTH = 2
+MITER_LIMIT = 10         # Outline corners sharper than this miter are cut short
+CURVE_TOLERANCE = 0.25   # Most an ellipse's polygon strays from it, in pixels
+JOIN_TOLERANCE = 0.25    # Line joins leaving a smaller notch than this are left out
+WHITE = 255
+BLACK = 0
+COMPRESSION_LEVEL = 6
+IDAT_SIZE = 1 << 20      # Compressed bytes per PNG data chunk
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+FILL = 0   # Opaque, over the pixel centers inside by the even-odd rule
+COVER = 1  # Anti-aliased, blended by the covered fraction of each pixel
+
+# --- Outlines ----------------------------------------------------------
+
+def _orientation(points: List[float]) -> float:
+    """Twice the signed area; positive runs clockwise on screen, y pointing down."""
+    count = len(points)
+    return sum(points[i] * points[(i + 3) % count] - points[(i + 2) % count] * points[i + 1]
+               for i in range(0, count, 2))
+
+def _reversed(points: List[float]) -> List[float]:
+    result = []
+    for i in range(len(points) - 2, -1, -2):
+        result += (points[i], points[i + 1])
+    return result
+
+def _clockwise(points: List[float]) -> List[float]:
+    return _reversed(points) if _orientation(points) < 0 else points
+
+def _distinct(points: List[float]) -> List[float]:
+    """A closed polygon without repeated consecutive vertices."""
+    result = []
+    for i in range(0, len(points), 2):
+        if not result or (points[i], points[i + 1]) != (result[-2], result[-1]):
+            result += (points[i], points[i + 1])
+    if len(result) > 2 and (result[0], result[1]) == (result[-2], result[-1]):
+        del result[-2:]
+    return result
+
+def _ellipse(cx: float, cy: float, rx: float, ry: float) -> List[float]:
+    """A clockwise polygon within CURVE_TOLERANCE of the ellipse."""
+    radius = max(rx, ry)
+    if radius > 2 * CURVE_TOLERANCE:
+        count = max(8, math.ceil(math.pi / math.acos(1 - CURVE_TOLERANCE / radius)))
+    else:
+        count = 8
+    step = 2 * math.pi / count
+    points = []
+    for i in range(count):
+        points += (cx + rx * math.cos(i * step), cy + ry * math.sin(i * step))
+    return points
+
+def _offset(points: List[float], distance: float) -> List[float]:
+    """Move every edge of a clockwise polygon distance outwards (inwards if negative), mitering the corners."""
+    count = len(points) // 2
+    normals = []
+    for i in range(count):
+        dx = points[(2 * i + 2) % (2 * count)] - points[2 * i]
+        dy = points[(2 * i + 3) % (2 * count)] - points[2 * i + 1]
+        length = math.hypot(dx, dy)
+        normals.append((dy / length, -dx / length))
+    result = []
+    for i in range(count):
+        (ax, ay), (bx, by) = normals[i - 1], normals[i]
+        dot = ax * bx + ay * by
+        if 1 + dot > 2 / MITER_LIMIT ** 2:
+            mx, my = (ax + bx) / (1 + dot), (ay + by) / (1 + dot)
+        else:
+            sx, sy = ax + bx, ay + by
+            length = math.hypot(sx, sy) or 1.0
+            mx, my = sx / length * MITER_LIMIT, sy / length * MITER_LIMIT
+        result += (points[2 * i] + mx * distance, points[2 * i + 1] + my * distance)
+    return result
+
+def _ring(points: List[float], width: float) -> List[List[float]]:
+    """The outline of a polygon as outer and reversed inner edge, for non-zero filling."""
+    points = _distinct(points)
+    if len(points) < 6:
+        return []
+    points = _clockwise(points)
+    outer = _offset(points, width / 2)
+    inner = _offset(points, -width / 2)
+    if _orientation(inner) <= 0:
+        return [outer]  # Narrower than its outline: solid
+    return [outer, _reversed(inner)]
+
+def _stroke(points: List[float], width: float) -> List[List[float]]:
+    """Clockwise quads for the segments of a polyline, with round joins where they would leave a notch."""
+    half = width / 2
+    polygons = []
+    previous = None
+    for i in range(0, len(points) - 2, 2):
+        x1, y1, x2, y2 = points[i:i + 4]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        if length == 0:
+            continue
+        ux, uy = dx / length, dy / length
+        if previous is not None:
+            px, py = previous
+            if px * ux + py * uy < 0 or half * abs(px * uy - py * ux) > JOIN_TOLERANCE:
+                polygons.append(_ellipse(x1, y1, half, half))
+        nx, ny = uy * half, -ux * half
+        polygons.append([x1 + nx, y1 + ny, x2 + nx, y2 + ny, x2 - nx, y2 - ny, x1 - nx, y1 - ny])
+        previous = (ux, uy)
+    return polygons
+
+def _dashes(points: List[float], pattern: List[float]) -> List[List[float]]:
+    """Cut a polyline into the pieces drawn by an on-off dash pattern."""
+    pieces = []
+    current = [points[0], points[1]]
+    index, left, drawing = 0, pattern[0], True
+    for i in range(0, len(points) - 2, 2):
+        x1, y1, x2, y2 = points[i:i + 4]
+        length = math.hypot(x2 - x1, y2 - y1)
+        done = 0.0
+        while length - done > left:
+            done += left
+            t = done / length
+            x, y = x1 + (x2 - x1) * t, y1 + (y2 - y1) * t
+            if drawing:
+                pieces.append(current + [x, y])
+            else:
+                current = [x, y]
+            drawing = not drawing
+            index = (index + 1) % len(pattern)
+            left = pattern[index]
+        left -= length - done
+        if drawing:
+            current += (x2, y2)
+    if drawing and len(current) >= 4:
+        pieces.append(current)
+    return pieces
+
+# --- Scene -------------------------------------------------------------
+
+def _part(polygons: List[List[float]]) -> Tuple[float, float, float, float, List[List[float]]]:
+    """Polygons that must be drawn together, with their bounding box."""
+    xs = [v for polygon in polygons for v in polygon[0::2]]
+    ys = [v for polygon in polygons for v in polygon[1::2]]
+    return min(xs), min(ys), max(xs), max(ys), polygons
+
+class _Scene:
+    """The document's shapes and connectors as pixel-space primitives, built a band at a time.
+    
+    Only the bounding boxes of all items are kept; their outlines are worked
+    out for the bands they fall in, and dropped once those are handed out.
+    """
+    def __init__(self, document, bounds: Tuple[float, float, float, float], scale: float):
+        self.left, self.top = bounds[0], bounds[1]
+        self.scale = scale
+        self.shapes = document.shapes()
+        self.arrows = document.arrows()
+        # Shapes, then the connector layer above them, bottom to top
+        pad = OUTLINE_WIDTH / 2 * MITER_LIMIT
+        self.boxes = array('d')
+        for shape in self.shapes:
+            x1, y1, x2, y2 = shape.bounds()
+            self.boxes.extend(self.to_pixels([x1 - pad, y1 - pad, x2 + pad, y2 + pad]))
+        for arrow in self.arrows:
+            self.boxes.extend(self.to_pixels(list(arrow.bounds())))
+            
+    def __len__(self):
+        return len(self.shapes) + len(self.arrows)
+        
+    def to_pixels(self, points: List[float]) -> List[float]:
+        left, top, scale = self.left, self.top, self.scale
+        return [(v - left) * scale if i % 2 == 0 else (v - top) * scale for i, v in enumerate(points)]
+        
+    def primitives(self, item: int) -> List[Tuple[int, int, list]]:
+        """(kind, value, parts) for an item, in drawing order."""
+        if item < len(self.shapes):
+            shape = self.shapes[item]
+            points = self.to_pixels(shape_points(shape.shape_type, shape.x, shape.y, shape.width, shape.height))
+            width = OUTLINE_WIDTH * self.scale
+            kind = shape_kind(shape.shape_type)
+            if kind == 'oval':
+                x1, y1, x2, y2 = points
+                cx, cy, rx, ry = (x1 + x2) / 2, (y1 + y2) / 2, (x2 - x1) / 2, (y2 - y1) / 2
+                area = _ellipse(cx, cy, rx, ry)
+                outline = [_ellipse(cx, cy, rx + width / 2, ry + width / 2)]
+                if min(rx, ry) > width / 2:
+                    outline.append(_reversed(_ellipse(cx, cy, rx - width / 2, ry - width / 2)))
+            else:
+                if kind == 'rectangle':
+                    x1, y1, x2, y2 = points
+                    points = [x1, y1, x2, y1, x2, y2, x1, y2]
+                area = points
+                outline = _ring(points, width)
+            primitives = [(FILL, WHITE, [_part([area])])]
+            if outline:
+                primitives.append((COVER, BLACK, [_part(outline)]))
+            return primitives
+            
+        arrow = self.arrows[item - len(self.shapes)]
+        style = arrow_style(arrow.arrow_type)
+        width = LINE_WIDTH * style['width_scale'] * self.scale
+        dash = [length * self.scale for length in style['dash']] if style['dash'] else None
+        parts = []
+        for points, heads in connector_geometry(arrow.arrow_type, arrow.start_x, arrow.start_y,
+                                                arrow.end_x, arrow.end_y, LINE_WIDTH, arrow.waypoints):
+            if style['smooth']:
+                points = smooth_polyline(points)
+            points = self.to_pixels(points)
+            for line in (_dashes(points, dash) if dash else [points]):
+                parts.extend(_part([polygon]) for polygon in _stroke(line, width))
+            parts.extend(_part([_clockwise(self.to_pixels(head))]) for head in heads)
+        # One primitive, so the strokes and heads overlap without darkening twice
+        return [(COVER, BLACK, parts)] if parts else []
+
+# --- Tiles -------------------------------------------------------------
+
+def _edges(polygons: List[List[float]], left: float, top: float, height: int) -> list:
+    """Non-horizontal edges in tile coordinates as (top, bottom, x at y = 0, dx/dy, winding), sorted by top."""
+    edges = []
+    for polygon in polygons:
+        count = len(polygon)
+        for i in range(0, count, 2):
+            x1, y1 = polygon[i] - left, polygon[i + 1] - top
+            x2, y2 = polygon[(i + 2) % count] - left, polygon[(i + 3) % count] - top
+            if y1 == y2:
+                continue
+            winding = 1
+            if y1 > y2:
+                x1, y1, x2, y2, winding = x2, y2, x1, y1, -1
+            if y2 <= 0 or y1 >= height:
+                continue
+            slope = (x2 - x1) / (y2 - y1)
+            edges.append((y1, y2, x1 - y1 * slope, slope, winding))
+    edges.sort()
+    return edges
+
+def _sample_lines(edges: list, height: int, samples: int):
+    """Yield (row, [(crossings, weight), ...]) for the rows the edges reach.
+    
+    Crossings are the sorted (x, winding) pairs along each sample line. Rows
+    where nothing changes between the sample lines, such as those crossed
+    only by vertical edges, are sampled once and weighted by samples.
+    """
+    offsets = [(s + 0.5) / samples for s in range(samples)]
+    first = max(0, int(edges[0][0]))
+    last = min(height, math.ceil(max(edge[1] for edge in edges)))
+    count = len(edges)
+    index = 0
+    active = []
+    expiry = math.inf   # Where the first active edge ends
+    vertical = True     # Whether every active edge is
+    for row in range(first, last):
+        end = row + offsets[-1]
+        for offset in offsets:
+            y = row + offset
+            changed = False
+            while index < count and edges[index][0] <= y:
+                edge = edges[index]
+                active.append(edge)
+                expiry = min(expiry, edge[1])
+                index += 1
+                changed = True
+            if expiry <= y:
+                active = [edge for edge in active if edge[1] > y]
+                expiry = min([edge[1] for edge in active], default=math.inf)
+                changed = True
+            if changed:
+                vertical = all(edge[3] == 0 for edge in active)
+            crossings = sorted([(intercept + y * slope, winding) for _, _, intercept, slope, winding in active])
+            if offset == offsets[0]:
+                if vertical and expiry > end and (index == count or edges[index][0] > end):
+                    yield row, [(crossings, samples)]
+                    break
+                lines = [(crossings, 1)]
+            else:
+                lines.append((crossings, 1))
+        else:
+            yield row, lines
+
+_BLEND_TABLES: Dict[Tuple[int, int, int], bytes] = {}
+
+def _blend_table(value: int, count: int, samples: int) -> bytes:
+    """Byte translation blending value over a pixel count / samples of the way."""
+    key = (value, count, samples)
+    table = _BLEND_TABLES.get(key)
+    if table is None:
+        alpha = count / samples
+        table = _BLEND_TABLES[key] = bytes(round(old + (value - old) * alpha) for old in range(256))
+    return table
+
+def _fill(buffer: bytearray, width: int, height: int, edges: list, value: int):
+    """Set the pixels whose centers are inside the polygons, by the even-odd rule."""
+    solid = bytes((value,)) * width
+    for row, lines in _sample_lines(edges, height, 1):
+        crossings = lines[0][0]
+        base = row * width
+        for i in range(0, len(crossings) - 1, 2):
+            start = max(0, math.ceil(crossings[i][0] - 0.5))
+            end = min(width, math.ceil(crossings[i + 1][0] - 0.5))
+            if end > start:
+                buffer[base + start:base + end] = solid[:end - start]
+
+def _cover(buffer: bytearray, width: int, height: int, edges: list, value: int, samples: int = SUBSAMPLES):
+    """Blend value over the pixels inside the polygons by the fraction covered, non-zero rule."""
+    solid = bytes((value,)) * width
+    for row, lines in _sample_lines(edges, height, samples):
+        # Per pixel: what the spans ending in it cover of it, and the change
+        # in how many sample lines cover every pixel from there on
+        partial: Dict[int, float] = {}
+        steps: Dict[int, int] = {}
+        for crossings, weight in lines:
+            winding = 0
+            for x, direction in crossings:
+                if winding == 0:
+                    start = x
+                winding += direction
+                if winding == 0:
+                    start, end = max(0.0, start), min(width, x)
+                    if end <= start:
+                        continue
+                    first, last = int(start), int(end)
+                    if first == last:
+                        partial[first] = partial.get(first, 0) + weight * (end - start)
+                        continue
+                    partial[first] = partial.get(first, 0) + weight * (first + 1 - start)
+                    steps[first + 1] = steps.get(first + 1, 0) + weight
+                    steps[last] = steps.get(last, 0) - weight
+                    if end > last:
+                        partial[last] = partial.get(last, 0) + weight * (end - last)
+        if not partial:
+            continue
+        base = row * width
+        pixels = sorted(partial.keys() | steps.keys())
+        pixels.append(width)
+        level = 0
+        for i in range(len(pixels) - 1):
+            pixel = pixels[i]
+            if pixel >= width:
+                break
+            level += steps.get(pixel, 0)
+            coverage = (level + partial.get(pixel, 0)) / samples
+            if coverage > 0:
+                old = buffer[base + pixel]
+                buffer[base + pixel] = round(old + (value - old) * min(1.0, coverage))
+            end = min(pixels[i + 1], width)
+            if level and end > pixel + 1:
+                start = base + pixel + 1
+                if level == samples:
+                    buffer[start:base + end] = solid[:end - pixel - 1]
+                else:
+                    buffer[start:base + end] = buffer[start:base + end].translate(_blend_table(value, level, samples))
+
+def _expand(np, starts, counts):
+    """Every integer of the ranges [start, start + count), concatenated."""
+    total = int(counts.sum())
+    return np.arange(total) + np.repeat(starts - (np.cumsum(counts) - counts), counts)
+
+def _crossings_batch(np, edges: list, height: int, samples: int):
+    """Where the edges cross every sample line, as (line, x, winding) arrays sorted by line, then x.
+    
+    Line k runs at y = (k + 0.5) / samples, so a row holds samples lines.
+    """
+    top, bottom, intercept, slope, winding = np.array(edges, dtype=float).T
+    first = np.maximum(np.ceil(top * samples - 0.5), 0).astype(np.int64)
+    last = np.minimum(np.ceil(bottom * samples - 0.5), height * samples).astype(np.int64)
+    counts = np.maximum(last - first, 0)
+    edge = np.repeat(np.arange(len(edges)), counts)
+    lines = _expand(np, first, counts)
+    x = intercept[edge] + (lines + 0.5) / samples * slope[edge]
+    order = np.lexsort((x, lines))
+    return lines[order], x[order], winding[edge][order]
+
+def _fill_batch(np, pixels, width: int, height: int, edges: list, value: int):
+    """_fill with NumPy, one span per pair of crossings."""
+    lines, x, _ = _crossings_batch(np, edges, height, 1)
+    starts = np.clip(np.ceil(x[0::2] - 0.5), 0, width).astype(np.int64)
+    ends = np.clip(np.ceil(x[1::2] - 0.5), 0, width).astype(np.int64)
+    counts = np.maximum(ends - starts, 0)
+    pixels[_expand(np, lines[0::2] * width + starts, counts)] = value
+
+def _cover_batch(np, pixels, width: int, height: int, edges: list, value: int, samples: int = SUBSAMPLES):
+    """_cover with NumPy: every span is cut into the pixels it touches and their coverage summed."""
+    lines, x, winding = _crossings_batch(np, edges, height, samples)
+    level = np.cumsum(winding)  # Back to zero at the end of every line
+    before = level - winding
+    starts = np.clip(x[(before == 0) & (level != 0)], 0, width)
+    ends = np.clip(x[(level == 0) & (before != 0)], 0, width)
+    lines = lines[(before == 0) & (level != 0)]
+    inside = ends > starts
+    starts, ends, lines = starts[inside], ends[inside], lines[inside]
+    first = np.floor(starts).astype(np.int64)
+    last = np.floor(ends).astype(np.int64)
+    last -= ends == last  # A span ending on a pixel's left edge leaves it alone
+    counts = last - first + 1
+    span = np.repeat(np.arange(len(counts)), counts)
+    columns = _expand(np, first, counts)
+    covered = np.minimum(columns + 1, ends[span]) - np.maximum(columns, starts[span])
+    touched, index = np.unique(lines[span] // samples * width + columns, return_inverse=True)
+    alpha = np.minimum(np.bincount(index, weights=covered) / samples, 1.0)
+    old = pixels[touched].astype(float)
+    pixels[touched] = np.rint(old + (value - old) * alpha)
+
+def render_tile(job) -> bytes:
+    """Render (left, top, width, height, primitives) to width * height grayscale bytes, row by row."""
+    left, top, width, height, primitives = job
+    buffer = bytearray(b'\xff') * (width * height)
+    np = numpy_module()
+    pixels = np.frombuffer(buffer, dtype=np.uint8) if np is not None else None
+    for kind, value, polygons in primitives:
+        edges = _edges(polygons, left, top, height)
+        if not edges:
+            continue
+        if np is None:
+            (_fill if kind == FILL else _cover)(buffer, width, height, edges, value)
+        elif kind == FILL:
+            _fill_batch(np, pixels, width, height, edges, value)
+        else:
+            _cover_batch(np, pixels, width, height, edges, value)
+    return bytes(buffer)
+
+# --- PNG ---------------------------------------------------------------
+
+class PngWriter:
+    """Writes an 8-bit grayscale PNG one row at a time, compressing as it goes."""
+    def __init__(self, fp, width: int, height: int, level: int = COMPRESSION_LEVEL):
+        self.fp = fp
+        self.compressor = zlib.compressobj(level)
+        self.pending: List[bytes] = []
+        self.pending_size = 0
+        fp.write(PNG_SIGNATURE)
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0))
+        
+    def _chunk(self, kind: bytes, data: bytes):
+        self.fp.write(struct.pack('>I', len(data)) + kind)
+        self.fp.write(data)
+        self.fp.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+        
+    def _flush(self):
+        if self.pending:
+            self._chunk(b'IDAT', b''.join(self.pending))
+            self.pending = []
+            self.pending_size = 0
+            
+    def write_row(self, row: bytes):
+        data = self.compressor.compress(b'\x00' + row)  # Filter type None
+        if data:
+            self.pending.append(data)
+            self.pending_size += len(data)
+            if self.pending_size >= IDAT_SIZE:
+                self._flush()
+                
+    def close(self):
+        self.pending.append(self.compressor.flush())
+        self._flush()
+        self._chunk(b'IEND', b'')
+
+# --- Rendering ---------------------------------------------------------
+
+def _band_jobs(scene: _Scene, items: array, top: int, width: int, height: int, tile_size: int) -> list:
+    """The tile jobs of one band, None for tiles nothing touches."""
+    columns = math.ceil(width / tile_size)
+    tiles = [[] for _ in range(columns)]
+    bottom = top + height
+    for item in items:
+        for kind, value, parts in scene.primitives(item):
+            pieces: Dict[int, list] = {}
+            for x1, y1, x2, y2, polygons in parts:
+                if y2 < top or y1 >= bottom:
+                    continue
+                for column in range(max(0, int(x1 // tile_size)), min(columns - 1, int(x2 // tile_size)) + 1):
+                    pieces.setdefault(column, []).extend(polygons)
+            for column, polygons in pieces.items():
+                tiles[column].append((kind, value, polygons))
+    return [(column * tile_size, top, min(tile_size, width - column * tile_size), height, primitives)
+            if primitives else None for column, primitives in enumerate(tiles)]
+
+def _write_band(writer: PngWriter, tiles: list, width: int, height: int, tile_size: int):
+    """Write a band's rows, given its tiles' pixels (None for blank tiles)."""
+    if all(tile is None for tile in tiles):
+        blank = b'\xff' * width
+        for _ in range(height):
+            writer.write_row(blank)
+        return
+    blank = b'\xff' * tile_size
+    widths = [min(tile_size, width - column * tile_size) for column in range(len(tiles))]
+    for row in range(height):
+        writer.write_row(b''.join(blank[:tile_width] if tile is None else tile[row * tile_width:(row + 1) * tile_width]
+                                  for tile, tile_width in zip(tiles, widths)))
+
+def image_size(bounds: Tuple[float, float, float, float], scale: float = 1.0) -> Tuple[int, int]:
+    return max(1, math.ceil((bounds[2] - bounds[0]) * scale)), max(1, math.ceil((bounds[3] - bounds[1]) * scale))
+
+def render_png(document, filename: str, bounds: Tuple[float, float, float, float], scale: float = 1.0,
+               workers: int = 1, tile_size: int = TILE_SIZE):
+    """Rasterize the part of a document inside bounds to a grayscale PNG file.
+    
+    scale is pixels per canvas unit. workers > 1 (or 0 for every CPU)
+    renders the tiles in that many processes.
+    """
+    width, height = image_size(bounds, scale)
+    scene = _Scene(document, bounds, scale)
+    bands = math.ceil(height / tile_size)
+    # Every item, under each band its bounding box reaches
+    band_items = [array('l') for _ in range(bands)]
+    boxes = scene.boxes
+    for item in range(len(scene)):
+        y1, y2 = boxes[4 * item + 1], boxes[4 * item + 3]
+        if y2 < 0 or y1 >= height or boxes[4 * item + 2] < 0 or boxes[4 * item] >= width:
+            continue
+        for band in range(max(0, int(y1 // tile_size)), min(bands - 1, int(y2 // tile_size)) + 1):
+            band_items[band].append(item)
+            
+    pool = None
+    if workers != 1:
+        from concurrent.futures import ProcessPoolExecutor  # Slow to import, and only needed here
+        pool = ProcessPoolExecutor(max_workers=workers or None)
+    try:
+        with open(filename, 'wb') as f:
+            writer = PngWriter(f, width, height)
+            pending = deque()  # (band height, tile pixels or futures of them)
+            
+            def write_next():
+                band_height, tiles = pending.popleft()
+                tiles = [tile.result() if pool is not None and tile is not None else tile for tile in tiles]
+                _write_band(writer, tiles, width, band_height, tile_size)
+                
+            for band in range(bands):
+                top = band * tile_size
+                band_height = min(tile_size, height - top)
+                jobs = _band_jobs(scene, band_items[band], top, width, band_height, tile_size)
+                band_items[band] = None
+                if pool is None:
+                    pending.append((band_height, [job and render_tile(job) for job in jobs]))
+                else:
+                    pending.append((band_height, [job and pool.submit(render_tile, job) for job in jobs]))
+                while len(pending) > (BANDS_IN_FLIGHT if pool is not None else 0):
+                    write_next()
+            while pending:
+                write_next()
+            writer.close()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+            
\ No newline at end of file
@@ -0,0 +1,448 @@
+"""Orthogonal connector routing around shapes.
+
+The router is Tk-free: it works against a SpatialGrid of obstacle bounds
+(the GUI's shape index, or one built from a document for headless export)
+and hands back the bend points of an elbowed path between two connector
+ends.
+"""
+import heapq
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from .geometry import PORT_DIRECTIONS, SpatialGrid, nearest_port
+
+ROUTE_MARGIN = 12             # Clearance kept between a route and any shape
+ROUTE_CORRIDOR_PAD = 40       # How far past its ends a search may wander at first
+ROUTE_MAX_WIDENINGS = 3       # Corridor doublings before settling for a simple shape
+ROUTE_MAX_EXPANSIONS = 5000   # Search states tried per corridor before giving up on it
+ROUTE_MAX_GRID = 40000        # Largest grid (lines across times lines down) worth searching
+ROUTE_MAX_CHANNELS = 16       # Channels tried for the middle leg of a Z-shaped route
+ROUTE_LINE_MERGE = 24         # Obstacle edges this close, facing the same way, share a grid line
+BEND_COST = 25                # Extra length a route will take to save one bend
+
+# One connector end: position, outward direction (dx, dy) or None, and the
+# bounds of the shape it leaves from, or None for a free end
+RouteEnd = Tuple[float, float, Optional[Tuple[int, int]], Optional[Tuple[float, float, float, float]]]
+
+INFINITY = float('inf')
+
+def _simplify(points: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+    """Drop repeated points and the middle of straight runs, keeping both ends."""
+    result = [points[0]]
+    for point in points[1:]:
+        if point == result[-1]:
+            continue
+        if len(result) >= 2:
+            (ax, ay), (bx, by) = result[-2], result[-1]
+            if (ax == bx == point[0]) or (ay == by == point[1]):
+                result[-1] = point
+                continue
+        result.append(point)
+    if len(result) == 1:
+        result.append(points[-1])
+    return result
+
+def _reach(boxes, x, y, target, vertical=False) -> float:
+    """How far a segment from x toward target (along y, or down x when
+    vertical) gets before it would enter a box's interior."""
+    reach = target
+    for box in boxes:
+        left, top, right, bottom = (box[1], box[0], box[3], box[2]) if vertical else box
+        if not top < y < bottom:
+            continue
+        if target >= x:
+            if left < reach and right > x:
+                reach = max(left, x)
+        elif right > reach and left < x:
+            reach = min(right, x)
+    return reach
+
+def _segment_clear(boxes, x1, y1, x2, y2) -> bool:
+    """Whether an axis-aligned segment stays out of every box's interior."""
+    lo_x, hi_x = (x1, x2) if x1 <= x2 else (x2, x1)
+    lo_y, hi_y = (y1, y2) if y1 <= y2 else (y2, y1)
+    for left, top, right, bottom in boxes:
+        if left < hi_x and lo_x < right and top < hi_y and lo_y < bottom:
+            return False
+    return True
+
+def _grid_lines(boxes, low: int, high: int, lo: float, hi: float, ends) -> List[float]:
+    """Sorted grid lines along one axis between lo and hi, both included.
+    
+    Besides the route's ends they are the obstacle edges, except that a
+    run of edges facing the same way within ROUTE_LINE_MERGE of each other
+    (shapes not quite lined up) becomes one line, at the run's outermost
+    edge. No edge facing the other way lies inside a run, so the merged
+    line stays in the same channel as each edge it replaces.
+    """
+    edges = sorted([(box[low], 0) for box in boxes if lo < box[low] < hi] +
+                   [(box[high], 1) for box in boxes if lo < box[high] < hi])
+    lines = {lo, hi, *ends}
+    first = last = side = None
+    for value, facing in edges:
+        if facing == side and value - first <= ROUTE_LINE_MERGE:
+            last = value
+            continue
+        if side is not None:
+            lines.add(first if side == 0 else last)
+        first = last = value
+        side = facing
+    if side is not None:
+        lines.add(first if side == 0 else last)
+    return sorted(lines)
+
+class OrthogonalRouter:
+    """Elbowed connector routes that keep clear of shape bounding boxes.
+    
+    Each route first tries the obvious straight and L shapes, and Z shapes
+    whose middle leg runs down the middle or a channel between nearby
+    obstacles, all checked against the obstacles found by one index query;
+    ends facing away from each other then try the same from the corners of
+    their shapes' margins. Only when those are blocked does it run A* over
+    a sparse orthogonal grid whose lines are the (inflated) edges of the
+    obstacles near the connector, with nearly aligned edges merged, and a
+    penalty per bend.
+    
+    Results are cached per key. Each route's bounds go into a spatial
+    index of its own, and an obstacle change only drops the routes whose
+    segments, widened by the margin, it overlaps before or after the
+    change; everything else keeps its cached path.
+    """
+    def __init__(self, obstacles: SpatialGrid, margin: float = ROUTE_MARGIN):
+        self.obstacles = obstacles
+        self.margin = margin
+        self.cache: Dict[object, Tuple[Tuple[RouteEnd, RouteEnd], List[float]]] = {}
+        self.corridors = SpatialGrid()  # key -> bounds of the route, widened by the margin
+        self.searches = 0  # Routes that needed the full A* search
+        
+    def route(self, key, start: RouteEnd, end: RouteEnd) -> List[float]:
+        """Flat bend points between start and end, not including the ends themselves."""
+        request = (start, end)
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] == request:
+            return cached[1]
+        if cached is not None:
+            self.forget(key)
+        waypoints = self._route(start, end)
+        self.cache[key] = (request, waypoints)
+        xs = [start[0], end[0]] + waypoints[0::2]
+        ys = [start[1], end[1]] + waypoints[1::2]
+        m = self.margin
+        self.corridors.insert(key, (min(xs) - m, min(ys) - m, max(xs) + m, max(ys) + m))
+        return waypoints
+        
+    def elbow(self, start: RouteEnd, end: RouteEnd) -> List[float]:
+        """The preferred straight, L or Z shape between two ends, ignoring obstacles and the cache.
+        
+        Cheap enough to run on every frame while shapes are dragged; the
+        real route follows once they land.
+        """
+        a, b = self._stub(start), self._stub(end)
+        points = _simplify([(start[0], start[1])] + self._candidates(a, b, start[2])[0] + [(end[0], end[1])])
+        return [v for point in points[1:-1] for v in point]
+        
+    def invalidate(self, bounds) -> List:
+        """Forget every cached route whose corridor overlaps bounds; returns their keys."""
+        x1, y1, x2, y2 = bounds
+        m = self.margin
+        stale = []
+        for key in self.corridors.query_rect(x1, y1, x2, y2):
+            (start, end), waypoints = self.cache[key]
+            xs = [start[0]] + waypoints[0::2] + [end[0]]
+            ys = [start[1]] + waypoints[1::2] + [end[1]]
+            for i in range(len(xs) - 1):
+                if (min(xs[i], xs[i + 1]) - m <= x2 and max(xs[i], xs[i + 1]) + m >= x1 and
+                        min(ys[i], ys[i + 1]) - m <= y2 and max(ys[i], ys[i + 1]) + m >= y1):
+                    stale.append(key)
+                    break
+        for key in stale:
+            self.forget(key)
+        return stale
+        
+    def forget(self, key):
+        if self.cache.pop(key, None) is not None:
+            self.corridors.remove(key)
+                
+    def clear(self):
+        self.cache.clear()
+        self.corridors.clear()
+        
+    def _stub(self, end: RouteEnd) -> Tuple[float, float]:
+        # Step straight out of the shape until clear of its margin
+        x, y, direction, box = end
+        if direction is None or box is None:
+            return x, y
+        dx, dy = direction
+        if dx > 0:
+            return box[2] + self.margin, y
+        if dx < 0:
+            return box[0] - self.margin, y
+        if dy > 0:
+            return x, box[3] + self.margin
+        return x, box[1] - self.margin
+        
+    def _route(self, start: RouteEnd, end: RouteEnd):
+        a, b = self._stub(start), self._stub(end)
+        # Every simple candidate stays inside the box spanned by the two ends
+        boxes = self._boxes(min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]), a, b)
+        path = self._simple_path(a, b, start[2], boxes)
+        if path is None:
+            path = self._detour(start, end, a, b)
+        if path is None:
+            self.searches += 1
+            path = self._search(a, b)
+            if path is None:
+                # Boxed in, or too far across too crowded a diagram to search:
+                # settle for the preferred elbow
+                path = self._candidates(a, b, start[2])[0]
+        points = _simplify([(start[0], start[1])] + path + [(end[0], end[1])])
+        return [v for point in points[1:-1] for v in point]
+        
+    def _corner(self, end: RouteEnd, stub, toward) -> Optional[Tuple[float, float]]:
+        """The corner of its shape's margin that a route leaving the shape away from toward turns at."""
+        x, y, direction, box = end
+        if direction is None or box is None:
+            return None
+        dx, dy = direction
+        if (toward[0] - stub[0]) * dx + (toward[1] - stub[1]) * dy > 0:
+            return None  # Already heading the right way
+        m = self.margin
+        if dx:
+            return stub[0], box[1] - m if toward[1] < (box[1] + box[3]) / 2 else box[3] + m
+        return box[0] - m if toward[0] < (box[0] + box[2]) / 2 else box[2] + m, stub[1]
+        
+    def _detour(self, start: RouteEnd, end: RouteEnd, a, b) -> Optional[List[Tuple[float, float]]]:
+        """A simple path between the ends' corners, for ends that face away from each other."""
+        a_corner, b_corner = self._corner(start, a, b), self._corner(end, b, a)
+        if a_corner is None and b_corner is None:
+            return None
+        a_corner, b_corner = a_corner or a, b_corner or b
+        xs, ys = (a[0], b[0], a_corner[0], b_corner[0]), (a[1], b[1], a_corner[1], b_corner[1])
+        boxes = self._boxes(min(xs), min(ys), max(xs), max(ys), a, b)
+        if not (_segment_clear(boxes, *a, *a_corner) and _segment_clear(boxes, *b_corner, *b)):
+            return None
+        middle = self._simple_path(a_corner, b_corner, None, boxes)
+        if middle is None:
+            return None
+        return [a] + middle + [b]
+        
+    def _boxes(self, x1, y1, x2, y2, a, b) -> List[Tuple[float, float, float, float]]:
+        """Margin-inflated bounds of the obstacles whose inside reaches into a rectangle.
+        
+        Obstacles that already swallow one of the route's ends (shapes
+        dragged on top of each other) are left out; otherwise there would
+        be no way in or out.
+        """
+        m = self.margin
+        (ax, ay), (bx, by) = a, b
+        boxes = []
+        for left, top, right, bottom in map(self.obstacles.bounds_of,
+                                            self.obstacles.query_rect(x1 - m, y1 - m, x2 + m, y2 + m)):
+            left, top, right, bottom = left - m, top - m, right + m, bottom + m
+            # The index answers by cell, so many candidates miss a thin rectangle
+            if left >= x2 or right <= x1 or top >= y2 or bottom <= y1:
+                continue
+            if not (left < ax < right and top < ay < bottom or left < bx < right and top < by < bottom):
+                boxes.append((left, top, right, bottom))
+        return boxes
+        
+    def _candidates(self, a, b, start_direction) -> List[List[Tuple[float, float]]]:
+        """The straight, L and Z shapes between two points, in order of preference."""
+        (ax, ay), (bx, by) = a, b
+        if ax == bx or ay == by:
+            return [[a, b]]
+        mid_x, mid_y = (ax + bx) / 2, (ay + by) / 2
+        horizontal_first = [[a, (bx, ay), b], [a, (mid_x, ay), (mid_x, by), b]]
+        vertical_first = [[a, (ax, by), b], [a, (ax, mid_y), (bx, mid_y), b]]
+        if start_direction is not None and start_direction[0] == 0:
+            return vertical_first + horizontal_first
+        return horizontal_first + vertical_first
+        
+    def _simple_path(self, a, b, start_direction, boxes) -> Optional[List[Tuple[float, float]]]:
+        (ax, ay), (bx, by) = a, b
+        # How far each end can run straight toward the other along each axis
+        a_h, a_v = _reach(boxes, ax, ay, bx), _reach(boxes, ay, ax, by, vertical=True)
+        b_h, b_v = _reach(boxes, bx, by, ax), _reach(boxes, by, bx, ay, vertical=True)
+        if ay == by or ax == bx:
+            return [a, b] if (a_h == bx if ay == by else a_v == by) else None
+            
+        def z_horizontal():
+            # The middle leg can sit anywhere both ends reach; try the middle,
+            # then the channel edges of nearby obstacles, nearest first
+            lo, hi = sorted((a_h, b_h))
+            if (a_h - b_h) * (bx - ax) < 0:
+                return None
+            middle = (ax + bx) / 2
+            channels = {v for box in boxes for v in (box[0], box[2]) if lo <= v <= hi}
+            channels.add(min(max(middle, lo), hi))
+            for mid_x in sorted(channels, key=lambda v: abs(v - middle))[:ROUTE_MAX_CHANNELS]:
+                if _segment_clear(boxes, mid_x, ay, mid_x, by):
+                    return [a, (mid_x, ay), (mid_x, by), b]
+            return None
+            
+        def z_vertical():
+            lo, hi = sorted((a_v, b_v))
+            if (a_v - b_v) * (by - ay) < 0:
+                return None
+            middle = (ay + by) / 2
+            channels = {v for box in boxes for v in (box[1], box[3]) if lo <= v <= hi}
+            channels.add(min(max(middle, lo), hi))
+            for mid_y in sorted(channels, key=lambda v: abs(v - middle))[:ROUTE_MAX_CHANNELS]:
+                if _segment_clear(boxes, ax, mid_y, bx, mid_y):
+                    return [a, (ax, mid_y), (bx, mid_y), b]
+            return None
+            
+        horizontal = [lambda: [a, (bx, ay), b] if a_h == bx and b_v == ay else None, z_horizontal]
+        vertical = [lambda: [a, (ax, by), b] if a_v == by and b_h == ax else None, z_vertical]
+        if start_direction is not None and start_direction[0] == 0:
+            attempts = vertical + horizontal
+        else:
+            attempts = horizontal + vertical
+        for attempt in attempts:
+            path = attempt()
+            if path is not None:
+                return path
+        return None
+        
+    def _search(self, a, b):
+        pad = ROUTE_CORRIDOR_PAD
+        for _ in range(ROUTE_MAX_WIDENINGS + 1):
+            corridor = (min(a[0], b[0]) - pad, min(a[1], b[1]) - pad, max(a[0], b[0]) + pad, max(a[1], b[1]) + pad)
+            path = self._astar(a, b, corridor)
+            if path:
+                return path
+            if path is False:
+                break  # A bigger corridor would only cost more
+            pad *= 2
+        return None
+        
+    def _astar(self, a, b, corridor):
+        """Shortest low-bend path from a to b inside corridor.
+        
+        Returns None when the corridor holds no path at all and False when
+        the grid is too big or the search ran out of expansions first.
+        """
+        cx1, cy1, cx2, cy2 = corridor
+        boxes = self._boxes(*corridor, a, b)
+        
+        # Grid lines: the ends, the corridor edges and the obstacle edges inside it
+        xs = _grid_lines(boxes, 0, 2, cx1, cx2, (a[0], b[0]))
+        ys = _grid_lines(boxes, 1, 3, cy1, cy2, (a[1], b[1]))
+        if len(xs) * len(ys) > ROUTE_MAX_GRID:
+            return False
+        nx = len(xs)
+        ny = len(ys)
+        
+        # A grid segment is blocked if it enters an obstacle's margin anywhere.
+        # Horizontal segment (i, j)-(i + 1, j) is blocked_h[j * nx + i] and
+        # vertical segment (i, j)-(i, j + 1) is blocked_v[(j + 1) * nx + i];
+        # the corridor's rim is marked too, so steps never leave the grid.
+        blocked_h = bytearray(nx * ny)
+        blocked_v = bytearray(nx * (ny + 1))
+        blocked_h[nx - 1::nx] = b'\x01' * ny
+        blocked_v[:nx] = b'\x01' * nx
+        blocked_v[ny * nx:] = b'\x01' * nx
+        for left, top, right, bottom in boxes:
+            # Lines inside the box are columns i_in..i_out - 1 and rows j_in..j_out - 1
+            i_in, i_out = bisect_right(xs, left), bisect_left(xs, right)
+            j_in, j_out = bisect_right(ys, top), bisect_left(ys, bottom)
+            i0, i1 = (i_in - 1 if i_in else 0), (i_out if i_out < nx else nx - 1)
+            j0, j1 = (j_in - 1 if j_in else 0), (j_out if j_out < ny else ny - 1)
+            if i1 > i0:
+                for j in range(j_in, j_out):
+                    blocked_h[j * nx + i0:j * nx + i1] = b'\x01' * (i1 - i0)
+            if j1 > j0:
+                for i in range(i_in, i_out):
+                    blocked_v[(j0 + 1) * nx + i:(j1 + 1) * nx + i:nx] = b'\x01' * (j1 - j0)
+                    
+        start = ys.index(a[1]) * nx + xs.index(a[0])
+        goal = ys.index(b[1]) * nx + xs.index(b[0])
+        # Estimate by node and the axis it was reached along: Manhattan
+        # distance, plus a bend when the goal is off the line being followed
+        gx, gy = b
+        hx = [abs(gx - x) for x in xs]
+        hy = [abs(gy - y) for y in ys]
+        along_x = [h + v + (BEND_COST if v else 0) for v in hy for h in hx]
+        along_y = [h + v + (BEND_COST if h else 0) for v in hy for h in hx]
+        # Per step: node offset, segment mask, offset of the segment's index,
+        # the step's length by the index of the segment it takes, its axis and estimates
+        widths = [xs[i + 1] - xs[i] for i in range(nx - 1)] + [0.0]
+        heights = [0.0] * (nx * (ny + 1))
+        for j in range(ny - 1):
+            heights[(j + 1) * nx:(j + 2) * nx] = [ys[j + 1] - ys[j]] * nx
+        moves = ((1, blocked_h, 0, widths * ny, 0, along_x), (-1, blocked_h, -1, widths * ny, 0, along_x),
+                 (nx, blocked_v, nx, heights, 1, along_y), (-nx, blocked_v, 0, heights, 1, along_y))
+                 
+        # States are node * 3 + the axis it was reached along, 2 meaning "just
+        # started": turning costs a bend and going back the same way never pays.
+        # Ties on the estimate go to the state that got furthest, which keeps
+        # the search from fanning out over the many equally short grid paths.
+        best = [INFINITY] * (nx * ny * 3)
+        best[start * 3 + 2] = 0.0
+        parent = {}
+        heap = [(0.0, 0.0, 0.0, start, 2)]
+        pop, push = heapq.heappop, heapq.heappush
+        for _ in range(ROUTE_MAX_EXPANSIONS):
+            if not heap:
+                break
+            _, _, cost, node, axis = pop(heap)
+            state = node * 3 + axis
+            if cost > best[state]:
+                continue
+            if node == goal:
+                path = []
+                while state is not None:
+                    node = state // 3
+                    path.append((xs[node % nx], ys[node // nx]))
+                    state = parent.get(state)
+                return path[::-1]
+            for delta, mask, offset, lengths, step_axis, estimates in moves:
+                segment = node + offset
+                if mask[segment]:
+                    continue
+                next_cost = cost + lengths[segment]
+                if step_axis != axis and axis != 2:
+                    next_cost += BEND_COST
+                next_node = node + delta
+                next_state = next_node * 3 + step_axis
+                if next_cost < best[next_state]:
+                    best[next_state] = next_cost
+                    parent[next_state] = state
+                    push(heap, (next_cost + estimates[next_node], -next_cost, next_cost, next_node, step_axis))
+        return False if heap else None
+
+def connector_end(document, shape_id, port, x: float, y: float) -> RouteEnd:
+    """Describe one end of a document arrow for the router."""
+    shape = document.shape(shape_id) if shape_id is not None else None
+    if shape is None:
+        return (x, y, None, None)
+    if port is None:
+        port = nearest_port(shape.shape_type, shape.x, shape.y, shape.width, shape.height, x, y)
+    return (x, y, PORT_DIRECTIONS[port], shape.bounds())
+
+def route_orthogonal(router: OrthogonalRouter, document, arrow) -> bool:
+    """Recompute an 'orthogonal' arrow's bend points; True if they changed."""
+    waypoints = router.route(arrow.id,
+                             connector_end(document, arrow.source_id, arrow.source_port, arrow.start_x, arrow.start_y),
+                             connector_end(document, arrow.target_id, arrow.target_port, arrow.end_x, arrow.end_y))
+    if waypoints == arrow.waypoints:
+        return False
+    arrow.waypoints = waypoints
+    return True
+
+def elbow_orthogonal(router: OrthogonalRouter, document, arrow) -> bool:
+    """Give an 'orthogonal' arrow a plain elbow between its ends; True if its bend points changed."""
+    waypoints = router.elbow(connector_end(document, arrow.source_id, arrow.source_port, arrow.start_x, arrow.start_y),
+                             connector_end(document, arrow.target_id, arrow.target_port, arrow.end_x, arrow.end_y))
+    if waypoints == arrow.waypoints:
+        return False
+    arrow.waypoints = waypoints
+    return True
+
+def document_router(document) -> OrthogonalRouter:
+    """A router over a document's shapes, for use without the GUI."""
+    grid = SpatialGrid()
+    for shape in document.shapes():
+        grid.insert(shape, shape.bounds(), shape.z)
+    return OrthogonalRouter(grid)
+    
\ No newline at end of file
@@ -0,0 +1,105 @@
+"""Full-text search over shape labels.
+
+An inverted index maps each lower-cased word to the keys (shapes) whose
+text contains it, and keeps the distinct words in a sorted list, so the
+words starting with a prefix are one bisect away. Every word of a query
+matches as a prefix, which makes results follow the user's typing. The
+words are applied most selective first, and a word matching far more
+keys than are left is checked against those candidates' own words
+instead of having its key sets merged. Tk-free like the rest of the
+model code.
+"""
+import re
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Set, Tuple
+
+WORD = re.compile(r'\w+')
+LAST_CHAR = chr(0x10FFFF)  # Sorts after any character a word can continue with
+MERGE_RATIO = 20  # Set merges per candidate check that cost about the same
+
+def tokenize(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+class TextIndex:
+    """Word and prefix index over the text of arbitrary keys."""
+    def __init__(self):
+        self.postings: Dict[str, Set] = {}   # word -> keys whose text has it
+        self.words: List[str] = []           # Sorted distinct words, for prefix lookups
+        self.key_words: Dict[object, Tuple[str, ...]] = {}
+        
+    def __len__(self):
+        return len(self.key_words)
+        
+    def set(self, key, text: str):
+        """Index (or re-index) a key's text; empty text leaves the key out."""
+        self.remove(key)
+        words = tuple(set(tokenize(text)))
+        if not words:
+            return
+        self.key_words[key] = words
+        for word in words:
+            keys = self.postings.get(word)
+            if keys is None:
+                self.postings[word] = keys = set()
+                insort(self.words, word)
+            keys.add(key)
+            
+    def remove(self, key):
+        for word in self.key_words.pop(key, ()):
+            keys = self.postings[word]
+            keys.discard(key)
+            if not keys:
+                del self.postings[word]
+                del self.words[bisect_left(self.words, word)]
+                
+    def clear(self):
+        self.postings.clear()
+        self.words.clear()
+        self.key_words.clear()
+        
+    def rebuild(self, items: Iterable[Tuple[object, str]]):
+        """Index many (key, text) pairs at once, sorting the words once at the end."""
+        self.clear()
+        postings, key_words = self.postings, self.key_words
+        for key, text in items:
+            words = tuple(set(tokenize(text)))
+            if words:
+                key_words[key] = words
+                for word in words:
+                    keys = postings.get(word)
+                    if keys is None:
+                        postings[word] = keys = set()
+                    keys.add(key)
+        self.words = sorted(postings)
+        
+    def prefix_words(self, prefix: str) -> List[str]:
+        """The indexed words starting with prefix."""
+        words = self.words
+        return words[bisect_left(words, prefix):bisect_left(words, prefix + LAST_CHAR)]
+        
+    def search(self, query: str) -> Set:
+        """Keys whose text has a word starting with each word of the query."""
+        prefixes = set(tokenize(query))
+        if not prefixes:
+            return set()
+        postings = self.postings
+        candidates = {prefix: self.prefix_words(prefix) for prefix in prefixes}
+        sizes = {prefix: sum(len(postings[word]) for word in words) for prefix, words in candidates.items()}
+        order = sorted(prefixes, key=sizes.__getitem__)
+        found = set()
+        for word in candidates[order[0]]:
+            found.update(postings[word])
+        for prefix in order[1:]:
+            if not found:
+                break
+            if sizes[prefix] <= MERGE_RATIO * len(found):
+                # Merging this prefix's key sets is cheap next to checking every candidate
+                matching = set()
+                for word in candidates[prefix]:
+                    matching.update(postings[word])
+                found &= matching
+            else:
+                key_words = self.key_words
+                found = {key for key in found if any(word.startswith(prefix) for word in key_words[key])}
+        return found
+        
\ No newline at end of file
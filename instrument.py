@@ -0,0 +1,160 @@
+"""Opt-in timing of the editor's hot paths.
+
+Instrumentation wraps the event handlers, redraw, history and file I/O
+methods on one FlowchartMaker instance when enabled and removes the
+wrappers again when disabled, so a disabled editor runs exactly the
+unwrapped code. Timings go into log-bucketed latency histograms that can
+be summarised for the status bar overlay or dumped as JSON.
+"""
+import json
+import time
+from bisect import bisect_left
+from typing import Dict, List
+
+# Bucket upper edges in milliseconds, 25% apart from 10us up to a minute
+HISTOGRAM_BOUNDS_MS: List[float] = []
+_bound = 0.01
+while _bound < 60000:
+    HISTOGRAM_BOUNDS_MS.append(_bound)
+    _bound *= 1.25
+del _bound
+
+INSTRUMENTED_METHODS = ('on_canvas_press', 'on_canvas_drag', 'process_motion', 'on_canvas_release',
+                        'redraw_canvas', 'set_zoom', 'run_checks', 'save_state', 'save_to', 'start_load', 'poll_load',
+                        'import_diagram')
+# The ones that (re)draw a frame; only these set the overlay's frame time
+FRAME_METHODS = ('process_motion', 'redraw_canvas', 'set_zoom')
+
+class LatencyHistogram:
+    """Counts of durations per bucket; percentiles are accurate to one bucket (25%)."""
+    __slots__ = ('counts', 'count', 'total', 'max')
+    
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        
+    def record(self, seconds: float):
+        ms = seconds * 1000
+        self.counts[bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if ms > self.max:
+            self.max = ms
+            
+    def percentile(self, p: float) -> float:
+        """Upper edge (ms) of the bucket holding the p-th percentile, capped at the slowest sample."""
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= rank:
+                return min(HISTOGRAM_BOUNDS_MS[i] if i < len(HISTOGRAM_BOUNDS_MS) else self.max, self.max)
+        return self.max
+        
+    def summary(self) -> Dict:
+        return {
+            'count': self.count,
+            'mean_ms': self.total / self.count if self.count else 0.0,
+            'p50_ms': self.percentile(50),
+            'p95_ms': self.percentile(95),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max,
+            # Non-empty buckets only, as [upper edge in ms or null for the overflow bucket, count]
+            'buckets': [[HISTOGRAM_BOUNDS_MS[i] if i < len(HISTOGRAM_BOUNDS_MS) else None, count]
+                        for i, count in enumerate(self.counts) if count],
+        }
+
+class Instrumentation:
+    """Latency histograms and resource counts for one editor instance."""
+    def __init__(self, app):
+        self.app = app
+        self.enabled = False
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.started = time.time()
+        self.last_frame_ms = 0.0  # Duration of the last FRAME_METHODS call
+        self.drag_since = None  # When the oldest unhandled motion event arrived
+        
+    def histogram(self, name: str) -> LatencyHistogram:
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        return histogram
+        
+    def _wrap(self, name: str):
+        method = getattr(self.app, name)
+        histogram = self.histogram(name)
+        frame = name in FRAME_METHODS
+        
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                histogram.record(elapsed)
+                if frame:
+                    self.last_frame_ms = elapsed * 1000
+                if name == 'on_canvas_drag' and self.drag_since is None:
+                    self.drag_since = start
+                elif name == 'process_motion' and self.drag_since is not None:
+                    # Event arrival to handled, including the wait for the next frame
+                    self.histogram('drag_latency').record(time.perf_counter() - self.drag_since)
+                    self.drag_since = None
+                    
+        setattr(self.app, name, timed)
+        
+    def enable(self):
+        if self.enabled:
+            return
+        for name in INSTRUMENTED_METHODS:
+            self._wrap(name)
+        self.enabled = True
+        
+    def disable(self):
+        if not self.enabled:
+            return
+        for name in INSTRUMENTED_METHODS:
+            # Drop the per-instance wrapper so the class method shows through again
+            self.app.__dict__.pop(name, None)
+        self.enabled = False
+        self.drag_since = None
+        
+    def reset(self):
+        self.histograms.clear()
+        self.started = time.time()
+        
+    def canvas_items(self) -> int:
+        """Canvas items currently drawn for the document: outlines, labels and connector lines."""
+        app = self.app
+        return (len(app.realized_shapes) + sum(shape.text_id is not None for shape in app.realized_shapes)
+                + sum(len(arrow.canvas_ids) for arrow in app.realized_arrows))
+                
+    def snapshot(self) -> Dict:
+        app = self.app
+        return {
+            'seconds': time.time() - self.started,
+            'histograms': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+            'canvas_items': self.canvas_items(),
+            'shapes': app.document.shape_count(),
+            'arrows': app.document.arrow_count(),
+            'realized_shapes': len(app.realized_shapes),
+            'realized_arrows': len(app.realized_arrows),
+            'history_entries': len(app.history),
+            'history_bytes': app.history.bytes_used,
+            'history_budget': app.history.byte_budget,
+        }
+        
+    def dump(self, filename: str):
+        with open(filename, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+            
+    def overlay_text(self) -> str:
+        drag = self.histograms.get('drag_latency')
+        p95 = f"{drag.percentile(95):.1f} ms" if drag is not None and drag.count else "-"
+        return (f"frame {self.last_frame_ms:.1f} ms | {self.canvas_items()} items | "
+                f"drag p95 {p95} | history {self.app.history.bytes_used / 1048576:.1f} MB")
+                
\ No newline at end of file
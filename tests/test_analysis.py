@@ -0,0 +1,78 @@
+import random
+import unittest
+
+from flowchart.analysis import GraphChecker, cycles, dead_ends, decision_problems, unreachable
+from flowchart.model import FlowchartArrow, FlowchartDocument, FlowchartShape
+
+SHAPE_TYPES = ('oval', 'diamond', 'rectangle', 'rectangle')
+
+def issue_sets(issues):
+    return {issue: {frozenset(item) for item in found} if issue == 'cycle' else set(found)
+            for issue, found in issues.items()}
+
+class IncrementalCheckTest(unittest.TestCase):
+    """After any run of edits the checker must agree with the checks run from scratch."""
+    def from_scratch(self, document):
+        return issue_sets({'unreachable': unreachable(document), 'dead_end': dead_ends(document),
+                           'decision': decision_problems(document), 'cycle': cycles(document)})
+                           
+    def edit(self, rnd, document, removed):
+        shapes, arrows = document.shapes(), document.arrows()
+        choice = rnd.random()
+        if choice < 0.35 and shapes:
+            arrow = FlowchartArrow('straight', 0, 0, 0, 0)
+            document.add_arrow(arrow)
+            document.attach(arrow, 'source', rnd.choice(shapes))
+            document.attach(arrow, 'target', rnd.choice(shapes))
+        elif choice < 0.5 and arrows:
+            document.remove_arrow(rnd.choice(arrows))
+        elif choice < 0.6 and arrows:
+            document.attach(rnd.choice(arrows), rnd.choice(('source', 'target')),
+                            rnd.choice(shapes) if shapes and rnd.random() < 0.8 else None)
+        elif choice < 0.75:
+            document.add_shape(FlowchartShape(rnd.choice(SHAPE_TYPES), 0, 0))
+        elif choice < 0.9 and shapes:
+            # Arrows are left bound to the removed shape, as undo expects to find them
+            shape = rnd.choice(shapes)
+            document.remove_shape(shape)
+            removed.append(shape)
+        elif removed:
+            document.add_shape(removed.pop(rnd.randrange(len(removed))))
+            
+    def test_random_edits(self):
+        for seed in range(60):
+            rnd = random.Random(seed)
+            document = FlowchartDocument([FlowchartShape(rnd.choice(SHAPE_TYPES), 0, 0) for _ in range(30)])
+            checker = GraphChecker()
+            removed = []
+            for step in range(200):
+                self.edit(rnd, document, removed)
+                if rnd.random() < 0.5:
+                    self.assertEqual(issue_sets(checker.check(document)), self.from_scratch(document),
+                                     f"seed {seed}, step {step}")
+                                     
+    def test_loop_closed_and_opened(self):
+        shapes = [FlowchartShape('rectangle', 0, 0) for _ in range(4)]
+        document = FlowchartDocument(shapes)
+        arrows = []
+        for source, target in zip(shapes, shapes[1:]):
+            arrow = FlowchartArrow('straight', 0, 0, 0, 0)
+            document.add_arrow(arrow)
+            document.attach(arrow, 'source', source)
+            document.attach(arrow, 'target', target)
+            arrows.append(arrow)
+        checker = GraphChecker()
+        self.assertEqual(checker.check(document)['cycle'], [])
+        back = FlowchartArrow('straight', 0, 0, 0, 0)
+        document.add_arrow(back)
+        document.attach(back, 'source', shapes[3])
+        document.attach(back, 'target', shapes[1])
+        self.assertEqual([sorted(cycle) for cycle in checker.check(document)['cycle']],
+                         [sorted(shape.id for shape in shapes[1:])])
+        document.remove_arrow(arrows[1])
+        self.assertEqual(checker.check(document)['cycle'], [])
+
+if __name__ == '__main__':
+    unittest.main()
+    
+    
\ No newline at end of file
@@ -0,0 +1,92 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+from autosave import Autosave, _record, read_autosave, recover_document
+from flowchart.model import FlowchartArrow, FlowchartDocument, FlowchartShape
+
+class _Crash(Exception):
+    pass
+
+class CrashAfterSnapshot(Autosave):
+    """Dies between renaming its first snapshot into place and emptying the journal."""
+    def _write_snapshot(self, shadow, seq):
+        super()._write_snapshot(shadow, seq)
+        raise _Crash()
+        
+    def _run(self):
+        try:
+            super()._run()
+        except _Crash:
+            pass
+
+class AutosaveRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        
+    def wait_for_snapshot(self, autosave):
+        # Edits queued along with the opening reset would go into the snapshot, not the journal
+        deadline = time.monotonic() + 10
+        while not autosave.compactions and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(autosave.compactions)
+        
+    def positions(self, document):
+        return {shape.id: (shape.x, shape.y) for shape in document.shapes()}
+        
+    def test_reset_records_match_live_objects(self):
+        start = FlowchartShape('rectangle', 100, 100, text='Start')
+        end = FlowchartShape('oval', 100, 300, text='End')
+        document = FlowchartDocument([start, end])
+        arrow = FlowchartArrow('straight', 0, 0, 0, 0)
+        document.add_arrow(arrow)
+        document.attach(arrow, 'source', start, 'bottom')
+        document.attach(arrow, 'target', end, 'top')
+        autosave = Autosave(self.directory)
+        autosave.start(document)
+        # The copy is taken at the reset; later edits to the objects are not in it
+        start.text = 'Changed'
+        autosave.close()
+        start.text = 'Start'
+        data = read_autosave(self.directory)
+        self.assertEqual(data['shapes'], [_record(start), _record(end)])
+        self.assertEqual(data['arrows'], [_record(arrow)])
+        
+    def test_recovers_journaled_edits(self):
+        shape = FlowchartShape('rectangle', 100, 100, text='Start')
+        autosave = Autosave(self.directory)
+        autosave.start(FlowchartDocument([shape]))
+        self.wait_for_snapshot(autosave)
+        shape.x, shape.y = 300, 200
+        autosave.move_shapes([shape])
+        autosave.close()
+        self.assertEqual(self.positions(recover_document(self.directory)), {shape.id: (300, 200)})
+        
+    def test_crash_before_journal_truncation_skips_old_session(self):
+        first = FlowchartShape('rectangle', 100, 100, text='Old')
+        other = FlowchartShape('rectangle', 400, 100, text='Other')
+        autosave = Autosave(self.directory)
+        autosave.start(FlowchartDocument([first, other]))
+        self.wait_for_snapshot(autosave)
+        first.x, first.y = 500, 500
+        autosave.move_shapes([first])
+        autosave.close()
+        
+        # The new session's numbering starts again, below the old journal's entries
+        replacement = FlowchartShape('diamond', 50, 60, text='New')
+        crashing = CrashAfterSnapshot(self.directory)
+        crashing.start(FlowchartDocument([replacement]))
+        crashing.close()
+        
+        recovered = recover_document(self.directory)
+        self.assertEqual(self.positions(recovered), {replacement.id: (50, 60)})
+        self.assertEqual([shape.text for shape in recovered.shapes()], ['New'])
+
+if __name__ == '__main__':
+    unittest.main()
+    
+    
\ No newline at end of file
@@ -0,0 +1,73 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from flowchart import fileformat
+from flowchart.fileformat import iter_flowchart_json, read_document
+from flowchart.model import FlowchartDocument
+
+def shape_data(shape_id, text):
+    return {'id': shape_id, 'shape_type': 'rectangle', 'x': 0, 'y': 0, 'width': 100, 'height': 50, 'text': text}
+
+def arrow_data(arrow_id, source, target):
+    return {'id': arrow_id, 'arrow_type': 'straight', 'start_x': 0, 'start_y': 0, 'end_x': 0, 'end_y': 0,
+            'source': source, 'target': target}
+
+class DuplicateIdTest(unittest.TestCase):
+    """A second object with a taken id must not quietly get another one while arrows keep pointing at the first."""
+    data = {'shapes': [shape_data(1, 'first'), shape_data(2, 'second'), shape_data(1, 'again')],
+            'arrows': [arrow_data(3, 1, 2), arrow_data(2, 2, 1)]}
+            
+    def test_document_rejects_taken_id(self):
+        with self.assertRaises(ValueError):
+            FlowchartDocument.from_dict(self.data)
+            
+    def test_read_document_skips_duplicates(self):
+        with tempfile.TemporaryDirectory() as folder:
+            filename = os.path.join(folder, 'duplicates.json')
+            with open(filename, 'w') as f:
+                json.dump(self.data, f)
+            document, skipped = read_document(filename)
+        self.assertEqual(skipped, 2)
+        self.assertEqual([shape.text for shape in document.shapes()], ['first', 'second'])
+        (arrow,) = document.arrows()
+        self.assertEqual((arrow.id, arrow.source_id, arrow.target_id), (3, 1, 2))
+        self.assertEqual(document.shape(arrow.source_id).text, 'first')
+
+class CorruptJsonTest(unittest.TestCase):
+    """A broken entry must stop the stream near where it is, not after reading the rest of the file."""
+    def read_until_error(self, text, chunk_size=64):
+        read = []
+        with self.assertRaises(ValueError) as caught:
+            for _ in iter_flowchart_json(io.StringIO(text), chunk_size, on_read=read.append):
+                pass
+        return sum(read), str(caught.exception)
+        
+    def test_malformed_entry_fails_early(self):
+        head = '{"shapes": [' + ', '.join(json.dumps(shape_data(i, 'café')) for i in range(5)) + ', '
+        text = head + '{"id": 9 "x": 1}, ' + ', '.join(json.dumps(shape_data(i, '')) for i in range(10, 1000)) + ']}'
+        read, message = self.read_until_error(text)
+        self.assertLess(read, len(head) + 256)
+        offset = len(head.encode('utf-8')) + len('{"id": 9 ')
+        self.assertIn(f"at byte {offset}", message)
+        
+    def test_unfinished_string_is_bounded(self):
+        text = '{"shapes": [{"text": "' + 'x' * 100000
+        with mock.patch.object(fileformat, 'JSON_MAX_ENTRY', 1000):
+            read, message = self.read_until_error(text)
+        self.assertLess(read, 2000)
+        self.assertIn("at byte 12", message)
+        
+    def test_values_split_across_chunks(self):
+        data = {'shapes': [shape_data(1, 'a "quoted" \\ label')], 'version': -12.5e-3, 'arrows': []}
+        text = json.dumps(data)
+        for chunk_size in range(1, len(text) + 1):
+            entries = list(iter_flowchart_json(io.StringIO(text), chunk_size))
+            self.assertEqual(entries, [('shapes', data['shapes'][0])])
+
+if __name__ == '__main__':
+    unittest.main()
+    
\ No newline at end of file
@@ -0,0 +1,52 @@
+import unittest
+
+from fl import EditTextCommand, History, ReplaceDocumentCommand
+from flowchart.model import FlowchartDocument, FlowchartShape
+
+class StubApp:
+    def replace_document(self, document):
+        self.document = document
+        
+    def set_shape_text(self, shape, text):
+        shape.text = text
+
+class ReplaceDocumentSizeTest(unittest.TestCase):
+    """The history's byte count must follow a replaced document that keeps being edited."""
+    def setUp(self):
+        self.history = History(byte_budget=20000)
+        self.old, self.live = FlowchartDocument(), FlowchartDocument()
+        self.replace = ReplaceDocumentCommand(self.old, self.live)
+        self.history.record(self.replace)
+        
+    def edit(self, shapes):
+        for i in range(shapes):
+            self.live.add_shape(FlowchartShape('rectangle', i * 10, 0, text='label'))
+        shape = self.live.shapes()[-1]
+        command = EditTextCommand(shape, shape.text, 'new label')
+        self.history.record(command)
+        return command
+        
+    def test_size_follows_the_live_document(self):
+        empty = self.replace.size()
+        command = self.edit(50)
+        self.assertGreater(self.replace.size(), empty)
+        self.assertEqual(self.history.bytes_used, self.replace.size() + command.size())
+        
+    def test_grown_replacement_is_evicted(self):
+        command = self.edit(200)
+        self.assertEqual(list(self.history.undo_stack), [command])
+        self.assertEqual(self.history.bytes_used, command.size())
+        
+    def test_dropped_commands_give_back_what_they_were_charged(self):
+        app = StubApp()
+        self.edit(10)
+        self.history.undo(app)
+        self.history.undo(app)
+        self.live.add_shape(FlowchartShape('rectangle', 0, 100, text='added since'))
+        command = EditTextCommand(FlowchartShape('rectangle', 0, 0), '', 'other')
+        self.history.record(command)
+        self.assertEqual(self.history.bytes_used, command.size())
+
+if __name__ == '__main__':
+    unittest.main()
+    
\ No newline at end of file
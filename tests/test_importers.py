@@ -0,0 +1,30 @@
+import io
+import unittest
+
+from flowchart.geometry import arrow_style
+from flowchart.importers import mermaid_arrow_type, read_mermaid
+
+class MermaidLinkTest(unittest.TestCase):
+    def arrow_types(self, text):
+        document, skipped = read_mermaid(io.StringIO(text))
+        self.assertEqual(skipped, 0)
+        return [arrow.arrow_type for arrow in document.arrows()]
+        
+    def test_open_link_has_no_arrowhead(self):
+        self.assertEqual(self.arrow_types("flowchart LR\n    A --- B\n"), ['line'])
+        self.assertEqual(arrow_style('line')['arrow'], 'none')
+        
+    def test_open_link_with_text(self):
+        self.assertEqual(self.arrow_types("flowchart LR\n    A -- label --- B\n"), ['line'])
+        
+    def test_link_types(self):
+        self.assertEqual(mermaid_arrow_type(None, '--', '>'), 'straight')
+        self.assertEqual(mermaid_arrow_type(None, '---', None), 'line')
+        self.assertEqual(mermaid_arrow_type('<', '--', '>'), 'bidirectional')
+        self.assertEqual(mermaid_arrow_type(None, '==', '>'), 'thick')
+        self.assertEqual(mermaid_arrow_type(None, '-.-', '>'), 'dotted')
+        self.assertIsNone(mermaid_arrow_type(None, '~~~', None))
+
+if __name__ == '__main__':
+    unittest.main()
+    
\ No newline at end of file
@@ -0,0 +1,48 @@
+"""Editing shortcuts must leave keys typed into the Find box to the box.
+
+Needs a display (e.g. xvfb-run python -m unittest discover tests).
+"""
+import tkinter as tk
+import unittest
+
+from fl import FlowchartMaker
+from flowchart.model import FlowchartShape
+
+class FindEntryShortcutTest(unittest.TestCase):
+    def setUp(self):
+        try:
+            self.root = tk.Tk()
+        except tk.TclError:
+            self.skipTest("no display")
+        self.root.withdraw()
+        self.app = FlowchartMaker(self.root)
+        self.shape = FlowchartShape('rectangle', 100, 100, text='Start')
+        self.app.add_shape(self.shape)
+        self.app.set_selection([self.shape])
+        self.app.find_var.set('Start')
+        self.app.find_entry.focus_force()
+        self.root.update()
+        
+    def tearDown(self):
+        if hasattr(self, 'app'):
+            self.root.destroy()
+            
+    def test_delete_in_find_entry_keeps_selection(self):
+        self.app.find_entry.icursor(0)
+        self.app.find_entry.event_generate('<Delete>')
+        self.root.update()
+        self.assertEqual(self.app.find_var.get(), 'tart')
+        self.assertIn(self.shape, self.app.document.shapes())
+        self.assertEqual(self.app.selection, {self.shape})
+        
+    def test_copy_and_paste_in_find_entry_leave_diagram_alone(self):
+        self.app.clipboard = None
+        self.app.find_entry.event_generate('<Control-c>')
+        self.app.find_entry.event_generate('<Control-v>')
+        self.root.update()
+        self.assertIsNone(self.app.clipboard)
+        self.assertEqual(len(self.app.document.shapes()), 1)
+
+if __name__ == '__main__':
+    unittest.main()
+    
\ No newline at end of file